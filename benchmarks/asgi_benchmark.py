@@ -0,0 +1,182 @@
+""" Compare the sync API under WSGI with the async views under ASGI
+
+usage: python benchmarks/asgi_benchmark.py [--clients 500] [--duration 20] [--workers 1]
+
+Seeds a scratch SQLite database, then runs the same closed-loop load against
+three deployments of the project on a local port:
+
+  wsgi        gunicorn, gthread worker, the sync DRF viewsets
+  asgi-sync   uvicorn, the sync DRF viewsets run through sync_to_async
+  asgi-async  uvicorn with RECIPE_ASYNC_VIEWS=1, the async list/retrieve/create views
+
+Every client holds a keep-alive connection, picks a random user and requests
+the recipe, tag and ingredient lists and a recipe detail in a loop, with one
+create in ten requests. Needs gunicorn and uvicorn installed; a missing server
+is skipped.
+"""
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import utils  # noqa: E402
+
+
+def seed(users, recipes_per_user):
+  """ Create users with tokens, tags, ingredients and recipes and return [(token, recipe ids)] """
+  from django.db import transaction
+  from rest_framework.authtoken.models import Token
+  
+  from core.models import Ingredient, Recipe, Tag, User
+  
+  accounts = []
+  with transaction.atomic():
+    for u in range(users):
+      user = User.objects.create_user(email=f'user{u}@example.com', password='benchmark')
+      token = Token.objects.create(user=user)
+      tags = Tag.objects.bulk_create([Tag(user=user, name=f'tag {i}') for i in range(10)])
+      ingredients = Ingredient.objects.bulk_create([Ingredient(user=user, name=f'ingredient {i}') for i in range(20)])
+      recipes = []
+      for i in range(recipes_per_user):
+        recipe = Recipe.objects.create(user=user, title=f'recipe {i}', time_minutes=10 + i, price='4.50')
+        recipe.tags.set(tags[i % 10:i % 10 + 2])
+        recipe.ingredients.set(ingredients[i % 20:i % 20 + 4])
+        recipes.append(recipe.id)
+      accounts.append((token.key, recipes))
+  
+  return accounts
+
+
+def api_paths():
+  """ return the endpoint paths, reversed so they follow the project urls """
+  from django.urls import reverse
+  
+  return {
+    'recipes': reverse('recipe:recipe-list'),
+    'recipe': reverse('recipe:recipe-detail', args=['__pk__']).replace('__pk__', '{}'),
+    'tags': reverse('recipe:tag-list'),
+    'ingredients': reverse('recipe:ingredient-list'),
+  }
+
+
+async def client(port, paths, accounts, deadline, rng, samples, errors):
+  """ Drive requests over one keep-alive connection until the deadline """
+  connection = utils.HttpConnection(port)
+  while time.monotonic() < deadline:
+    key, recipe_ids = rng.choice(accounts)
+    headers = {'Authorization': f'Token {key}', 'Accept': 'application/json'}
+    roll = rng.random()
+    if roll < 0.1:
+      method, path, body = 'POST', paths['tags'], json.dumps({'name': f'tag {rng.random()}'}).encode()
+      headers['Content-Type'] = 'application/json'
+    elif roll < 0.4:
+      method, path, body = 'GET', paths['recipes'], b''
+    elif roll < 0.6:
+      method, path, body = 'GET', paths['recipe'].format(rng.choice(recipe_ids)), b''
+    elif roll < 0.8:
+      method, path, body = 'GET', paths['tags'], b''
+    else:
+      method, path, body = 'GET', paths['ingredients'], b''
+    
+    start = time.perf_counter()
+    try:
+      status, _, _ = await connection.request(method, path, headers, body)
+    except (ConnectionError, OSError, asyncio.IncompleteReadError):
+      errors.append('connection')
+      await connection.close()
+      continue
+    samples.append(time.perf_counter() - start)
+    if status >= 400:
+      errors.append(status)
+  
+  await connection.close()
+
+
+async def run_load(port, paths, accounts, clients, duration):
+  samples, errors = [], []
+  deadline = time.monotonic() + duration
+  rng = random.Random(7)
+  await asyncio.gather(*[
+    client(port, paths, accounts, deadline, random.Random(rng.random()), samples, errors)
+    for _ in range(clients)
+  ])
+  return samples, errors
+
+
+def server_command(name, port, workers):
+  if name == 'wsgi':
+    return [
+      'gunicorn', 'recipe_app.wsgi', '-b', f'127.0.0.1:{port}', '-w', str(workers),
+      '-k', 'gthread', '--threads', '32', '--backlog', '2048',
+    ]
+  
+  return [
+    'uvicorn', 'recipe_app.asgi:application', '--port', str(port),
+    '--workers', str(workers), '--backlog', '2048', '--no-access-log',
+  ]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--clients', type=int, default=500)
+  parser.add_argument('--duration', type=float, default=20)
+  parser.add_argument('--workers', type=int, default=1)
+  parser.add_argument('--users', type=int, default=50)
+  parser.add_argument('--recipes', type=int, default=200, help='recipes per user')
+  parser.add_argument('--output', default=None, help='write JSON results to this file')
+  args = parser.parse_args()
+  
+  database = utils.scratch_database('asgi')
+  database.unlink(missing_ok=True)
+  utils.setup_django(database)
+  utils.migrate()
+  
+  print(f'seeding {args.users} users with {args.recipes} recipes each ...')
+  accounts = seed(args.users, args.recipes)
+  paths = api_paths()
+  
+  deployments = (
+    ('wsgi', 'gunicorn', {}),
+    ('asgi-sync', 'uvicorn', {}),
+    ('asgi-async', 'uvicorn', {'RECIPE_ASYNC_VIEWS': '1'}),
+  )
+  results = {'clients': args.clients, 'duration_s': args.duration, 'workers': args.workers, 'servers': {}}
+  for name, executable, env in deployments:
+    if shutil.which(executable) is None:
+      print(f'{name:11} skipped, {executable} is not installed')
+      continue
+    
+    port = utils.free_port()
+    process = utils.start_server(
+      server_command(name, port, args.workers), port, env={'SQLITE_PATH': str(database), **env},
+    )
+    try:
+      samples, errors = asyncio.run(run_load(port, paths, accounts, args.clients, args.duration))
+    finally:
+      utils.stop_server(process)
+    
+    row = results['servers'][name] = {
+      'requests': len(samples),
+      'errors': len(errors),
+      'rps': round(len(samples) / args.duration, 1),
+      'p50_ms': round(utils.percentile(samples, 50) * 1000, 2) if samples else None,
+      'p95_ms': round(utils.percentile(samples, 95) * 1000, 2) if samples else None,
+      'p99_ms': round(utils.percentile(samples, 99) * 1000, 2) if samples else None,
+    }
+    print(
+      f'{name:11} {row["rps"]:8.1f} req/s  p50 {row["p50_ms"]} ms  p95 {row["p95_ms"]} ms  '
+      f'p99 {row["p99_ms"]} ms  errors {row["errors"]}'
+    )
+  
+  if args.output:
+    utils.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,58 @@
+""" Compare CPU time against bytes saved for each response compression
+
+usage: python benchmarks/compression_benchmark.py [--repeat 10]
+
+Compresses recipe list pages of 10, 100, 1000 and 10000 recipes, rendered
+with the API's JSON renderer, with every available encoding at a few levels.
+No database is needed; brotli and zstd are skipped when not installed.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import utils  # noqa: E402
+from benchmarks.renderer_benchmark import recipe_page  # noqa: E402
+
+
+LEVELS = {'gzip': (1, 6, 9), 'br': (1, 4, 8), 'zstd': (1, 3, 9)}
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--repeat', type=int, default=10)
+  parser.add_argument('--output', default=None, help='write JSON results to this file')
+  args = parser.parse_args()
+  
+  utils.setup_django()
+  
+  from core import compression
+  from core.renderers import ORJSONRenderer
+  
+  results = {}
+  for size in (10, 100, 1000, 10000):
+    body = ORJSONRenderer().render(recipe_page(size))
+    payload_name = f'recipes x{size}'
+    row = results[payload_name] = {'bytes': len(body)}
+    print(f'{payload_name} ({len(body)} B)')
+    for encoding in compression.COMPRESSORS:
+      for level in LEVELS[encoding]:
+        compressed = compression.compress(encoding, body, level)
+        
+        def run():
+          compression.compress(encoding, body, level)
+        
+        timing = utils.summarize(utils.time_calls(run, args.repeat))
+        row[f'{encoding}-{level}'] = {'bytes': len(compressed), 'compress': timing}
+        print(
+          f'  {encoding:>4} {level}: {len(compressed):>8} B '
+          f'({len(compressed) / len(body):.1%}) {timing["median_ms"]:.3f} ms'
+        )
+  
+  if args.output:
+    utils.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,91 @@
+""" Compare rendering list pages from values() rows with the ModelSerializer path
+
+usage: python benchmarks/list_benchmark.py [--rows 10000]
+
+Seeds a scratch SQLite database with one user owning --rows recipes and tags,
+then times building and rendering all of them as the list responses do: once
+through the list serializers over prefetched model instances, as before, and
+once through ValuesListMixin. The two outputs are checked to be identical.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import utils  # noqa: E402
+
+
+def list_view(viewset_class, user):
+  """ return a viewset set up as for a list request of user """
+  from rest_framework.request import Request
+  from rest_framework.test import APIRequestFactory
+  
+  request = Request(APIRequestFactory().get('/'))
+  request.user = user
+  return viewset_class(request=request, action='list', format_kwarg=None, args=(), kwargs={})
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--rows', type=int, default=10_000)
+  parser.add_argument('--repeat', type=int, default=5)
+  parser.add_argument('--output', default=None, help='write JSON results to this file')
+  args = parser.parse_args()
+  
+  database = utils.scratch_database('list')
+  database.unlink(missing_ok=True)
+  utils.setup_django(database)
+  utils.migrate()
+  
+  from rest_framework.renderers import JSONRenderer
+  
+  from benchmarks.search_benchmark import seed
+  from core.models import Tag, User
+  from recipe import serializers, views
+  
+  print(f'seeding {args.rows} recipes and tags ...')
+  seed(args.rows, 1)
+  user = User.objects.get(pk=1)
+  Tag.objects.bulk_create([Tag(user=user, name=f'tag {i:06}') for i in range(args.rows)])
+  renderer = JSONRenderer()
+  
+  results = {'rows': args.rows, 'lists': {}}
+  for name, viewset_class, serializer_class in (
+    ('recipes', views.RecipeViewSet, serializers.RecipeSerializer),
+    ('tags', views.TagViewSet, serializers.TagSerializer),
+  ):
+    view = list_view(viewset_class, user)
+    queryset = view.get_queryset().order_by('id')
+    if viewset_class is views.RecipeViewSet:
+      instances = queryset.with_relations()
+    else:
+      instances = queryset
+    
+    def serializer_path():
+      return renderer.render(serializer_class(list(instances.all()), many=True).data)
+    
+    def values_path():
+      rows = list(view.get_list_rows(queryset))
+      return renderer.render(view.rows_to_representation(rows, view.get_relation_ids(rows)))
+    
+    if serializer_path() != values_path():
+      raise SystemExit(f'{name}: the values() output differs from the serializer output')
+    
+    row = results['lists'][name] = {
+      'serializer': utils.summarize(utils.time_calls(serializer_path, args.repeat)),
+      'values': utils.summarize(utils.time_calls(values_path, args.repeat)),
+    }
+    speedup = row['serializer']['median_ms'] / row['values']['median_ms']
+    row['speedup'] = round(speedup, 2)
+    print(
+      f'{name:8} serializer {row["serializer"]["median_ms"]:9.1f} ms  '
+      f'values {row["values"]["median_ms"]:9.1f} ms  x{speedup:.1f}'
+    )
+  
+  if args.output:
+    utils.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+  main()
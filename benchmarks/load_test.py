@@ -0,0 +1,376 @@
+""" Load-test every API endpoint and compare the latencies with a baseline run
+
+usage: python benchmarks/load_test.py [--clients 50] [--duration 10] [--server wsgi]
+                                      [--output results.json] [--baseline old.json]
+
+Seeds a scratch SQLite database with --users users, each owning --tags tags,
+--ingredients ingredients and --recipes recipes, starts the project on a local
+port and runs one closed-loop scenario per endpoint of recipe/urls.py and
+user/urls.py, then a mixed scenario. Every client holds a keep-alive
+connection and acts as a random seeded user. For each scenario the number of
+requests, errors, requests per second and the p50/p95/p99 latencies are
+printed and written to --output.
+
+That includes the export, import and image upload of the recipes and the
+token cache stats: every upload is a distinct 1x1 PNG, so each one is stored
+and thumbnailed rather than deduplicated, and the seeded users are staff so
+they may read the token cache stats (nothing else the scenarios call checks
+it).
+
+With --baseline the run is compared scenario by scenario with an earlier
+results file; --tolerance makes the script exit with status 1 when a p95 got
+slower or the throughput dropped by more than that many percent.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import time
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import utils  # noqa: E402
+from benchmarks.asgi_benchmark import server_command  # noqa: E402
+
+
+PASSWORD = 'benchmark'
+
+SERVERS = {
+  'wsgi': ('gunicorn', {}),
+  'asgi': ('uvicorn', {}),
+  'asgi-async': ('uvicorn', {'RECIPE_ASYNC_VIEWS': '1'}),
+}
+
+
+def seed(users, tags, ingredients, recipes):
+  """ Seed the users and their data and return one account dict per user """
+  from rest_framework.authtoken.models import Token
+  
+  from core import seeding
+  from core.models import Ingredient, Recipe, Tag, User
+  
+  seeding.seed(users, tags=tags, ingredients=ingredients, recipes=recipes, password=PASSWORD, random_seed=7)
+  # the token cache stats are for staff only
+  User.objects.update(is_staff=True)
+  Token.objects.bulk_create([
+    Token(user_id=user_id, key=Token.generate_key()) for user_id in User.objects.values_list('id', flat=True)
+  ])
+  
+  accounts = {
+    user_id: {'email': email, 'token': key, 'recipes': [], 'tags': [], 'ingredients': []}
+    for user_id, email, key in User.objects.values_list('id', 'email', 'auth_token__key')
+  }
+  for model, name in ((Recipe, 'recipes'), (Tag, 'tags'), (Ingredient, 'ingredients')):
+    for user_id, object_id in model.objects.order_by('id').values_list('user_id', 'id'):
+      accounts[user_id][name].append(object_id)
+  
+  return list(accounts.values())
+
+
+def api_paths():
+  """ return the endpoint paths, reversed so they follow the project urls """
+  from django.urls import reverse
+  
+  return {
+    'recipes': reverse('recipe:recipe-list'),
+    'recipe': reverse('recipe:recipe-detail', args=['__pk__']).replace('__pk__', '{}'),
+    'recipe-export': reverse('recipe:recipe-export'),
+    'recipe-stats': reverse('recipe:recipe-stats'),
+    'recipe-import': reverse('recipe:recipe-import'),
+    'recipe-upload-image': reverse('recipe:recipe-upload-image', args=['__pk__']).replace('__pk__', '{}'),
+    'tags': reverse('recipe:tag-list'),
+    'ingredients': reverse('recipe:ingredient-list'),
+    'user-create': reverse('user:create'),
+    'token': reverse('user:token'),
+    'me': reverse('user:me'),
+    'token-cache': reverse('user:token-cache'),
+  }
+
+
+def json_body(data):
+  return json.dumps(data).encode()
+
+
+def png_chunk(kind, data):
+  return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def png_image(text):
+  """ return a 1x1 PNG whose bytes differ by the text chunk """
+  return b''.join((
+    b'\x89PNG\r\n\x1a\n',
+    png_chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0)),
+    png_chunk(b'tEXt', b'Comment\x00' + text.encode()),
+    png_chunk(b'IDAT', zlib.compress(b'\x00\xff\x80\x00')),
+    png_chunk(b'IEND', b''),
+  ))
+
+
+def multipart_body(field, filename, content, content_type):
+  """ return the multipart body of one file field and its content type """
+  boundary = 'load-test-boundary'
+  body = b''.join((
+    f'--{boundary}\r\n'.encode(),
+    f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'.encode(),
+    f'Content-Type: {content_type}\r\n\r\n'.encode(),
+    content,
+    f'\r\n--{boundary}--\r\n'.encode(),
+  ))
+  return body, f'multipart/form-data; boundary={boundary}'
+
+
+def recipe_body(account, rng, counter):
+  return {
+    'title': f'load test recipe {next(counter)}',
+    'time_minutes': rng.randint(5, 120),
+    'price': f'{rng.randint(1, 40)}.00',
+    'tags': rng.sample(account['tags'], min(2, len(account['tags']))),
+    'ingredients': rng.sample(account['ingredients'], min(4, len(account['ingredients']))),
+  }
+
+
+def scenarios(paths):
+  """ return {name: build(account, rng, counter) -> (method, path, body, content type)} """
+  def recipe_path(account, rng):
+    return paths['recipe'].format(rng.choice(account['recipes']))
+  
+  def upload_image(account, rng, counter):
+    body, content_type = multipart_body('image', 'load.png', png_image(f'load test {next(counter)}'), 'image/png')
+    return 'POST', paths['recipe-upload-image'].format(rng.choice(account['recipes'])), body, content_type
+  
+  return {
+    'recipe list': lambda account, rng, counter: ('GET', paths['recipes'], None, None),
+    'recipe filter': lambda account, rng, counter: (
+      'GET', f'{paths["recipes"]}?tags={rng.choice(account["tags"])}', None, None,
+    ),
+    'recipe retrieve': lambda account, rng, counter: ('GET', recipe_path(account, rng), None, None),
+    'recipe create': lambda account, rng, counter: (
+      'POST', paths['recipes'], json_body(recipe_body(account, rng, counter)), 'application/json',
+    ),
+    'recipe update': lambda account, rng, counter: (
+      'PUT', recipe_path(account, rng), json_body(recipe_body(account, rng, counter)), 'application/json',
+    ),
+    'recipe partial update': lambda account, rng, counter: (
+      'PATCH', recipe_path(account, rng), json_body({'time_minutes': rng.randint(5, 120)}), 'application/json',
+    ),
+    'recipe export': lambda account, rng, counter: ('GET', paths['recipe-export'], None, None),
+    'recipe stats': lambda account, rng, counter: ('GET', paths['recipe-stats'], None, None),
+    'recipe import': lambda account, rng, counter: (
+      'POST', paths['recipe-import'],
+      json_body({'title': f'imported {next(counter)}', 'time_minutes': 10, 'price': '2.00', 'tags': ['tag 0']}),
+      'application/x-ndjson',
+    ),
+    'recipe upload image': upload_image,
+    'tag list': lambda account, rng, counter: ('GET', paths['tags'], None, None),
+    'tag create': lambda account, rng, counter: (
+      'POST', paths['tags'], json_body({'name': f'load test tag {next(counter)}'}), 'application/json',
+    ),
+    'ingredient list': lambda account, rng, counter: ('GET', paths['ingredients'], None, None),
+    'ingredient create': lambda account, rng, counter: (
+      'POST', paths['ingredients'], json_body({'name': f'load test ingredient {next(counter)}'}), 'application/json',
+    ),
+    'user create': lambda account, rng, counter: (
+      'POST', paths['user-create'],
+      json_body({'email': f'load{next(counter)}-{rng.random()}@example.com', 'password': PASSWORD, 'name': 'load'}),
+      'application/json',
+    ),
+    'token': lambda account, rng, counter: (
+      'POST', paths['token'], json_body({'email': account['email'], 'password': PASSWORD}), 'application/json',
+    ),
+    'token cache stats': lambda account, rng, counter: ('GET', paths['token-cache'], None, None),
+    'me retrieve': lambda account, rng, counter: ('GET', paths['me'], None, None),
+    'me partial update': lambda account, rng, counter: (
+      'PATCH', paths['me'], json_body({'name': f'user {next(counter)}'}), 'application/json',
+    ),
+  }
+
+
+# the mixed scenario: mostly reads, as the clients use the API
+MIX = (
+  ('recipe list', 30), ('recipe retrieve', 20), ('tag list', 10), ('ingredient list', 10),
+  ('recipe filter', 10), ('recipe create', 5), ('recipe partial update', 5), ('tag create', 3),
+  ('ingredient create', 3), ('me retrieve', 3), ('token', 1),
+)
+
+
+async def client(port, builders, accounts, deadline, rng, counter, samples, errors):
+  """ Drive requests over one keep-alive connection until the deadline """
+  connection = utils.HttpConnection(port)
+  while time.monotonic() < deadline:
+    account = rng.choice(accounts)
+    method, path, body, content_type = rng.choice(builders)(account, rng, counter)
+    headers = {'Authorization': f'Token {account["token"]}', 'Accept': 'application/json'}
+    if content_type:
+      headers['Content-Type'] = content_type
+    
+    start = time.perf_counter()
+    try:
+      status, _, _ = await connection.request(method, path, headers, body or b'')
+    except (ConnectionError, OSError, asyncio.IncompleteReadError):
+      errors.append('connection')
+      await connection.close()
+      continue
+    samples.append(time.perf_counter() - start)
+    if status >= 400:
+      errors.append(status)
+  
+  await connection.close()
+
+
+async def run_scenario(port, builders, accounts, clients, duration, seed_value):
+  """ return the latency samples and errors of one closed-loop run """
+  samples, errors = [], []
+  rng = random.Random(seed_value)
+  counter = itertools.count()
+  deadline = time.monotonic() + duration
+  started = time.monotonic()
+  await asyncio.gather(*[
+    client(port, builders, accounts, deadline, random.Random(rng.random()), counter, samples, errors)
+    for _ in range(clients)
+  ])
+  return samples, errors, time.monotonic() - started
+
+
+def summarize(samples, errors, elapsed):
+  """ return the counters and latency percentiles of a scenario """
+  def pct(value):
+    return round(utils.percentile(samples, value) * 1000, 2) if samples else None
+  
+  return {
+    'requests': len(samples),
+    'errors': len(errors),
+    'error_statuses': sorted({str(error) for error in errors}),
+    'rps': round(len(samples) / elapsed, 1),
+    'p50_ms': pct(50),
+    'p95_ms': pct(95),
+    'p99_ms': pct(99),
+  }
+
+
+def compare(results, baseline, tolerance):
+  """ Print the change against a baseline run and return the regressed scenarios """
+  regressions = []
+  print(f'\ncompared with {baseline.get("meta", {}).get("commit", "the baseline")}:')
+  changed = [
+    key for key, value in results['meta'].items()
+    if key != 'commit' and baseline.get('meta', {}).get(key) != value
+  ]
+  if changed:
+    print(f'  warning: the runs differ in {", ".join(changed)}')
+  
+  for name, row in results['scenarios'].items():
+    old = baseline.get('scenarios', {}).get(name)
+    if not old or not old.get('rps') or not old.get('p95_ms') or not row['p95_ms']:
+      print(f'  {name:22} no baseline')
+      continue
+    
+    rps_change = (row['rps'] - old['rps']) / old['rps'] * 100
+    p95_change = (row['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+    regressed = tolerance is not None and (rps_change < -tolerance or p95_change > tolerance)
+    if regressed:
+      regressions.append(name)
+    print(
+      f'  {name:22} rps {old["rps"]:8.1f} -> {row["rps"]:8.1f} ({rps_change:+6.1f}%)  '
+      f'p95 {old["p95_ms"]:8.2f} -> {row["p95_ms"]:8.2f} ms ({p95_change:+6.1f}%)'
+      + ('  REGRESSION' if regressed else '')
+    )
+  
+  return regressions
+
+
+def git_commit():
+  try:
+    return subprocess.run(
+      ['git', 'rev-parse', '--short', 'HEAD'], cwd=utils.REPO_ROOT, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--users', type=int, default=20)
+  parser.add_argument('--tags', type=int, default=20, help='tags per user')
+  parser.add_argument('--ingredients', type=int, default=50, help='ingredients per user')
+  parser.add_argument('--recipes', type=int, default=500, help='recipes per user')
+  parser.add_argument('--clients', type=int, default=50)
+  parser.add_argument('--duration', type=float, default=10, help='seconds per scenario')
+  parser.add_argument('--server', choices=SERVERS, default='wsgi')
+  parser.add_argument('--workers', type=int, default=1)
+  parser.add_argument('--scenario', action='append', help='run only these scenarios (and "mixed")')
+  parser.add_argument('--seed', type=int, default=7, help='random seed of the clients')
+  parser.add_argument('--output', default=None, help='write JSON results to this file')
+  parser.add_argument('--baseline', default=None, help='JSON results of an earlier run to compare with')
+  parser.add_argument('--tolerance', type=float, default=None, help='regression threshold in percent')
+  args = parser.parse_args()
+  
+  executable, env = SERVERS[args.server]
+  if shutil.which(executable) is None:
+    parser.error(f'{executable} is not installed')
+  
+  database = utils.scratch_database('load')
+  database.unlink(missing_ok=True)
+  utils.setup_django(database)
+  utils.migrate()
+  
+  print(f'seeding {args.users} users with {args.tags} tags, {args.ingredients} ingredients and {args.recipes} recipes each ...')
+  accounts = seed(args.users, args.tags, args.ingredients, args.recipes)
+  builders = scenarios(api_paths())
+  runs = {name: [build] for name, build in builders.items()}
+  runs['mixed'] = [builders[name] for name, weight in MIX for _ in range(weight)]
+  if args.scenario:
+    unknown = set(args.scenario) - set(runs)
+    if unknown:
+      parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+    runs = {name: run for name, run in runs.items() if name in args.scenario}
+  
+  results = {
+    'meta': {
+      'commit': git_commit(),
+      'server': args.server,
+      'workers': args.workers,
+      'clients': args.clients,
+      'duration_s': args.duration,
+      'users': args.users,
+      'tags': args.tags,
+      'ingredients': args.ingredients,
+      'recipes': args.recipes,
+    },
+    'scenarios': {},
+  }
+  port = utils.free_port()
+  process = utils.start_server(
+    server_command('wsgi' if args.server == 'wsgi' else 'asgi', port, args.workers), port,
+    env={'SQLITE_PATH': str(database), **env},
+  )
+  try:
+    for name, run in runs.items():
+      samples, errors, elapsed = asyncio.run(
+        run_scenario(port, run, accounts, args.clients, args.duration, args.seed)
+      )
+      row = results['scenarios'][name] = summarize(samples, errors, elapsed)
+      print(
+        f'{name:22} {row["rps"]:8.1f} req/s  p50 {row["p50_ms"]} ms  p95 {row["p95_ms"]} ms  '
+        f'p99 {row["p99_ms"]} ms  errors {row["errors"]} {" ".join(row["error_statuses"])}'
+      )
+  finally:
+    utils.stop_server(process)
+  
+  if args.output:
+    utils.write_results(args.output, results)
+  
+  if args.baseline:
+    baseline = json.loads(Path(args.baseline).read_text())
+    if compare(results, baseline, args.tolerance):
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
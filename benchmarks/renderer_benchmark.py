@@ -0,0 +1,93 @@
+""" Micro-benchmark the API renderers and parsers on typical payload sizes
+
+usage: python benchmarks/renderer_benchmark.py [--repeat 20]
+
+Renders and parses list pages shaped like the recipe list (1, 100, 1000 and
+10000 recipes) and a tag page, with DRF's stdlib JSON classes, the orjson
+classes and MessagePack. No database is needed; missing optional packages
+are skipped.
+"""
+import argparse
+import io
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import utils  # noqa: E402
+
+
+def recipe_page(size):
+  """ return a page of recipe list items as the API builds them """
+  return {
+    'next': 'http://testserver/api/recipe/recipes/?cursor=cD0xMDA%3D',
+    'previous': None,
+    'results': [
+      {
+        'id': i,
+        'title': f'Spicy chicken curry {i}',
+        'ingredients': [i, i + 1, i + 2, i + 3, i + 4],
+        'tags': [i, i + 1],
+        'time_minutes': 30 + i % 60,
+        'price': f'{i % 100}.99',
+        'link': 'https://example.com/recipes/curry' if i % 2 else '',
+      }
+      for i in range(size)
+    ],
+  }
+
+
+def tag_page(size):
+  return {'next': None, 'previous': None, 'results': [{'id': i, 'name': f'tag {i}'} for i in range(size)]}
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--repeat', type=int, default=20)
+  parser.add_argument('--output', default=None, help='write JSON results to this file')
+  args = parser.parse_args()
+  
+  utils.setup_django()
+  
+  from rest_framework import parsers, renderers
+  
+  from core import renderers as fast
+  
+  codecs = [('json', renderers.JSONRenderer(), parsers.JSONParser())]
+  if fast.orjson is not None:
+    codecs.append(('orjson', fast.ORJSONRenderer(), fast.ORJSONParser()))
+  if fast.msgpack is not None:
+    codecs.append(('msgpack', fast.MessagePackRenderer(), fast.MessagePackParser()))
+  
+  payloads = [(f'recipes x{size}', recipe_page(size)) for size in (1, 100, 1000, 10000)]
+  payloads.append(('tags x1000', tag_page(1000)))
+  
+  results = {}
+  for payload_name, data in payloads:
+    row = results[payload_name] = {}
+    for codec_name, renderer, body_parser in codecs:
+      body = renderer.render(data)
+      
+      def render():
+        renderer.render(data)
+      
+      def parse():
+        body_parser.parse(io.BytesIO(body))
+      
+      row[codec_name] = {
+        'bytes': len(body),
+        'render': utils.summarize(utils.time_calls(render, args.repeat)),
+        'parse': utils.summarize(utils.time_calls(parse, args.repeat)),
+      }
+    print(payload_name + '  ' + '  '.join(
+      f'{codec} render {row[codec]["render"]["median_ms"]:.3f} ms parse {row[codec]["parse"]["median_ms"]:.3f} ms '
+      f'({row[codec]["bytes"]} B)'
+      for codec in row
+    ))
+  
+  if args.output:
+    utils.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+  main()
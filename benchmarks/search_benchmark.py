@@ -0,0 +1,142 @@
+""" Compare the FTS5 recipe search with naive LIKE scans
+
+usage: python benchmarks/search_benchmark.py [--recipes 1000000] [--users 100]
+
+Seeds a scratch SQLite database, then times the ?q= search used by the recipe
+API against the icontains filter it replaces for a few typical queries: the
+first page of results and the full match count. An unranked LIKE page can stop
+at the first 100 hits of a common word, so the count column shows the cost of
+actually scanning the user's recipes, which is what rare words always pay.
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import utils  # noqa: E402
+
+
+WORDS = (
+  'chicken beef tofu lentil curry soup stew salad pasta rice noodle spicy sweet '
+  'sour vegan dessert breakfast lunch dinner garlic ginger onion tomato basil '
+  'lemon coconut chili pepper mushroom cheese cream butter potato carrot bean'
+).split()
+
+
+def seed(recipes, users):
+  """ Insert users, tags, ingredients and recipes with raw executemany """
+  from django.contrib.auth.hashers import make_password
+  from django.db import connection, transaction
+  from core import counters
+  from core.models import Tag, Ingredient
+  
+  rng = random.Random(42)
+  password = make_password('benchmark')
+  per_user = max(1, recipes // users)
+  with transaction.atomic(), connection.cursor() as cursor:
+    cursor.executemany(
+      'INSERT INTO core_user (id, password, is_superuser, email, name, is_active, is_staff) '
+      'VALUES (%s, %s, 0, %s, %s, 1, 0)',
+      [(u, password, f'user{u}@example.com', f'user {u}') for u in range(1, users + 1)],
+    )
+    cursor.executemany(
+      'INSERT INTO core_tag (id, name, user_id, recipe_count) VALUES (%s, %s, %s, 0)',
+      [((u - 1) * len(WORDS) + i + 1, word, u) for u in range(1, users + 1) for i, word in enumerate(WORDS)],
+    )
+    cursor.executemany(
+      'INSERT INTO core_ingredient (id, name, user_id, recipe_count) VALUES (%s, %s, %s, 0)',
+      [((u - 1) * len(WORDS) + i + 1, word, u) for u in range(1, users + 1) for i, word in enumerate(WORDS)],
+    )
+    recipe_id = 0
+    for u in range(1, users + 1):
+      rows, tag_links, ingredient_links = [], [], []
+      for _ in range(per_user):
+        recipe_id += 1
+        title = ' '.join(rng.sample(WORDS, 3))
+        rows.append((recipe_id, u, title, rng.randint(5, 120), '9.99', ''))
+        base = (u - 1) * len(WORDS)
+        tag_links.extend((recipe_id, base + i + 1) for i in rng.sample(range(len(WORDS)), 2))
+        ingredient_links.extend((recipe_id, base + i + 1) for i in rng.sample(range(len(WORDS)), 5))
+      cursor.executemany(
+        'INSERT INTO core_recipe (id, user_id, title, time_minutes, price, link, image) '
+        "VALUES (%s, %s, %s, %s, %s, %s, '')", rows,
+      )
+      cursor.executemany('INSERT INTO core_recipe_tags (recipe_id, tag_id) VALUES (%s, %s)', tag_links)
+      cursor.executemany(
+        'INSERT INTO core_recipe_ingredients (recipe_id, ingredient_id) VALUES (%s, %s)', ingredient_links,
+      )
+    # the raw link inserts bypass the counter signals
+    for model in (Tag, Ingredient):
+      model.objects.update(recipe_count=counters.actual_count(model))
+  
+  return recipe_id
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--recipes', type=int, default=1_000_000)
+  parser.add_argument('--users', type=int, default=100)
+  parser.add_argument('--repeat', type=int, default=5)
+  parser.add_argument('--output', default=None, help='write JSON results to this file')
+  args = parser.parse_args()
+  
+  database = utils.scratch_database('search')
+  database.unlink(missing_ok=True)
+  utils.setup_django(database)
+  utils.migrate()
+  
+  from django.db.models import Q
+  from core import search
+  from core.models import Recipe
+  
+  print(f'seeding {args.recipes} recipes for {args.users} users ...')
+  seed(args.recipes, args.users)
+  build = utils.time_calls(search.rebuild_index, repeat=1)
+  print(f'index rebuilt in {build[0]:.1f}s')
+  
+  results = {'recipes': args.recipes, 'users': args.users, 'index_build_s': round(build[0], 3), 'queries': {}}
+  user_recipes = Recipe.objects.filter(user_id=1)
+  
+  def like_filter(text):
+    matches = Q()
+    for word in text.split():
+      matches &= (
+        Q(title__icontains=word) |
+        Q(tags__name__icontains=word) |
+        Q(ingredients__name__icontains=word)
+      )
+    return user_recipes.filter(matches).distinct()
+  
+  for text in ('curry', 'spicy chicken', 'coc', 'zucchini'):
+    def fts_page():
+      return list(search.search_recipes(Recipe.objects.all(), text, user_id=1).order_by('rank', 'id')[:100])
+    
+    def fts_count():
+      return search.search_recipes(Recipe.objects.all(), text, user_id=1).count()
+    
+    def like_page():
+      return list(like_filter(text).order_by('id')[:100])
+    
+    def like_count():
+      return like_filter(text).count()
+    
+    row = results['queries'][text] = {
+      'fts_top_100': utils.summarize(utils.time_calls(fts_page, args.repeat)),
+      'fts_count': utils.summarize(utils.time_calls(fts_count, args.repeat)),
+      'like_first_100': utils.summarize(utils.time_calls(like_page, args.repeat)),
+      'like_count': utils.summarize(utils.time_calls(like_count, args.repeat)),
+    }
+    print(
+      f'{text!r:16} fts top 100 {row["fts_top_100"]["median_ms"]:8.2f} ms  '
+      f'like first 100 {row["like_first_100"]["median_ms"]:8.2f} ms  |  '
+      f'fts count {row["fts_count"]["median_ms"]:8.2f} ms  like count {row["like_count"]["median_ms"]:8.2f} ms'
+    )
+  
+  if args.output:
+    utils.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+  main()
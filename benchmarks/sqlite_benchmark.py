@@ -0,0 +1,177 @@
+""" Compare the default and production SQLite profiles under multi-process contention
+
+usage: python benchmarks/sqlite_benchmark.py [--writers 4] [--readers 8] [--duration 10] [--atomic-reads]
+
+Seeds a SQLite file with core.seeding, then for each profile runs --writers
+and --readers worker processes against a fresh copy of it for --duration
+seconds:
+
+  writer  in one write_atomic() transaction, read the user's tags, create a
+          recipe and link two tags, as the recipe create endpoint does
+  reader  fetch a page of a user's recipes and their tag links, as the recipe
+          list does; inside transaction.atomic() with --atomic-reads, as the
+          admin change form and other Django read paths do
+
+The profiles are core.db.sqlite_database's default and production ones, and
+'immediate': the production one with BEGIN IMMEDIATE on every transaction,
+reads included, to show what taking the write lock only on writes saves.
+
+After every operation the worker ends the "request" as Django does, closing
+the connection unless the profile keeps it. Reported per profile and role:
+operations per second, failed operations ("database is locked") and the
+p50/p95/p99 latencies of the successful ones.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import utils  # noqa: E402
+
+
+# name -> (SQLITE_PRODUCTION, transaction_mode of every transaction)
+PROFILES = {'default': ('', None), 'production': ('1', None), 'immediate': ('1', 'IMMEDIATE')}
+
+
+def write(user_id, rng, atomic_reads):
+  from core.db import write_atomic
+  from core.models import Recipe, Tag
+  
+  with write_atomic():
+    tag_ids = list(Tag.objects.filter(user_id=user_id).values_list('id', flat=True)[:10])
+    recipe = Recipe.objects.create(
+      user_id=user_id, title=f'contention {rng.random()}', time_minutes=20, price='5.00'
+    )
+    recipe.tags.add(*rng.sample(tag_ids, min(2, len(tag_ids))))
+
+
+def read(user_id, rng, atomic_reads):
+  from contextlib import nullcontext
+  
+  from django.db import transaction
+  
+  from core.models import Recipe
+  
+  with transaction.atomic() if atomic_reads else nullcontext():
+    ids = list(Recipe.objects.filter(user_id=user_id).order_by('-id').values_list('id', flat=True)[:100])
+    list(Recipe.tags.through.objects.filter(recipe_id__in=ids).values_list('recipe_id', 'tag_id'))
+
+
+def worker(profile, database, role, users, deadline, seed, atomic_reads, results):
+  """ Run one role until the deadline and put (role, latencies, errors) on the results queue """
+  production, transaction_mode = PROFILES[profile]
+  os.environ['SQLITE_PRODUCTION'] = production
+  utils.setup_django(database)
+  
+  from django.db import OperationalError, connection
+  
+  if transaction_mode:
+    connection.settings_dict['OPTIONS']['transaction_mode'] = transaction_mode
+  operation = write if role == 'writer' else read
+  rng = random.Random(seed)
+  samples, errors = [], 0
+  while time.time() < deadline:
+    start = time.perf_counter()
+    try:
+      operation(rng.choice(users), rng, atomic_reads)
+      samples.append(time.perf_counter() - start)
+    except OperationalError:
+      errors += 1
+    # the end of a request: drop the connection unless CONN_MAX_AGE keeps it
+    connection.close_if_unusable_or_obsolete()
+  
+  connection.close()
+  results.put((role, samples, errors))
+
+
+def run_profile(profile, database, users, writers, readers, duration, atomic_reads):
+  context = multiprocessing.get_context('spawn')
+  results = context.Queue()
+  # start together once every process has had time to import Django
+  deadline = time.time() + 3 + duration
+  processes = [
+    context.Process(target=worker, args=(profile, database, role, users, deadline, n, atomic_reads, results))
+    for n, role in enumerate(['writer'] * writers + ['reader'] * readers)
+  ]
+  for process in processes:
+    process.start()
+  
+  collected = {'writer': ([], 0), 'reader': ([], 0)}
+  for _ in processes:
+    role, samples, errors = results.get()
+    collected[role] = (collected[role][0] + samples, collected[role][1] + errors)
+  for process in processes:
+    process.join()
+  
+  row = {}
+  for role, (samples, errors) in collected.items():
+    if not samples and not errors:
+      continue
+    row[role] = {
+      'ops': len(samples),
+      'ops_per_s': round(len(samples) / duration, 1),
+      'errors': errors,
+      'p50_ms': round(utils.percentile(samples, 50) * 1000, 2) if samples else None,
+      'p95_ms': round(utils.percentile(samples, 95) * 1000, 2) if samples else None,
+      'p99_ms': round(utils.percentile(samples, 99) * 1000, 2) if samples else None,
+    }
+  return row
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--writers', type=int, default=4)
+  parser.add_argument('--readers', type=int, default=8)
+  parser.add_argument('--duration', type=float, default=10)
+  parser.add_argument('--users', type=int, default=50)
+  parser.add_argument('--recipes', type=int, default=500, help='recipes per user')
+  parser.add_argument('--atomic-reads', action='store_true', help='run the reads inside transaction.atomic()')
+  parser.add_argument('--output', default=None, help='write JSON results to this file')
+  args = parser.parse_args()
+  
+  seeded = utils.scratch_database('sqlite_seed')
+  seeded.unlink(missing_ok=True)
+  utils.setup_django(seeded)
+  utils.migrate()
+  
+  from django.db import connection
+  
+  from core import seeding
+  from core.models import User
+  
+  print(f'seeding {args.users} users with {args.recipes} recipes each ...')
+  seeding.seed(args.users, recipes=args.recipes, random_seed=1)
+  users = list(User.objects.values_list('id', flat=True))
+  connection.close()
+  
+  results = {
+    'writers': args.writers, 'readers': args.readers, 'duration_s': args.duration,
+    'atomic_reads': args.atomic_reads, 'profiles': {},
+  }
+  for profile in PROFILES:
+    database = utils.scratch_database(f'sqlite_{profile}')
+    for suffix in ('', '-wal', '-shm'):
+      Path(f'{database}{suffix}').unlink(missing_ok=True)
+    shutil.copyfile(seeded, database)
+    
+    row = results['profiles'][profile] = run_profile(
+      profile, database, users, args.writers, args.readers, args.duration, args.atomic_reads
+    )
+    for role, stats in row.items():
+      print(
+        f'{profile:10} {role:6} {stats["ops_per_s"]:8.1f} ops/s  errors {stats["errors"]:5}  '
+        f'p50 {stats["p50_ms"]} ms  p95 {stats["p95_ms"]} ms  p99 {stats["p99_ms"]} ms'
+      )
+  
+  if args.output:
+    utils.write_results(args.output, results)
+
+
+if __name__ == '__main__':
+  main()
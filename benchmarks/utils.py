@@ -0,0 +1,168 @@
+""" Shared helpers for the benchmark scripts in this folder """
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django(database=None):
+  """ Configure Django, optionally pointing the default database at another SQLite file """
+  sys.path.insert(0, str(REPO_ROOT))
+  os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recipe_app.settings')
+  
+  import django
+  from django.conf import settings
+  
+  if database is not None:
+    settings.DATABASES['default']['NAME'] = str(database)
+  django.setup()
+
+
+def scratch_database(name):
+  """ return the path of a throwaway SQLite file for a benchmark run """
+  return Path(tempfile.gettempdir()) / f'recipe_bench_{name}.sqlite3'
+
+
+def migrate():
+  """ Create the schema in the configured database """
+  from django.core.management import call_command
+  
+  call_command('migrate', verbosity=0)
+
+
+def time_calls(func, repeat=5):
+  """ return the wall time in seconds of each of repeat calls """
+  samples = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func()
+    samples.append(time.perf_counter() - start)
+  
+  return samples
+
+
+def percentile(samples, pct):
+  """ return the pct percentile of samples by nearest rank """
+  ordered = sorted(samples)
+  index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+  return ordered[index]
+
+
+def summarize(samples):
+  """ return min, median, p95 and mean in milliseconds """
+  return {
+    'min_ms': round(min(samples) * 1000, 3),
+    'median_ms': round(statistics.median(samples) * 1000, 3),
+    'p95_ms': round(percentile(samples, 95) * 1000, 3),
+    'mean_ms': round(statistics.mean(samples) * 1000, 3),
+  }
+
+
+def write_results(path, results):
+  """ Save results as JSON next to the other runs """
+  path = Path(path)
+  path.parent.mkdir(parents=True, exist_ok=True)
+  path.write_text(json.dumps(results, indent=2, sort_keys=True))
+
+
+def free_port():
+  """ return a free local TCP port """
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+
+def start_server(command, port, env=None, timeout=30):
+  """ Start a server process from the repo root and wait until it accepts connections """
+  process = subprocess.Popen(
+    command, cwd=REPO_ROOT, env={**os.environ, **(env or {})},
+    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+  )
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout=1).close()
+      return process
+    except OSError:
+      if process.poll() is not None:
+        raise RuntimeError(f'{command[0]} exited with {process.returncode}')
+      time.sleep(0.1)
+  
+  process.terminate()
+  raise RuntimeError(f'{command[0]} did not start listening on {port}')
+
+
+def stop_server(process):
+  process.terminate()
+  try:
+    process.wait(timeout=10)
+  except subprocess.TimeoutExpired:
+    process.kill()
+
+
+class HttpConnection:
+  """ Minimal keep-alive HTTP/1.1 client on asyncio streams
+
+  Enough for driving the API from hundreds of concurrent tasks without the
+  overhead of a full client library skewing the numbers.
+  """
+  
+  def __init__(self, port, host='127.0.0.1'):
+    self.host = host
+    self.port = port
+    self.reader = None
+    self.writer = None
+  
+  async def request(self, method, path, headers=None, body=b''):
+    """ return (status, headers, body) of one request, reconnecting when the server closed """
+    if self.writer is None:
+      self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+    
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+    lines.extend(f'{name}: {value}' for name, value in (headers or {}).items())
+    self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+    await self.writer.drain()
+    
+    status_line = await self.reader.readline()
+    if not status_line:
+      await self.close()
+      raise ConnectionError('server closed the connection')
+    
+    response_headers = {}
+    while True:
+      line = await self.reader.readline()
+      if line in (b'\r\n', b''):
+        break
+      name, _, value = line.decode('latin-1').partition(':')
+      response_headers[name.strip().lower()] = value.strip()
+    
+    if response_headers.get('transfer-encoding') == 'chunked':
+      chunks = []
+      while True:
+        size = int((await self.reader.readline()).split(b';')[0], 16)
+        chunk = await self.reader.readexactly(size + 2)
+        if not size:
+          break
+        chunks.append(chunk[:-2])
+      content = b''.join(chunks)
+    else:
+      content = await self.reader.readexactly(int(response_headers.get('content-length', 0)))
+    
+    if response_headers.get('connection', '').lower() == 'close':
+      await self.close()
+    
+    return int(status_line.split()[1]), response_headers, content
+  
+  async def close(self):
+    if self.writer is not None:
+      self.writer.close()
+      self.writer = None
@@ -1,13 +1,73 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.functional import cached_property
 from django.utils.translation import gettext as _
 from core import models
 # Register your models here.
 
 
+def estimated_count(model, using=DEFAULT_DB_ALIAS):
+  """ return the rows of model's table as of its last ANALYZE, None if it never ran """
+  connection = connections[using]
+  if connection.vendor != 'sqlite':
+    return None
+  
+  # every index of the table has a sqlite_stat1 row whose stat starts with the row count
+  with connection.cursor() as cursor:
+    try:
+      cursor.execute(
+        'SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [model._meta.db_table]
+      )
+    except DatabaseError:
+      # sqlite_stat1 is only created by the first ANALYZE
+      return None
+    return cursor.fetchone()[0]
+
+
+class EstimatedCountPaginator(Paginator):
+  """ Paginator that reads the size of an unfiltered large table off the planner statistics
+  
+  COUNT(*) scans the whole table, so a changelist without filters or search
+  shows the estimate the last ANALYZE (or PRAGMA optimize) left. Small tables,
+  and filtered or searched lists, are still counted exactly.
+  """
+  estimate_threshold = 10000
+  
+  @cached_property
+  def count(self):
+    queryset = self.object_list
+    if not queryset.query.where:
+      estimate = estimated_count(queryset.model, queryset.db)
+      if estimate is not None and estimate >= self.estimate_threshold:
+        return estimate
+    
+    return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+  """ Changelists and forms that do not grow with the tables
+  
+  Searches go through the owner's email prefix, which seeks the unique email
+  index, and foreign keys and many to many fields never render every row.
+  """
+  paginator = EstimatedCountPaginator
+  show_full_result_count = False
+  list_select_related = ('user',)
+  autocomplete_fields = ('user',)
+  search_fields = ('user__email__prefix',)
+  search_help_text = _('Start of the owner email, case sensitive')
+
+
 class UserAdmin(BaseUserAdmin):
   ordering = ['id']
   list_display = ['email','name']
+  paginator = EstimatedCountPaginator
+  show_full_result_count = False
+  # the autocomplete of the user fields searches here too
+  search_fields = ['email__prefix']
+  search_help_text = _('Start of the email, case sensitive')
   
   """ how user edit page works """
   fieldsets = (
@@ -26,7 +86,21 @@ class UserAdmin(BaseUserAdmin):
   )
 
 
+@admin.register(models.Tag, models.Ingredient)
+class NamedAdmin(LargeTableAdmin):
+  list_display = ['name', 'user', 'recipe_count']
+  # kept by the link signals, see core.counters
+  readonly_fields = ['recipe_count']
+
+
+@admin.register(models.Recipe)
+class RecipeAdmin(LargeTableAdmin):
+  list_display = ['title', 'user', 'time_minutes', 'price']
+  # an autocomplete would search tags by name across all users, which no index
+  # serves, the raw id lookup opens the changelist that searches by owner
+  raw_id_fields = ['tags', 'ingredients']
+  # stored by content through the upload-image API action, see core.images
+  readonly_fields = ['image']
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
-admin.site.register(models.Recipe)
\ No newline at end of file
@@ -0,0 +1,105 @@
+""" Incremental gzip, brotli and zstd compressors behind one interface
+
+brotli and zstandard are optional; encodings whose package is missing are
+simply not offered.
+"""
+import zlib
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+
+class GzipCompressor:
+  """ One gzip member written incrementally """
+  
+  def __init__(self, level=6):
+    self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+  
+  def compress(self, data):
+    return self._compressor.compress(data)
+  
+  def flush(self):
+    """ return everything buffered so far so the client can decode it now """
+    return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+  
+  def finish(self):
+    return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+  
+  def __init__(self, level=4):
+    self._compressor = brotli.Compressor(quality=level)
+  
+  def compress(self, data):
+    return self._compressor.process(data)
+  
+  def flush(self):
+    return self._compressor.flush()
+  
+  def finish(self):
+    return self._compressor.finish()
+
+
+class ZstdCompressor:
+  
+  def __init__(self, level=3):
+    self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+  
+  def compress(self, data):
+    return self._compressor.compress(data)
+  
+  def flush(self):
+    return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+  
+  def finish(self):
+    return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# Content-Encoding token -> compressor class, for the encodings available here
+COMPRESSORS = {'gzip': GzipCompressor}
+if brotli is not None:
+  COMPRESSORS['br'] = BrotliCompressor
+if zstandard is not None:
+  COMPRESSORS['zstd'] = ZstdCompressor
+
+
+def get_compressor(encoding, level=None):
+  """ return a new compressor for a Content-Encoding token """
+  compressor_class = COMPRESSORS[encoding]
+  return compressor_class() if level is None else compressor_class(level)
+
+
+def compress(encoding, data, level=None):
+  """ Compress bytes in one go """
+  compressor = get_compressor(encoding, level)
+  return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(encoding, chunks, level=None):
+  """ Compress an iterable of bytes, yielding output as each chunk is flushed """
+  compressor = get_compressor(encoding, level)
+  for chunk in chunks:
+    data = compressor.compress(chunk) + compressor.flush()
+    if data:
+      yield data
+  
+  yield compressor.finish()
+
+
+async def acompress_stream(encoding, chunks, level=None):
+  """ async variant of compress_stream for async iterators """
+  compressor = get_compressor(encoding, level)
+  async for chunk in chunks:
+    data = compressor.compress(chunk) + compressor.flush()
+    if data:
+      yield data
+  
+  yield compressor.finish()
@@ -0,0 +1,104 @@
+""" The recipe_count counters of tags and ingredients
+
+The counters are adjusted with UPDATE ... SET recipe_count = recipe_count + n
+in the transaction that changes the links, so concurrent changes never lose an
+update. The model signals cover add, remove, clear and set on either side of
+the relations and recipe deletes; the bulk insert paths call add_links() with
+the recipes they inserted. reconcile() recounts from the through tables, for
+drift left by writes that bypassed both, such as raw SQL.
+"""
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from core.db import write_atomic
+from core.models import Tag, Ingredient, Recipe
+
+
+# counted model -> (through table, column of the counted id)
+COUNTED = {
+  Tag: (Recipe.tags.through, 'tag_id'),
+  Ingredient: (Recipe.ingredients.through, 'ingredient_id'),
+}
+
+# ids per UPDATE, under SQLite's default limit of bound parameters even when bound twice
+UPDATE_BATCH_SIZE = 450
+
+
+def adjust(model, deltas, using=DEFAULT_DB_ALIAS):
+  """ Add {id: delta} to the counters, one UPDATE per distinct delta """
+  by_delta = {}
+  for pk, delta in deltas.items():
+    if delta:
+      by_delta.setdefault(delta, []).append(pk)
+  
+  for delta, ids in by_delta.items():
+    for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+      model.objects.using(using).filter(pk__in=ids[start:start + UPDATE_BATCH_SIZE]).update(
+        recipe_count=F('recipe_count') + delta
+      )
+
+
+def add_links(model, recipe_ids, using=DEFAULT_DB_ALIAS):
+  """ Count the links of model inserted in bulk for new recipes, one UPDATE per batch of recipes """
+  through, column = COUNTED[model]
+  recipe_ids = list(recipe_ids)
+  for start in range(0, len(recipe_ids), UPDATE_BATCH_SIZE):
+    batch = recipe_ids[start:start + UPDATE_BATCH_SIZE]
+    links = through.objects.filter(recipe_id__in=batch)
+    model.objects.using(using).filter(pk__in=links.values(column)).update(
+      recipe_count=F('recipe_count') + _link_count(links.filter(**{column: OuterRef('pk')}), column)
+    )
+
+
+def count_links(model, recipe_ids, using=DEFAULT_DB_ALIAS):
+  """ return {id: number of links} of model to the recipes """
+  through, column = COUNTED[model]
+  return dict(
+    through.objects.using(using).filter(recipe_id__in=recipe_ids)
+    .values(column).annotate(links=Count('id')).values_list(column, 'links')
+  )
+
+
+def _link_count(links, column):
+  """ return a subquery counting the through rows of links """
+  links = links.order_by().values(column).annotate(links=Count('id')).values('links')
+  return Coalesce(Subquery(links, output_field=IntegerField()), Value(0))
+
+
+def actual_count(model):
+  """ return a subquery counting all the links of the outer row """
+  through, column = COUNTED[model]
+  return _link_count(through.objects.filter(**{column: OuterRef('pk')}), column)
+
+
+def reconcile(model, using=DEFAULT_DB_ALIAS, batch_size=5000, dry_run=False, progress=None):
+  """ Recount model's counters from the through table in id batches
+
+  Each batch is compared and fixed in its own transaction, so the table is
+  never locked for long and the counters of rows changed meanwhile stay right.
+  return the (id, user id) pairs of the rows that had drifted
+  """
+  drifted = []
+  last_id = 0
+  queryset = model.objects.using(using).order_by('id')
+  while True:
+    with (transaction.atomic if dry_run else write_atomic)(using=using):
+      ids = list(queryset.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+      if not ids:
+        break
+      last_id = ids[-1]
+      wrong = list(
+        queryset.filter(id__in=ids).annotate(actual=actual_count(model))
+        .exclude(recipe_count=F('actual')).values_list('id', 'user_id')
+      )
+      if wrong and not dry_run:
+        model.objects.using(using).filter(id__in=[pk for pk, _ in wrong]).update(
+          recipe_count=actual_count(model)
+        )
+    
+    drifted.extend(wrong)
+    if progress is not None:
+      progress(last_id, len(drifted))
+  
+  return drifted
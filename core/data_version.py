@@ -0,0 +1,42 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(user_id):
+  return f'core:data-version:{user_id}'
+
+
+def get_data_version(user_id):
+  """ Return the opaque version of a user's tags, ingredients and recipes """
+  key = _version_key(user_id)
+  version = cache.get(key)
+  if version is None:
+    # a fresh random version after an eviction never matches an old ETag
+    cache.add(key, uuid.uuid4().hex, None)
+    version = cache.get(key)
+  
+  return version
+
+
+async def aget_data_version(user_id):
+  """ async variant of get_data_version """
+  key = _version_key(user_id)
+  version = await cache.aget(key)
+  if version is None:
+    await cache.aadd(key, uuid.uuid4().hex, None)
+    version = await cache.aget(key)
+  
+  return version
+
+
+def _set_new_version(user_id):
+  cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def bump_data_version(user_id, using=None):
+  """ Invalidate a user's version now and again once the transaction on using commits """
+  # the second bump covers readers that saw the new version before the data was visible
+  _set_new_version(user_id)
+  transaction.on_commit(lambda: _set_new_version(user_id), using=using)
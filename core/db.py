@@ -0,0 +1,76 @@
+""" SQLite database settings, imported by recipe_app.settings
+
+Nothing in here may import models: it is loaded before the apps are.
+"""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+# applied to every new connection of the production profile
+PRODUCTION_PRAGMAS = {
+  # readers no longer block the writer and the writer no longer blocks readers
+  'journal_mode': 'WAL',
+  # in WAL mode NORMAL only syncs at checkpoints and is still corruption safe
+  'synchronous': 'NORMAL',
+  # negative means KiB, so a 64 MiB page cache per connection
+  'cache_size': -64000,
+  'mmap_size': 256 * 1024 * 1024,
+  # wait for a lock this many milliseconds before failing with "database is locked"
+  'busy_timeout': 5000,
+  'temp_store': 'MEMORY',
+}
+
+
+def sqlite_database(name, production=False, pragmas=None, conn_max_age=600):
+  """ return a DATABASES entry for a SQLite file
+
+  The production profile sets the pragmas above on connect and keeps
+  connections open for conn_max_age seconds. Transactions still begin
+  DEFERRED, so read only ones never wait for the writer; the write paths take
+  the lock up front with write_atomic().
+  """
+  database = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': name,
+  }
+  if not production:
+    return database
+  
+  pragmas = {**PRODUCTION_PRAGMAS, **(pragmas or {})}
+  database.update({
+    'CONN_MAX_AGE': conn_max_age,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+      'init_command': ';'.join(f'PRAGMA {pragma}={value}' for pragma, value in pragmas.items()),
+    },
+  })
+  return database
+
+
+@contextmanager
+def write_atomic(using=None):
+  """ atomic() for a transaction that writes, begun with BEGIN IMMEDIATE on SQLite
+  
+  A DEFERRED transaction that reads and then writes has to upgrade its lock,
+  and under WAL that fails with "database is locked" at once, without waiting
+  on the busy timeout, if another writer committed since it began. IMMEDIATE
+  takes the write lock at BEGIN and waits for it there instead. Nested blocks
+  are savepoints of a transaction already begun, so they are left as they are.
+  """
+  connection = connections[using or DEFAULT_DB_ALIAS]
+  if connection.vendor != 'sqlite' or connection.in_atomic_block:
+    with transaction.atomic(using=using):
+      yield
+    return
+  
+  # connecting reads transaction_mode from the settings again, so connect first
+  connection.ensure_connection()
+  mode = connection.transaction_mode
+  connection.transaction_mode = 'IMMEDIATE'
+  try:
+    with transaction.atomic(using=using):
+      connection.transaction_mode = mode
+      yield
+  finally:
+    connection.transaction_mode = mode
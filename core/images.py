@@ -0,0 +1,244 @@
+""" Recipe images: streamed uploads, content addressed storage and thumbnails
+
+An upload is written chunk by chunk to a staging file under MEDIA_ROOT while
+its SHA-256 is computed, then renamed to recipes/<ab>/<digest>.<ext>. The
+same picture uploaded again, by anyone, is stored once and never rewritten,
+and a stored file never changes, so its URL can be cached forever.
+
+Thumbnails are named after their image and rendered by a small pool of
+worker processes once the upload is saved, never in the request thread. At
+most RECIPE_IMAGES['MAX_PENDING'] images wait for the pool, beyond that they
+are skipped and left to the build_thumbnails command.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+from core import thumbnails
+
+
+logger = logging.getLogger('core.images')
+
+IMAGE_DIR = 'recipes'
+# beside the images so a finished upload is renamed, not copied, into place
+STAGING_DIR = '.uploads'
+
+# leading bytes -> extension of the accepted formats
+SIGNATURES = (
+  (b'\xff\xd8\xff', 'jpg'),
+  (b'\x89PNG\r\n\x1a\n', 'png'),
+  (b'GIF87a', 'gif'),
+  (b'GIF89a', 'gif'),
+)
+
+_pool = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def config():
+  """ return RECIPE_IMAGES over the defaults """
+  return {
+    'MAX_UPLOAD_SIZE': 10 * 1024 * 1024,
+    'THUMBNAIL_SIZES': {'small': 160, 'medium': 480, 'large': 1024},
+    'WORKERS': 2,
+    'MAX_PENDING': 100,
+    **getattr(settings, 'RECIPE_IMAGES', {}),
+  }
+
+
+def _permissions():
+  return settings.FILE_UPLOAD_PERMISSIONS or 0o644
+
+
+def sniff_extension(head):
+  """ return the extension of the image format the bytes start with, None if not one we accept """
+  for signature, extension in SIGNATURES:
+    if head.startswith(signature):
+      return extension
+  if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+    return 'webp'
+  
+  return None
+
+
+def image_name(digest, extension):
+  return f'{IMAGE_DIR}/{digest[:2]}/{digest}.{extension}'
+
+
+def thumbnail_name(name, size):
+  return f'{os.path.splitext(name)[0]}-{size}.{thumbnails.THUMBNAIL_EXTENSION}'
+
+
+def image_urls(name, request=None):
+  """ return the URLs of a stored image and of its thumbnails by size label """
+  def url(name):
+    url = default_storage.url(name)
+    return url if request is None else request.build_absolute_uri(url)
+  
+  sizes = config()['THUMBNAIL_SIZES'] if thumbnails.Image is not None else {}
+  return {
+    'url': url(name),
+    'thumbnails': {label: url(thumbnail_name(name, size)) for label, size in sizes.items()},
+  }
+
+
+class StagedUpload(UploadedFile):
+  """ An upload being written to a staging file, hashed as it arrives """
+  
+  def __init__(self, name, content_type, charset, content_type_extra):
+    directory = default_storage.path(STAGING_DIR)
+    os.makedirs(directory, exist_ok=True)
+    file = tempfile.NamedTemporaryFile(dir=directory, suffix='.upload', delete=False)
+    super().__init__(file, name, content_type, 0, charset, content_type_extra)
+    self.hash = hashlib.sha256()
+    self.extension = None
+  
+  def temporary_file_path(self):
+    return self.file.name
+  
+  def write_chunk(self, data):
+    self.file.write(data)
+    self.hash.update(data)
+  
+  def finish(self, size):
+    self.size = size
+    self.file.flush()
+    self.file.seek(0)
+    self.extension = sniff_extension(self.file.read(12))
+    self.file.seek(0)
+  
+  @property
+  def digest(self):
+    return self.hash.hexdigest()
+  
+  def discard(self):
+    """ Close and delete the staging file """
+    self.file.close()
+    if os.path.exists(self.temporary_file_path()):
+      os.unlink(self.temporary_file_path())
+
+
+class ContentAddressedUploadHandler(FileUploadHandler):
+  """ Stream uploaded files to staging files whatever their size, never into memory
+  
+  Files over max_size are dropped as soon as they pass it and flag too_large.
+  """
+  
+  def __init__(self, request=None, max_size=None):
+    super().__init__(request)
+    self.max_size = config()['MAX_UPLOAD_SIZE'] if max_size is None else max_size
+    self.too_large = False
+    self.file = None
+  
+  def new_file(self, *args, **kwargs):
+    super().new_file(*args, **kwargs)
+    self.file = StagedUpload(self.file_name, self.content_type, self.charset, self.content_type_extra)
+  
+  def receive_data_chunk(self, raw_data, start):
+    if start + len(raw_data) > self.max_size:
+      self.too_large = True
+      self.file.discard()
+      raise SkipFile()
+    
+    self.file.write_chunk(raw_data)
+  
+  def file_complete(self, file_size):
+    self.file.finish(file_size)
+    return self.file
+  
+  def upload_interrupted(self):
+    if self.file is not None:
+      self.file.discard()
+
+
+def store(upload):
+  """ Move a finished StagedUpload to its content address and return the storage name
+  
+  If the same content is stored already the staging file is dropped instead.
+  """
+  name = image_name(upload.digest, upload.extension)
+  path = default_storage.path(name)
+  upload.close()
+  if os.path.exists(path):
+    os.unlink(upload.temporary_file_path())
+    return name
+  
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  os.chmod(upload.temporary_file_path(), _permissions())
+  os.replace(upload.temporary_file_path(), path)
+  return name
+
+
+def missing_thumbnails(name):
+  """ return {size: path} of the thumbnails of a stored image that don't exist yet """
+  if thumbnails.Image is None:
+    return {}
+  
+  targets = {
+    size: default_storage.path(thumbnail_name(name, size)) for size in config()['THUMBNAIL_SIZES'].values()
+  }
+  return {size: path for size, path in targets.items() if not os.path.exists(path)}
+
+
+def build_thumbnails(name):
+  """ Render the missing thumbnails of a stored image in this process, return the sizes written """
+  targets = missing_thumbnails(name)
+  if not targets:
+    return []
+  
+  return thumbnails.build(default_storage.path(name), targets, _permissions())
+
+
+def _get_pool():
+  global _pool
+  if _pool is None:
+    # spawned rather than forked, a fork of a threaded server process can deadlock
+    _pool = ProcessPoolExecutor(config()['WORKERS'], mp_context=multiprocessing.get_context('spawn'))
+  return _pool
+
+
+def _finished(name, future):
+  global _pool
+  with _lock:
+    _pending.discard(future)
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+      _pool = None
+  if not future.cancelled() and future.exception() is not None:
+    logger.error('Thumbnails of %s failed', name, exc_info=future.exception())
+
+
+def schedule_thumbnails(name):
+  """ Queue the missing thumbnails of a stored image for the worker pool, return the future or None """
+  targets = missing_thumbnails(name)
+  if not targets:
+    return None
+  
+  with _lock:
+    if len(_pending) >= config()['MAX_PENDING']:
+      logger.warning('Thumbnail queue is full, skipped %s until build_thumbnails runs', name)
+      return None
+    future = _get_pool().submit(
+      thumbnails.build, default_storage.path(name), targets, _permissions()
+    )
+    _pending.add(future)
+  
+  future.add_done_callback(lambda future: _finished(name, future))
+  return future
+
+
+def wait_for_thumbnails(timeout=None):
+  """ Block until the queued thumbnails are rendered """
+  with _lock:
+    pending = list(_pending)
+  wait(pending, timeout)
@@ -0,0 +1,125 @@
+""" Per-request query, serializer and view timings
+
+InstrumentationMiddleware opens a RequestMetrics for every request and puts it
+in a context variable. Database queries are timed by an execute wrapper that
+install_query_timers() adds to the connections, and serialization through
+`timed('serialize')`, which costs a single context variable lookup when no
+request is being measured.
+"""
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+_current = ContextVar('request_metrics', default=None)
+_untimed = nullcontext()
+
+
+class RequestMetrics:
+  """ The timings collected for one request, in seconds """
+  
+  def __init__(self):
+    self.queries = []
+    self.db_time = 0.0
+    self.timings = {}
+    self.total = 0.0
+  
+  def record_query(self, sql, duration):
+    self.queries.append((duration, sql))
+    self.db_time += duration
+  
+  def add_time(self, name, duration):
+    self.timings[name] = self.timings.get(name, 0.0) + duration
+  
+  def worst_queries(self, count):
+    """ return the slowest (duration, sql) pairs, slowest first """
+    return sorted(self.queries, key=lambda query: query[0], reverse=True)[:count]
+  
+  def server_timing(self):
+    """ return the value of a Server-Timing header, durations in milliseconds """
+    metrics = [f'db;dur={self.db_time * 1000:.3f};desc="{len(self.queries)} queries"']
+    metrics.extend(f'{name};dur={duration * 1000:.3f}' for name, duration in self.timings.items())
+    metrics.append(f'view;dur={self.total * 1000:.3f}')
+    return ', '.join(metrics)
+
+
+def start():
+  """ begin measuring the current request and return its metrics and reset token """
+  metrics = RequestMetrics()
+  return metrics, _current.set(metrics)
+
+
+def stop(token):
+  _current.reset(token)
+
+
+def current():
+  """ return the metrics of the request being measured, or None """
+  return _current.get()
+
+
+@contextmanager
+def _timed(metrics, name):
+  started = time.perf_counter()
+  try:
+    yield
+  finally:
+    metrics.add_time(name, time.perf_counter() - started)
+
+
+def timed(name):
+  """ return a context manager adding its duration to the current request's `name` timing """
+  metrics = _current.get()
+  if metrics is None:
+    return _untimed
+  return _timed(metrics, name)
+
+
+def query_timer(execute, sql, params, many, context):
+  """ connection execute wrapper recording every query on the current request """
+  metrics = _current.get()
+  if metrics is None:
+    return execute(sql, params, many, context)
+  
+  started = time.perf_counter()
+  try:
+    return execute(sql, params, many, context)
+  finally:
+    metrics.record_query(sql, time.perf_counter() - started)
+
+
+class TimedSerializerMixin:
+  """ Count the time spent building `serializer.data` as serializer time """
+  
+  @property
+  def data(self):
+    with timed('serialize'):
+      return super().data
+
+
+def install_query_timer(connection, **kwargs):
+  """ add query_timer to a connection's execute wrappers once """
+  if query_timer not in connection.execute_wrappers:
+    # first in the list so an execute_wrapper() block that is open now still pops its own wrapper
+    connection.execute_wrappers.insert(0, query_timer)
+
+
+def install_query_timers(**kwargs):
+  """ add query_timer to every open connection of this thread """
+  for connection in connections.all(initialized_only=True):
+    install_query_timer(connection)
+
+
+def enable_query_timing():
+  """ time the queries of every connection from now on
+
+  Connections are per thread, so the timer is installed on new connections as
+  they are created and on the open ones as each request starts; under ASGI the
+  request_started receivers run in the thread the sync ORM calls use.
+  """
+  connection_created.connect(install_query_timer, dispatch_uid='core.instrumentation')
+  request_started.connect(install_query_timers, dispatch_uid='core.instrumentation')
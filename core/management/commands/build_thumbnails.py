@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import images, sharding, thumbnails
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+  """ Django command to render the thumbnails of recipe images that have none """
+  help = 'Render missing recipe image thumbnails, such as those skipped while the worker pool was full'
+  
+  def handle(self, *args, **options):
+    if thumbnails.Image is None:
+      raise CommandError('Rendering thumbnails needs Pillow')
+    
+    built = 0
+    for using in sharding.shards():
+      names = (
+        Recipe.objects.using(using).exclude(image='').order_by('image')
+        .values_list('image', flat=True).distinct().iterator()
+      )
+      for name in names:
+        try:
+          built += bool(images.build_thumbnails(name))
+        except (OSError, ValueError, thumbnails.Image.DecompressionBombError) as exc:
+          self.stderr.write(f'Skipped {name}: {exc}')
+    
+    self.stdout.write(self.style.SUCCESS(f'Rendered the thumbnails of {built} images'))
@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import sharding
+
+
+class Command(BaseCommand):
+  """ Django command to move the data of a user to another shard """
+  help = "Move a user's tags, ingredients and recipes to another shard while the site is up"
+  
+  def add_arguments(self, parser):
+    parser.add_argument('email', help='email of the user to move')
+    parser.add_argument('shard', help='database alias of the target shard')
+    parser.add_argument('--batch-size', type=int, default=sharding.MOVE_BATCH_SIZE)
+    parser.add_argument('--grace', type=float, default=None,
+                        help="seconds to wait for the user's writes in flight, SHARDING['MOVE_GRACE_SECONDS'] by default "
+                             "and never less than SHARDING['CACHE_SECONDS']")
+  
+  def handle(self, *args, **options):
+    if not sharding.is_enabled():
+      raise CommandError('Sharding is off, list the shards in SHARDING["SHARDS"]')
+    if options['shard'] not in sharding.shards():
+      raise CommandError(f'Unknown shard {options["shard"]}, expected one of {", ".join(sharding.shards())}')
+    
+    try:
+      user = get_user_model().objects.get(email=options['email'])
+    except get_user_model().DoesNotExist:
+      raise CommandError(f'No user with email {options["email"]}')
+    
+    source = sharding.db_for_user(user.pk)
+    counts = sharding.move_user(
+      user.pk, options['shard'], batch_size=options['batch_size'], grace=options['grace']
+    )
+    if counts is None:
+      self.stdout.write(f'{user.email} is already on {source}')
+      return
+    
+    self.stdout.write(self.style.SUCCESS(
+      f'Moved {user.email} from {source} to {options["shard"]}: '
+      + ', '.join(f'{count} {name}' for name, count in counts.items())
+    ))
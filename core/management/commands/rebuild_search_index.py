@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core import search, sharding
+
+
+class Command(BaseCommand):
+  """ Django command to rebuild the recipe full-text search index """
+  help = 'Rebuild the recipe full-text search index from the recipe tables'
+  
+  def add_arguments(self, parser):
+    parser.add_argument('--batch-size', type=int, default=20000)
+  
+  def handle(self, *args, **options):
+    if not search.is_enabled():
+      self.stderr.write('The search index is only available on SQLite.')
+      return
+    
+    total = 0
+    # every shard indexes the recipes it holds
+    for using in sharding.shards():
+      def progress(indexed, using=using):
+        self.stdout.write(f'Indexed {indexed} recipes on {using}')
+      
+      total += search.rebuild_index(batch_size=options['batch_size'], progress=progress, using=using)
+    self.stdout.write(self.style.SUCCESS(f'Search index rebuilt with {total} recipes'))
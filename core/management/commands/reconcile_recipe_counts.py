@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core import counters, sharding
+from core.data_version import bump_data_version
+
+
+class Command(BaseCommand):
+  """ Django command to fix drifted recipe counts of tags and ingredients """
+  help = 'Recount the recipes of every tag and ingredient in batches and fix the counters that drifted'
+  
+  def add_arguments(self, parser):
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--dry-run', action='store_true', help='report the drift without fixing it')
+  
+  def handle(self, *args, **options):
+    total = 0
+    for using in sharding.shards():
+      for model in counters.COUNTED:
+        name = model._meta.verbose_name_plural
+        
+        def progress(last_id, drifted, name=name, using=using):
+          self.stdout.write(f'Checked {name} up to id {last_id} on {using}, {drifted} drifted')
+        
+        drifted = counters.reconcile(
+          model, using=using, batch_size=options['batch_size'],
+          dry_run=options['dry_run'], progress=progress,
+        )
+        if not options['dry_run']:
+          # the counts are part of the list responses, so their etags must change
+          for user_id in {user_id for _, user_id in drifted}:
+            bump_data_version(user_id)
+        total += len(drifted)
+    
+    verb = 'Found' if options['dry_run'] else 'Fixed'
+    self.stdout.write(self.style.SUCCESS(f'{verb} {total} drifted recipe counts'))
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import search, seeding, sharding
+
+
+class Command(BaseCommand):
+  """ Django command to fill the database with synthetic users and recipes """
+  help = 'Create users with tags, ingredients and recipes in bulk for load tests'
+  
+  def add_arguments(self, parser):
+    parser.add_argument('users', type=int, help='number of users to create')
+    parser.add_argument('--tags', type=int, default=10, help='tags per user')
+    parser.add_argument('--ingredients', type=int, default=30, help='ingredients per user')
+    parser.add_argument('--recipes', type=int, default=100, help='recipes per user')
+    parser.add_argument('--tags-per-recipe', type=int, default=3)
+    parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+    parser.add_argument('--password', default='password', help='password of every seeded user')
+    parser.add_argument('--email-domain', default='example.com')
+    parser.add_argument('--batch-size', type=int, default=seeding.SEED_BATCH_SIZE)
+    parser.add_argument('--seed', type=int, default=None, help='random seed, for repeatable data')
+    parser.add_argument('--no-index', action='store_true',
+                        help='skip the search index and rebuild it once at the end instead')
+  
+  def handle(self, *args, **options):
+    if options['users'] < 1:
+      raise CommandError('Create at least one user')
+    
+    started = time.monotonic()
+    
+    def progress(counts):
+      rows = sum(counts.values())
+      self.stdout.write(
+        f'{counts["users"]} users, {rows} rows, {rows / (time.monotonic() - started):.0f} rows/s'
+      )
+    
+    counts = seeding.seed(
+      options['users'],
+      tags=options['tags'],
+      ingredients=options['ingredients'],
+      recipes=options['recipes'],
+      tags_per_recipe=options['tags_per_recipe'],
+      ingredients_per_recipe=options['ingredients_per_recipe'],
+      password=options['password'],
+      email_domain=options['email_domain'],
+      batch_size=options['batch_size'],
+      index=not options['no_index'],
+      random_seed=options['seed'],
+      progress=progress,
+    )
+    for using in sharding.shards():
+      if options['no_index']:
+        search.rebuild_index(using=using)
+      # refresh the planner statistics, which the admin also reads its row counts off
+      with connections[using].cursor() as cursor:
+        cursor.execute('ANALYZE')
+    
+    self.stdout.write(self.style.SUCCESS(
+      'Seeded ' + ', '.join(f'{count} {name}' for name, count in counts.items())
+      + f' in {time.monotonic() - started:.1f}s'
+    ))
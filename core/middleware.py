@@ -0,0 +1,183 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from core import compression, instrumentation
+
+
+logger = logging.getLogger('core.instrumentation')
+
+
+# Only the API's data formats are compressed. HTML pages (admin, browsable API)
+# carry CSRF tokens next to reflected input, which compression would expose to
+# BREACH, and already compressed bodies gain nothing from another pass.
+COMPRESSIBLE_TYPES = ('application/json', 'application/msgpack', 'application/x-ndjson')
+
+
+def parse_accept_encoding(header):
+  """ return {coding: q} from an Accept-Encoding header """
+  codings = {}
+  for item in header.split(','):
+    coding, _, params = item.strip().partition(';')
+    coding = coding.strip().lower()
+    if not coding:
+      continue
+    
+    q = 1.0
+    for param in params.split(';'):
+      name, _, value = param.strip().partition('=')
+      if name.strip().lower() == 'q':
+        try:
+          q = float(value)
+        except ValueError:
+          q = 0.0
+    codings[coding] = q
+  return codings
+
+
+class CompressionMiddleware(MiddlewareMixin):
+  """ Compress responses with the best encoding the client accepts
+
+  The client's q-values decide first and the order of COMPRESSION['ENCODINGS']
+  breaks ties. Only COMPRESSION['TYPES'] media types are compressed, and
+  bodies under COMPRESSION['MIN_SIZE'] bytes are sent as they are.
+  Streaming responses are compressed chunk by chunk as they are produced, each
+  chunk flushed so the client can decode it without waiting for the rest.
+  """
+  
+  def __init__(self, get_response):
+    super().__init__(get_response)
+    config = getattr(settings, 'COMPRESSION', {})
+    self.min_size = config.get('MIN_SIZE', 1024)
+    self.encodings = [
+      encoding for encoding in config.get('ENCODINGS', ('zstd', 'br', 'gzip'))
+      if encoding in compression.COMPRESSORS
+    ]
+    self.levels = config.get('LEVELS', {})
+    self.types = tuple(config.get('TYPES', COMPRESSIBLE_TYPES))
+  
+  def select_encoding(self, request):
+    """ return the encoding to use for the request, or None """
+    codings = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    default = codings.get('*', 0.0)
+    best, best_q = None, 0.0
+    for encoding in self.encodings:
+      q = codings.get(encoding, default)
+      if q > best_q:
+        best, best_q = encoding, q
+    return best
+  
+  def process_response(self, request, response):
+    if response.has_header('Content-Encoding'):
+      return response
+    media_type = response.get('Content-Type', '').partition(';')[0].strip().lower()
+    if media_type not in self.types:
+      return response
+    if not response.streaming and len(response.content) < self.min_size:
+      return response
+    
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = self.select_encoding(request)
+    if encoding is None:
+      return response
+    
+    level = self.levels.get(encoding)
+    if response.streaming:
+      if response.is_async:
+        response.streaming_content = compression.acompress_stream(
+          encoding, response.streaming_content, level
+        )
+      else:
+        response.streaming_content = compression.compress_stream(
+          encoding, response.streaming_content, level
+        )
+      # the compressed size is only known once the stream is done
+      del response.headers['Content-Length']
+    else:
+      content = compression.compress(encoding, response.content, level)
+      if len(content) >= len(response.content):
+        return response
+      response.content = content
+      response.headers['Content-Length'] = str(len(content))
+    
+    # the body now differs byte for byte, so a strong etag becomes weak as in GZipMiddleware
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+      response.headers['ETag'] = 'W/' + etag
+    response.headers['Content-Encoding'] = encoding
+    
+    return response
+
+
+class InstrumentationMiddleware:
+  """ Report query count, DB, serializer and view time in a Server-Timing header
+
+  Requests slower than INSTRUMENTATION['SLOW_REQUEST_MS'] or running more than
+  INSTRUMENTATION['SLOW_QUERY_COUNT'] queries are logged as warnings on the
+  core.instrumentation logger with their slowest statements. When
+  INSTRUMENTATION['ENABLED'] is off Django drops the middleware at startup.
+  Streaming bodies are produced after the view returns and are not counted.
+  """
+  sync_capable = True
+  async_capable = True
+  
+  def __init__(self, get_response):
+    config = getattr(settings, 'INSTRUMENTATION', {})
+    if not config.get('ENABLED', False):
+      raise MiddlewareNotUsed
+    
+    self.get_response = get_response
+    self.slow_request = config.get('SLOW_REQUEST_MS', 500) / 1000
+    self.slow_query_count = config.get('SLOW_QUERY_COUNT', 50)
+    self.logged_queries = config.get('LOGGED_QUERIES', 3)
+    instrumentation.enable_query_timing()
+    self.async_mode = iscoroutinefunction(get_response)
+    if self.async_mode:
+      markcoroutinefunction(self)
+  
+  def __call__(self, request):
+    if self.async_mode:
+      return self.__acall__(request)
+    
+    metrics, token = instrumentation.start()
+    started = time.perf_counter()
+    try:
+      response = self.get_response(request)
+    finally:
+      metrics.total = time.perf_counter() - started
+      instrumentation.stop(token)
+    
+    return self.report(request, response, metrics)
+  
+  async def __acall__(self, request):
+    metrics, token = instrumentation.start()
+    started = time.perf_counter()
+    try:
+      response = await self.get_response(request)
+    finally:
+      metrics.total = time.perf_counter() - started
+      instrumentation.stop(token)
+    
+    return self.report(request, response, metrics)
+  
+  def report(self, request, response, metrics):
+    """ add the Server-Timing header and log the request if it was slow """
+    response.headers['Server-Timing'] = metrics.server_timing()
+    
+    if metrics.total >= self.slow_request or len(metrics.queries) > self.slow_query_count:
+      worst = ''.join(
+        f'\n  {duration * 1000:.1f} ms: {sql}'
+        for duration, sql in metrics.worst_queries(self.logged_queries)
+      )
+      logger.warning(
+        'Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms%s',
+        request.method, request.get_full_path(), response.status_code,
+        metrics.total * 1000, len(metrics.queries), metrics.db_time * 1000, worst,
+      )
+    
+    return response
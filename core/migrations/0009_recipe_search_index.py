@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:31
+
+import core.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS core_recipe_fts USING fts5('
+        'title, tags, ingredients, owner, tokenize="unicode61 remove_diacritics 2")'
+    )
+    # rank by bm25 with title matches weighted above tags above ingredients;
+    # owner holds a 'u<user id>' token so searches intersect with one user's rows
+    schema_editor.execute(
+        "INSERT INTO core_recipe_fts(core_recipe_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 2.0, 0.0)')"
+    )
+    schema_editor.execute(
+        "INSERT INTO core_recipe_fts(rowid, title, tags, ingredients, owner) "
+        "SELECT r.id, r.title, "
+        "COALESCE((SELECT group_concat(t.name, ' ') FROM core_recipe_tags rt "
+        "JOIN core_tag t ON t.id = rt.tag_id WHERE rt.recipe_id = r.id), ''), "
+        "COALESCE((SELECT group_concat(i.name, ' ') FROM core_recipe_ingredients ri "
+        "JOIN core_ingredient i ON i.id = ri.ingredient_id WHERE ri.recipe_id = r.id), ''), "
+        "'u' || r.user_id "
+        "FROM core_recipe r"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS core_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_user_name_and_user_id_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchEntry',
+            fields=[
+                ('recipe', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='core.recipe')),
+                ('title', models.TextField()),
+                ('tags', models.TextField()),
+                ('ingredients', models.TextField()),
+                ('owner', models.TextField()),
+                ('document', core.models.SearchDocumentField(db_column='core_recipe_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'core_recipe_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
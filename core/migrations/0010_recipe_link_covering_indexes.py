@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """ Covering (related, recipe) indexes on the recipe through tables
+
+    The auto-created through tables only index (recipe_id, related_id) for
+    lookups from a recipe. These serve the reverse direction (is a tag used,
+    which recipes use it) from the index alone.
+    """
+
+    dependencies = [
+        ('core', '0009_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX core_recipe_tags_tag_recipe_idx ON core_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX core_recipe_tags_tag_recipe_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX core_recipe_ingr_ingr_recipe_idx ON core_recipe_ingredients (ingredient_id, recipe_id)',
+            'DROP INDEX core_recipe_ingr_ingr_recipe_idx',
+        ),
+    ]
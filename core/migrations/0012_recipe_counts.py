@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """ Denormalized recipe counts of tags and ingredients, filled from the through tables """
+
+    dependencies = [
+        ('core', '0011_shard_assignment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            'UPDATE core_tag SET recipe_count = '
+            '(SELECT count(*) FROM core_recipe_tags WHERE tag_id = core_tag.id)',
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            'UPDATE core_ingredient SET recipe_count = '
+            '(SELECT count(*) FROM core_recipe_ingredients WHERE ingredient_id = core_ingredient.id)',
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'recipe_count', 'id'], name='core_ingr_user_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'recipe_count', 'id'], name='core_tag_user_count_idx'),
+        ),
+    ]
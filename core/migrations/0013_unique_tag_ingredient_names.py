@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """ Relink the recipes of repeated (user, name) rows to the oldest one and drop the others """
+    using = schema_editor.connection.alias
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, relation in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, relation).through
+        column = f'{model_name.lower()}_id'
+        duplicates = (
+            model.objects.using(using).values('user_id', 'name')
+            .annotate(keep=models.Min('id'), rows=models.Count('id')).filter(rows__gt=1)
+        )
+        for group in duplicates:
+            keep = group['keep']
+            others = list(
+                model.objects.using(using)
+                .filter(user_id=group['user_id'], name=group['name']).exclude(id=keep)
+                .values_list('id', flat=True)
+            )
+            for other in others:
+                links = through.objects.using(using).filter(**{column: other})
+                kept = through.objects.using(using).filter(**{column: keep}).values('recipe_id')
+                links.filter(recipe_id__in=kept).delete()
+                links.update(**{column: keep})
+            model.objects.using(using).filter(id__in=others).delete()
+            model.objects.using(using).filter(id=keep).update(
+                recipe_count=through.objects.using(using).filter(**{column: keep}).count()
+            )
+
+
+class Migration(migrations.Migration):
+    """ One tag and one ingredient per (user, name), so concurrent creates can't duplicate them
+
+    The unique constraints' indexes replace the plain (user, name) ones.
+    """
+
+    dependencies = [
+        ('core', '0012_recipe_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='core_ingr_user_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='core_tag_user_name_uniq'),
+        ),
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='core_ingr_user_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='tag',
+            name='core_tag_user_name_idx',
+        ),
+    ]
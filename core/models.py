@@ -1,7 +1,10 @@
+import sys
+
 from django.db import models
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, PermissionsMixin
 
 from django.conf import settings
+from core.images import IMAGE_DIR
 # Create your models here.
 
 
@@ -42,30 +45,217 @@ class User(AbstractBaseUser, PermissionsMixin):
   # Into the settings.py   AUTH_USER_MODEL = 'core.User'
 
 
-class Tag(models.Model):
+class ShardAssignment(models.Model):
+  """ The shard map entry of a user, kept on the default database (see core.sharding) """
+  user = models.OneToOneField(
+    settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='shard_assignment'
+  )
+  alias = models.CharField(max_length=100)
+  # writes are refused while the user's rows are copied to another shard
+  moving = models.BooleanField(default=False)
+
+
+class IdSequence(models.Model):
+  """ The last id handed out for a sharded model, kept on the default database (see core.sharding) """
+  name = models.CharField(max_length=100, primary_key=True)
+  last_id = models.BigIntegerField(default=0)
+
+
+class ShardedModel(models.Model):
+  """ A model stored on the shard of its owner, numbered across all shards while sharding is on """
+  
+  class Meta:
+    abstract = True
+  
+  def save(self, *args, **kwargs):
+    from core import sharding
+    
+    if self._state.adding and self.pk is None and sharding.is_enabled():
+      sharding.assign_ids([self])
+      # the id is new, so there is no row to try an UPDATE on first
+      kwargs['force_insert'] = True
+    super().save(*args, **kwargs)
+
+
+class UserOwnedQuerySet(models.QuerySet):
+  
+  def bulk_create(self, objs, *args, **kwargs):
+    from core import sharding
+    
+    objs = list(objs)
+    sharding.assign_ids(objs)
+    return super().bulk_create(objs, *args, **kwargs)
+  
+  def for_user(self, user):
+    """ return the rows of a user, read from the shard that holds them """
+    from core import sharding
+    
+    queryset = self
+    if sharding.is_enabled():
+      queryset = queryset.using(sharding.db_for_user(user.pk))
+    return queryset.filter(user=user)
+
+
+class NamedQuerySet(UserOwnedQuerySet):
+  
+  def resolve_names(self, user_id, names):
+    """ return {name: object} of a user's names, inserting the missing ones
+
+    One query finds the existing rows and one upsert inserts the rest: a row a
+    concurrent request inserted meanwhile is matched on the (user, name)
+    constraint and returned instead of failing the insert.
+    """
+    from core import sharding
+    
+    names = set(names)
+    if not names:
+      return {}
+    
+    found = {obj.name: obj for obj in self.filter(user_id=user_id, name__in=names)}
+    missing = names.difference(found)
+    if missing:
+      created = self.bulk_create(
+        [self.model(user_id=user_id, name=name) for name in sorted(missing)],
+        update_conflicts=True, unique_fields=['user', 'name'], update_fields=['name'],
+      )
+      if sharding.is_enabled():
+        # the ids were handed out before the insert, a row matched on the constraint keeps its own
+        created = self.filter(user_id=user_id, name__in=missing)
+      found.update((obj.name, obj) for obj in created)
+    
+    return found
+
+
+class Tag(ShardedModel):
   name = models.CharField(max_length=250)
   user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete= models.CASCADE)
+  # recipes linked to the tag, maintained by core.counters
+  recipe_count = models.PositiveIntegerField(default=0)
+  
+  objects = NamedQuerySet.as_manager()
+  
+  class Meta:
+    # also the (user, name) index the name ordering and lookups use
+    constraints = [
+      models.UniqueConstraint(fields=['user', 'name'], name='core_tag_user_name_uniq'),
+    ]
+    indexes = [
+      models.Index(fields=['user', 'recipe_count', 'id'], name='core_tag_user_count_idx'),
+    ]
   
   def __str__(self):
     return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(ShardedModel):
   name = models.CharField(max_length=250)
   user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+  # recipes using the ingredient, maintained by core.counters
+  recipe_count = models.PositiveIntegerField(default=0)
+  
+  objects = NamedQuerySet.as_manager()
+  
+  class Meta:
+    # also the (user, name) index the name ordering and lookups use
+    constraints = [
+      models.UniqueConstraint(fields=['user', 'name'], name='core_ingr_user_name_uniq'),
+    ]
+    indexes = [
+      models.Index(fields=['user', 'recipe_count', 'id'], name='core_ingr_user_count_idx'),
+    ]
   
   def __str__(self):
     return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(UserOwnedQuerySet):
+  
+  def with_relations(self):
+    """ Prefetch tags and ingredients ordered by id """
+    tags = Tag.objects.order_by('id')
+    ingredients = Ingredient.objects.order_by('id')
+    return self.prefetch_related(
+      models.Prefetch('tags', queryset=tags),
+      models.Prefetch('ingredients', queryset=ingredients),
+    )
+
+
+class Recipe(ShardedModel):
   user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
   title = models.CharField(max_length=255)
   time_minutes = models.IntegerField()
   price = models.DecimalField(max_digits=5, decimal_places=2)
   link = models.CharField(max_length=255, blank=True)
+  # content addressed name, written by core.images.store and shared by recipes with the same picture
+  image = models.FileField(upload_to=IMAGE_DIR, blank=True)
   tags = models.ManyToManyField('Tag')
   ingredients = models.ManyToManyField('Ingredient')
   
+  objects = RecipeQuerySet.as_manager()
+  
+  class Meta:
+    indexes = [
+      models.Index(fields=['user', 'id'], name='core_recipe_user_id_idx'),
+    ]
+  
   def __str__(self):
-    return self.title
\ No newline at end of file
+    return self.title
+
+
+class SearchDocumentField(models.TextField):
+  """ The hidden FTS5 column named after its table, which MATCH queries run against """
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+  lookup_name = 'match'
+  
+  def as_sql(self, compiler, connection):
+    lhs, lhs_params = self.process_lhs(compiler, connection)
+    rhs, rhs_params = self.process_rhs(compiler, connection)
+    return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+
+@models.CharField.register_lookup
+class Prefix(models.Lookup):
+  """ Case sensitive startswith as a range, so it can seek an index on the column
+
+  LIKE on SQLite ignores case and so cannot use the default binary collated
+  indexes, name__prefix='Sal' is name >= 'Sal' AND name < 'Sam' and can.
+  """
+  lookup_name = 'prefix'
+  
+  def as_sql(self, compiler, connection):
+    lhs, lhs_params = self.process_lhs(compiler, connection)
+    prefix = str(self.rhs)
+    # the least string after every string that starts with prefix
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+      return f'{lhs} >= %s', (*lhs_params, prefix)
+    
+    following = ord(stem[-1]) + 1
+    # surrogates cannot be encoded, the next character that can is U+E000
+    upper = stem[:-1] + chr(0xE000 if 0xD800 <= following < 0xE000 else following)
+    return f'({lhs} >= %s AND {lhs} < %s)', (*lhs_params, prefix, *lhs_params, upper)
+
+
+class RecipeSearchEntry(models.Model):
+  """ Row of the core_recipe_fts full-text index over a recipe's title, tag and ingredient names """
+  recipe = models.OneToOneField(
+    Recipe,
+    primary_key=True,
+    db_column='rowid',
+    db_constraint=False,
+    on_delete=models.DO_NOTHING,
+    related_name='search_entry',
+  )
+  title = models.TextField()
+  tags = models.TextField()
+  ingredients = models.TextField()
+  owner = models.TextField()
+  document = SearchDocumentField(db_column='core_recipe_fts')
+  rank = models.FloatField()
+  
+  class Meta:
+    managed = False
+    db_table = 'core_recipe_fts'
@@ -0,0 +1,92 @@
+""" Faster JSON and MessagePack renderers and parsers for the API
+
+orjson and msgpack are optional. Without orjson the JSON classes fall back to
+DRF's stdlib implementation, and the MessagePack classes are only registered
+in the settings when msgpack is installed.
+"""
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import get_encoding
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+
+# DRF's own fallback for Decimals (float), datetimes, lazy strings and so on,
+# so every media type renders those values exactly as the stdlib renderer did
+_default = JSONEncoder().default
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+  """ Render JSON with orjson, byte for byte like DRF's JSONRenderer """
+  
+  def render(self, data, accepted_media_type=None, renderer_context=None):
+    if data is None:
+      return b''
+    
+    # orjson only pretty prints with two spaces, so indented output keeps the stdlib path
+    if orjson is None or self.ensure_ascii or not self.compact or self.get_indent(
+      accepted_media_type, renderer_context or {}
+    ) is not None:
+      return super().render(data, accepted_media_type, renderer_context)
+    
+    try:
+      ret = orjson.dumps(
+        data, default=_default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+      )
+    except orjson.JSONEncodeError:
+      # integers past 64 bits and the like
+      return super().render(data, accepted_media_type, renderer_context)
+    
+    # keep the output a strict javascript subset, as the stdlib renderer does
+    return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONParser(parsers.JSONParser):
+  """ Parse JSON request bodies with orjson """
+  renderer_class = ORJSONRenderer
+  
+  def parse(self, stream, media_type=None, parser_context=None):
+    encoding = get_encoding(parser_context or {})
+    if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+      return super().parse(stream, media_type, parser_context)
+    
+    try:
+      return orjson.loads(stream.read())
+    except orjson.JSONDecodeError as exc:
+      raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+  """ Render MessagePack, with the same value conversions as the JSON renderer """
+  media_type = 'application/msgpack'
+  format = 'msgpack'
+  charset = None
+  render_style = 'binary'
+  
+  def render(self, data, accepted_media_type=None, renderer_context=None):
+    if data is None:
+      return b''
+    
+    return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+class MessagePackParser(parsers.BaseParser):
+  """ Parse MessagePack request bodies """
+  media_type = 'application/msgpack'
+  renderer_class = MessagePackRenderer
+  
+  def parse(self, stream, media_type=None, parser_context=None):
+    try:
+      return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+    except (ValueError, msgpack.UnpackException) as exc:
+      raise ParseError('MessagePack parse error - %s' % str(exc))
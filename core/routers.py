@@ -0,0 +1,82 @@
+""" Read/write splitting between the primary database and its replicas
+
+Writes always go to the primary. Reads go to the primary too unless a view has
+opted the current request into replica reads with allow_replica_reads(), which
+it does for safe methods only. A user who wrote within the last
+REPLICA_STICKINESS_SECONDS keeps reading from the primary, so replication lag
+shorter than that window never hides their own writes from them.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+PRIMARY = DEFAULT_DB_ALIAS
+
+# the replica the current request reads from, None for the primary
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replicas():
+  return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def _write_key(user_id):
+  return f'core:recent-write:{user_id}'
+
+
+def record_write(user_id):
+  """ Keep the user's reads on the primary for the stickiness window """
+  cache.set(_write_key(user_id), True, settings.REPLICA_STICKINESS_SECONDS)
+
+
+async def arecord_write(user_id):
+  await cache.aset(_write_key(user_id), True, settings.REPLICA_STICKINESS_SECONDS)
+
+
+def allow_replica_reads(user_id):
+  """ Let the current request read from a replica, unless the user wrote recently
+
+  One replica serves all the request's queries, so they all see the same lag.
+  return a token for reset_replica_reads()
+  """
+  alias = None
+  if replicas() and not cache.get(_write_key(user_id), False):
+    alias = random.choice(replicas())
+  return _read_alias.set(alias)
+
+
+async def aallow_replica_reads(user_id):
+  """ async variant of allow_replica_reads """
+  alias = None
+  if replicas() and not await cache.aget(_write_key(user_id), False):
+    alias = random.choice(replicas())
+  return _read_alias.set(alias)
+
+
+def reset_replica_reads(token):
+  _read_alias.reset(token)
+
+
+class ReplicaRouter:
+  """ Send writes to the primary and the reads of opted-in requests to their replica """
+  
+  def db_for_read(self, model, **hints):
+    instance = hints.get('instance')
+    if instance is not None and instance._state.db:
+      # related lookups follow the object they start from
+      return instance._state.db
+    
+    return _read_alias.get() or PRIMARY
+  
+  def db_for_write(self, model, **hints):
+    return PRIMARY
+  
+  def allow_relation(self, obj1, obj2, **hints):
+    databases = {PRIMARY, *replicas()}
+    if obj1._state.db in databases and obj2._state.db in databases:
+      return True
+    return None
@@ -0,0 +1,159 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import F, Func, Q, Value, FloatField, IntegerField
+
+from core.db import write_atomic
+from core.models import Recipe
+
+
+SEARCH_TABLE = 'core_recipe_fts'
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_enabled(using=DEFAULT_DB_ALIAS):
+  """ The FTS5 index only exists on SQLite """
+  return connections[using].vendor == 'sqlite'
+
+
+def _database(using):
+  """ return the alias the index of the current user lives on when using is not given """
+  return using or router.db_for_write(Recipe)
+
+
+def owner_token(user_id):
+  return f'u{user_id}'
+
+
+def build_match_query(text, user_id=None):
+  """ Turn free text into an FTS5 query matching every word as a prefix of a title, tag or ingredient """
+  words = WORD_RE.findall(text)
+  if not words:
+    return ''
+  
+  # the user's words never match the owner column, or "u1" would find every recipe of user 1
+  query = '{title tags ingredients}: (' + ' '.join(f'"{word}"*' for word in words) + ')'
+  if user_id is not None:
+    query = f'owner:"{owner_token(user_id)}" AND ({query})'
+  
+  return query
+
+
+class Unindexed(Func):
+  """ Unary plus, which stops SQLite from using an index for the wrapped column """
+  template = '+%(expressions)s'
+  output_field = IntegerField()
+
+
+def search_recipes(queryset, text, user_id=None):
+  """ Filter recipes to those matching text, annotated with a rank (lower is better)
+
+  Pass a queryset that is not filtered by user and the owner's user_id instead:
+  the owner is then matched inside the index and the recipe side check can't use
+  the user index, so SQLite drives the query from the full-text match rather
+  than re-running the match for every one of the user's recipes.
+  """
+  query = build_match_query(text, user_id)
+  if not query:
+    return queryset.none()
+  
+  if user_id is not None:
+    queryset = queryset.alias(owner_id=Unindexed(F('user_id'))).filter(owner_id=user_id)
+  
+  if not is_enabled(queryset.db):
+    matches = Q()
+    for word in WORD_RE.findall(text):
+      matches &= (
+        Q(title__icontains=word) |
+        Q(tags__name__icontains=word) |
+        Q(ingredients__name__icontains=word)
+      )
+    return queryset.filter(matches).distinct().annotate(rank=Value(0.0, output_field=FloatField()))
+  
+  return queryset.filter(search_entry__document__match=query).annotate(rank=F('search_entry__rank'))
+
+
+def _document_select(where):
+  """ SQL selecting index rows (id, title, tag names, ingredient names, owner) for recipes matching where """
+  recipe = Recipe._meta.db_table
+  tag_links = Recipe.tags.through._meta.db_table
+  ingredient_links = Recipe.ingredients.through._meta.db_table
+  tag = Recipe.tags.field.related_model._meta.db_table
+  ingredient = Recipe.ingredients.field.related_model._meta.db_table
+  return (
+    f"SELECT r.id, r.title, "
+    f"COALESCE((SELECT group_concat(t.name, ' ') FROM {tag_links} rt "
+    f"JOIN {tag} t ON t.id = rt.tag_id WHERE rt.recipe_id = r.id), ''), "
+    f"COALESCE((SELECT group_concat(i.name, ' ') FROM {ingredient_links} ri "
+    f"JOIN {ingredient} i ON i.id = ri.ingredient_id WHERE ri.recipe_id = r.id), ''), "
+    f"'u' || r.user_id "
+    f"FROM {recipe} r WHERE {where}"
+  )
+
+
+INSERT_SQL = f'INSERT INTO {SEARCH_TABLE}(rowid, title, tags, ingredients, owner) '
+
+
+def _chunks(items, size):
+  for start in range(0, len(items), size):
+    yield items[start:start + size]
+
+
+def remove_recipes(recipe_ids, batch_size=500, using=None):
+  """ Drop recipes from the index """
+  using = _database(using)
+  if not is_enabled(using):
+    return
+  
+  with transaction.atomic(using=using), connections[using].cursor() as cursor:
+    for chunk in _chunks(list(recipe_ids), batch_size):
+      placeholders = ', '.join(['%s'] * len(chunk))
+      cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', chunk)
+
+
+def index_recipes(recipe_ids, batch_size=500, using=None):
+  """ (Re)index recipes from their current title, tag and ingredient names """
+  using = _database(using)
+  if not is_enabled(using):
+    return
+  
+  recipe_ids = list(recipe_ids)
+  with transaction.atomic(using=using), connections[using].cursor() as cursor:
+    for chunk in _chunks(recipe_ids, batch_size):
+      placeholders = ', '.join(['%s'] * len(chunk))
+      cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', chunk)
+      cursor.execute(INSERT_SQL + _document_select(f'r.id IN ({placeholders})'), chunk)
+
+
+def rebuild_index(batch_size=20000, progress=None, using=DEFAULT_DB_ALIAS):
+  """ Rebuild the whole index of one database in id order, one batch of recipes per transaction """
+  if not is_enabled(using):
+    return 0
+  
+  connection = connections[using]
+  with connection.cursor() as cursor:
+    cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+  
+  indexed = 0
+  last_id = 0
+  while True:
+    with write_atomic(using=using), connection.cursor() as cursor:
+      cursor.execute(
+        f'SELECT count(*), max(id) FROM (SELECT id FROM {Recipe._meta.db_table} '
+        f'WHERE id > %s ORDER BY id LIMIT %s)',
+        [last_id, batch_size],
+      )
+      count, max_id = cursor.fetchone()
+      if not count:
+        break
+      cursor.execute(INSERT_SQL + _document_select('r.id > %s AND r.id <= %s'), [last_id, max_id])
+    
+    indexed += count
+    last_id = max_id
+    if progress is not None:
+      progress(indexed)
+  
+  with connection.cursor() as cursor:
+    cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+  
+  return indexed
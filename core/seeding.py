@@ -0,0 +1,132 @@
+""" Bulk synthetic data for load tests and local runs at production scale
+
+Everything is written with bulk_create, the M2M through tables included, one
+transaction per batch of users and shard. The password is hashed once and shared by all
+seeded users, so the cost is the inserts and not PBKDF2.
+"""
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from core import counters, search, sharding
+from core.models import Tag, Ingredient, Recipe
+
+
+SEED_BATCH_SIZE = 5000
+
+TAG_NAMES = (
+  'Vegan', 'Vegetarian', 'Dessert', 'Breakfast', 'Dinner', 'Lunch', 'Quick', 'Spicy',
+  'Gluten free', 'Comfort food', 'Healthy', 'Party', 'Baking', 'Grill', 'Soup', 'Salad',
+)
+INGREDIENT_NAMES = (
+  'Salt', 'Pepper', 'Olive oil', 'Garlic', 'Onion', 'Tomato', 'Chicken', 'Beef', 'Rice',
+  'Pasta', 'Flour', 'Sugar', 'Butter', 'Eggs', 'Milk', 'Cheese', 'Lemon', 'Basil',
+  'Ginger', 'Chili', 'Potato', 'Carrot', 'Spinach', 'Mushroom', 'Cream', 'Honey',
+)
+TITLE_WORDS = (
+  ('Spicy', 'Creamy', 'Roasted', 'Grilled', 'Quick', 'Classic', 'Smoky', 'Crispy', 'Slow cooked'),
+  ('chicken', 'beef', 'tofu', 'salmon', 'vegetable', 'mushroom', 'lentil', 'prawn', 'bean'),
+  ('curry', 'stew', 'pasta', 'salad', 'soup', 'pie', 'tacos', 'risotto', 'stir fry'),
+)
+
+
+def names(base, count):
+  """ return count distinct names, numbering the base names once they run out """
+  return [
+    base[i % len(base)] if i < len(base) else f'{base[i % len(base)]} {i // len(base) + 1}'
+    for i in range(count)
+  ]
+
+
+def seed(users, tags=10, ingredients=30, recipes=100, tags_per_recipe=3, ingredients_per_recipe=8,
+         password='password', email_domain='example.com', batch_size=SEED_BATCH_SIZE,
+         index=True, random_seed=None, progress=None):
+  """ Create users with their tags, ingredients and recipes and return the row counts
+
+  Every recipe links to up to tags_per_recipe of its owner's tags and between
+  one and ingredients_per_recipe of their ingredients. Users are numbered after
+  the ones already in the database, so seeding twice adds more users.
+  """
+  User = get_user_model()
+  TagLink = Recipe.tags.through
+  IngredientLink = Recipe.ingredients.through
+  rng = random.Random(random_seed)
+  hashed = make_password(password)
+  tag_names = names(TAG_NAMES, tags)
+  ingredient_names = names(INGREDIENT_NAMES, ingredients)
+  counts = dict.fromkeys(('users', 'tags', 'ingredients', 'recipes', 'recipe_tags', 'recipe_ingredients'), 0)
+  
+  # about batch_size rows of the largest table per transaction
+  users_per_batch = max(1, batch_size // max(tags, ingredients, recipes, 1))
+  first = User.objects.count()
+  for start in range(first, first + users, users_per_batch):
+    stop = min(start + users_per_batch, first + users)
+    with transaction.atomic():
+      owners = User.objects.bulk_create([
+        User(email=f'user{n}@{email_domain}', name=f'user {n}', password=hashed)
+        for n in range(start, stop)
+      ], batch_size=batch_size)
+      if sharding.is_enabled():
+        # bulk inserts skip the post_save placing a new user, so place them here
+        placed = sharding.assign_users([owner.pk for owner in owners])
+      else:
+        placed = {DEFAULT_DB_ALIAS: [owner.pk for owner in owners]}
+    counts['users'] += len(owners)
+    
+    owners_by_id = {owner.pk: owner for owner in owners}
+    for using, owner_ids in placed.items():
+      shard_owners = [owners_by_id[owner_id] for owner_id in owner_ids]
+      with transaction.atomic(using=using):
+        user_tags = Tag.objects.using(using).bulk_create([
+          Tag(user=owner, name=name) for owner in shard_owners for name in tag_names
+        ], batch_size=batch_size)
+        user_ingredients = Ingredient.objects.using(using).bulk_create([
+          Ingredient(user=owner, name=name) for owner in shard_owners for name in ingredient_names
+        ], batch_size=batch_size)
+        user_recipes = Recipe.objects.using(using).bulk_create([
+          Recipe(
+            user=owner,
+            title=' '.join(rng.choice(words) for words in TITLE_WORDS),
+            time_minutes=rng.randint(5, 240),
+            price=f'{rng.randint(1, 99)}.{rng.choice(("00", "50", "99"))}',
+          )
+          for owner in shard_owners for _ in range(recipes)
+        ], batch_size=batch_size)
+        
+        tag_links = []
+        ingredient_links = []
+        for position, recipe in enumerate(user_recipes):
+          owner_index = position // recipes
+          owner_tags = user_tags[owner_index * tags:(owner_index + 1) * tags]
+          owner_ingredients = user_ingredients[owner_index * ingredients:(owner_index + 1) * ingredients]
+          tag_links.extend(
+            TagLink(recipe_id=recipe.id, tag_id=tag.id)
+            for tag in rng.sample(owner_tags, rng.randint(0, min(tags_per_recipe, tags)))
+          )
+          ingredient_links.extend(
+            IngredientLink(recipe_id=recipe.id, ingredient_id=ingredient.id)
+            for ingredient in rng.sample(
+              owner_ingredients, rng.randint(min(1, ingredients), min(ingredients_per_recipe, ingredients))
+            )
+          )
+        TagLink.objects.using(using).bulk_create(tag_links, batch_size=batch_size)
+        IngredientLink.objects.using(using).bulk_create(ingredient_links, batch_size=batch_size)
+        # the owners are new, so counting their rows' links from scratch is exact
+        for model in counters.COUNTED:
+          model.objects.using(using).filter(user_id__in=owner_ids).update(
+            recipe_count=counters.actual_count(model)
+          )
+        if index:
+          search.index_recipes([recipe.id for recipe in user_recipes], batch_size=batch_size, using=using)
+      
+      counts['tags'] += len(user_tags)
+      counts['ingredients'] += len(user_ingredients)
+      counts['recipes'] += len(user_recipes)
+      counts['recipe_tags'] += len(tag_links)
+      counts['recipe_ingredients'] += len(ingredient_links)
+    if progress is not None:
+      progress(counts)
+  
+  return counts
@@ -0,0 +1,363 @@
+""" Horizontal sharding of user owned data by user id
+
+Users, tokens and the shard map stay on the default database. A user's tags,
+ingredients and recipes, their links and search index rows live together on
+one shard, so every query of a request still runs against a single database.
+
+The shard map is the ShardAssignment table: new users are assigned round robin
+by id over SHARDING['NEW_USERS'], users without a row live on 'default' (they
+predate sharding), and move_user() rebalances one user at a time while the
+site is up. Lookups are cached in the shared cache for SHARDING['CACHE_SECONDS'],
+except the moving flag the write paths check, which is always read from
+'default': with a per process cache another worker could otherwise keep
+writing to the source of a move.
+
+Tags, ingredients and recipes keep their ids when their user moves. SQLite
+numbers new rows past the largest id in the table, so a shard cannot keep to
+a range of its own once it holds moved rows; while sharding is on their ids
+come from one IdSequence counter per model on 'default' instead.
+
+Every shard holds a stub row for each of its users so the user foreign keys
+keep their constraints; the stub has an unusable password and a placeholder
+email and is never authenticated against.
+
+Sharding is off while SHARDING['SHARDS'] is only 'default': nothing is looked
+up then and ShardRouter leaves every model to the next router.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Max
+
+from core.data_version import bump_data_version
+
+
+# the shard of the user the current request or command works for
+_current = ContextVar('shard', default=None)
+
+# models stored on the shard of their owner
+SHARDED_MODELS = (
+  'core.tag', 'core.ingredient', 'core.recipe',
+  'core.recipe_tags', 'core.recipe_ingredients', 'core.recipesearchentry',
+)
+
+MOVE_BATCH_SIZE = 1000
+
+
+def shards():
+  return settings.SHARDING['SHARDS']
+
+
+def is_enabled():
+  return shards() != [DEFAULT_DB_ALIAS]
+
+
+def is_sharded(model):
+  return model._meta.label_lower in SHARDED_MODELS
+
+
+def new_user_shard(user_id):
+  """ return the shard a new user is placed on """
+  candidates = settings.SHARDING.get('NEW_USERS') or shards()
+  return candidates[user_id % len(candidates)]
+
+
+def _assignment_key(user_id):
+  return f'core:shard:{user_id}'
+
+
+def _assignment_model():
+  return apps.get_model('core', 'ShardAssignment')
+
+
+def get_assignment(user_id, cached=True):
+  """ return (shard alias, moving) of a user, read from 'default' and cached again unless cached """
+  key = _assignment_key(user_id)
+  assignment = cache.get(key) if cached else None
+  if assignment is None:
+    row = (
+      _assignment_model().objects.using(DEFAULT_DB_ALIAS)
+      .filter(user_id=user_id).values_list('alias', 'moving').first()
+    )
+    assignment = tuple(row) if row else (DEFAULT_DB_ALIAS, False)
+    cache.set(key, assignment, settings.SHARDING['CACHE_SECONDS'])
+  
+  return assignment
+
+
+async def aget_assignment(user_id, cached=True):
+  """ async variant of get_assignment """
+  key = _assignment_key(user_id)
+  assignment = await cache.aget(key) if cached else None
+  if assignment is None:
+    row = await (
+      _assignment_model().objects.using(DEFAULT_DB_ALIAS)
+      .filter(user_id=user_id).values_list('alias', 'moving').afirst()
+    )
+    assignment = tuple(row) if row else (DEFAULT_DB_ALIAS, False)
+    await cache.aset(key, assignment, settings.SHARDING['CACHE_SECONDS'])
+  
+  return assignment
+
+
+def forget_assignment(user_id):
+  cache.delete(_assignment_key(user_id))
+
+
+def db_for_user(user_id):
+  """ return the database alias holding a user's data """
+  if not is_enabled():
+    return DEFAULT_DB_ALIAS
+  return get_assignment(user_id)[0]
+
+
+async def adb_for_user(user_id):
+  """ async variant of db_for_user """
+  if not is_enabled():
+    return DEFAULT_DB_ALIAS
+  return (await aget_assignment(user_id))[0]
+
+
+def is_moving(user_id):
+  """ return whether a user's data is being copied to another shard
+
+  Read past the cache, which also refreshes the user's shard for the request.
+  """
+  return is_enabled() and get_assignment(user_id, cached=False)[1]
+
+
+async def ais_moving(user_id):
+  """ async variant of is_moving """
+  return is_enabled() and (await aget_assignment(user_id, cached=False))[1]
+
+
+def allocate_ids(model, count):
+  """ Reserve count ids of a sharded model that no shard uses, return them as a range """
+  IdSequence = apps.get_model('core', 'IdSequence')
+  sequences = IdSequence.objects.using(DEFAULT_DB_ALIAS).filter(name=model._meta.label_lower)
+  with transaction.atomic(using=DEFAULT_DB_ALIAS):
+    if not sequences.update(last_id=F('last_id') + count):
+      # the counter starts past the rows numbered by the shards before it existed
+      start = max(
+        model._base_manager.using(alias).aggregate(last_id=Max('id'))['last_id'] or 0 for alias in shards()
+      )
+      IdSequence.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+        [IdSequence(name=model._meta.label_lower, last_id=start)], ignore_conflicts=True
+      )
+      sequences.update(last_id=F('last_id') + count)
+    last_id = sequences.values_list('last_id', flat=True).get()
+  
+  return range(last_id - count + 1, last_id + 1)
+
+
+def assign_ids(objs):
+  """ Give the new objects of one sharded model their ids from allocate_ids while sharding is on """
+  new = [obj for obj in objs if obj.pk is None]
+  if not new or not is_enabled():
+    return
+  
+  for obj, pk in zip(new, allocate_ids(type(new[0]), len(new))):
+    obj.pk = pk
+
+
+def activate(alias):
+  """ Route unhinted queries of the sharded models to alias, return a token for deactivate() """
+  return _current.set(alias)
+
+
+def deactivate(token):
+  _current.reset(token)
+
+
+@contextmanager
+def use_shard_for(user_id):
+  """ Route the sharded models to the user's shard inside the block """
+  token = activate(db_for_user(user_id) if is_enabled() else None)
+  try:
+    yield
+  finally:
+    deactivate(token)
+
+
+def create_stub_users(user_ids, alias):
+  """ Insert the stub rows the user foreign keys of a shard point at """
+  if alias == DEFAULT_DB_ALIAS:
+    return
+  
+  User = apps.get_model(settings.AUTH_USER_MODEL)
+  User.objects.using(alias).bulk_create([
+    User(pk=user_id, email=f'user-{user_id}@shard.invalid', password='!', is_active=False)
+    for user_id in user_ids
+  ], ignore_conflicts=True)
+
+
+def assign_users(user_ids):
+  """ Place new users on their shards, return {alias: [user ids]} """
+  placed = {}
+  for user_id in user_ids:
+    placed.setdefault(new_user_shard(user_id), []).append(user_id)
+  
+  _assignment_model().objects.using(DEFAULT_DB_ALIAS).bulk_create([
+    _assignment_model()(user_id=user_id, alias=alias)
+    for alias, ids in placed.items() for user_id in ids
+  ])
+  for alias, ids in placed.items():
+    create_stub_users(ids, alias)
+  for user_id in user_ids:
+    forget_assignment(user_id)
+  
+  return placed
+
+
+def copy_user_data(user_id, source, target, batch_size=MOVE_BATCH_SIZE):
+  """ Copy a user's rows from source to target in one target transaction, return the row counts
+
+  The rows keep their ids, which are unique across the shards, so client held
+  ids and links stay valid; only the link rows are numbered anew.
+  """
+  from core import search
+  
+  Tag = apps.get_model('core', 'Tag')
+  Ingredient = apps.get_model('core', 'Ingredient')
+  Recipe = apps.get_model('core', 'Recipe')
+  TagLink = Recipe.tags.through
+  IngredientLink = Recipe.ingredients.through
+  counts = dict.fromkeys(('tags', 'ingredients', 'recipes', 'recipe_tags', 'recipe_ingredients'), 0)
+  
+  with transaction.atomic(using=target):
+    create_stub_users([user_id], target)
+    for name, model in (('tags', Tag), ('ingredients', Ingredient)):
+      rows = model.objects.using(source).filter(user_id=user_id).order_by('id').values(
+        'id', 'name', 'user_id', 'recipe_count'
+      )
+      objs = model.objects.using(target).bulk_create([model(**row) for row in rows], batch_size=batch_size)
+      counts[name] = len(objs)
+    
+    recipes = Recipe.objects.using(source).filter(user_id=user_id).order_by('id').values(
+      'id', 'user_id', 'title', 'time_minutes', 'price', 'link', 'image'
+    )
+    last_id = 0
+    while True:
+      rows = list(recipes.filter(id__gt=last_id)[:batch_size])
+      if not rows:
+        break
+      last_id = rows[-1]['id']
+      recipe_ids = [row['id'] for row in rows]
+      Recipe.objects.using(target).bulk_create([Recipe(**row) for row in rows], batch_size=batch_size)
+      tag_links = [
+        TagLink(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id, tag_id in TagLink.objects.using(source)
+        .filter(recipe_id__in=recipe_ids).values_list('recipe_id', 'tag_id')
+      ]
+      ingredient_links = [
+        IngredientLink(recipe_id=recipe_id, ingredient_id=ingredient_id)
+        for recipe_id, ingredient_id in IngredientLink.objects.using(source)
+        .filter(recipe_id__in=recipe_ids).values_list('recipe_id', 'ingredient_id')
+      ]
+      TagLink.objects.using(target).bulk_create(tag_links, batch_size=batch_size)
+      IngredientLink.objects.using(target).bulk_create(ingredient_links, batch_size=batch_size)
+      search.index_recipes(recipe_ids, using=target)
+      counts['recipes'] += len(recipe_ids)
+      counts['recipe_tags'] += len(tag_links)
+      counts['recipe_ingredients'] += len(ingredient_links)
+  
+  return counts
+
+
+def delete_user_data(user_id, using):
+  """ Delete a user's rows from one database, the user row itself excepted on 'default' """
+  if using != DEFAULT_DB_ALIAS:
+    apps.get_model(settings.AUTH_USER_MODEL).objects.using(using).filter(pk=user_id).delete()
+    return
+  
+  for name in ('Recipe', 'Tag', 'Ingredient'):
+    apps.get_model('core', name).objects.using(using).filter(user_id=user_id).delete()
+
+
+def move_user(user_id, target, batch_size=MOVE_BATCH_SIZE, grace=None):
+  """ Move a user's data to the target shard while the site keeps serving, return the row counts
+
+  The user is marked as moving first: from then on their write requests are
+  refused with 503 while reads carry on from the source. After a grace period
+  for writes already in flight the rows are copied and the shard map is
+  switched to the target. The source copy is deleted after a second grace
+  period, once no process can still read it through a cached shard map entry;
+  both last at least SHARDING['CACHE_SECONDS'].
+  """
+  if target not in shards():
+    raise ValueError(f'{target!r} is not one of the shards {shards()}')
+  
+  ShardAssignment = _assignment_model()
+  source = db_for_user(user_id)
+  if source == target:
+    return None
+  
+  ShardAssignment.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+    user_id=user_id, defaults={'alias': source, 'moving': True}
+  )
+  forget_assignment(user_id)
+  grace = settings.SHARDING['MOVE_GRACE_SECONDS'] if grace is None else grace
+  grace = max(grace, settings.SHARDING['CACHE_SECONDS'])
+  try:
+    if grace:
+      time.sleep(grace)
+    counts = copy_user_data(user_id, source, target, batch_size=batch_size)
+    ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).update(alias=target)
+  finally:
+    ShardAssignment.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).update(moving=False)
+    forget_assignment(user_id)
+  
+  if grace:
+    time.sleep(grace)
+  delete_user_data(user_id, source)
+  # responses and statistics cached so far were read from the source, drop them
+  bump_data_version(user_id)
+  return counts
+
+
+class ShardRouter:
+  """ Send the sharded models to the shard of the user they belong to
+
+  The owner comes from the instance hint (the object itself, or the user a
+  related object is being attached to), else from the shard activated for the
+  current request. Everything else is left to the next router, so replica
+  reads still apply to users and tokens but not to sharded data.
+  """
+  
+  def _db(self, model, hints):
+    if not is_enabled() or not is_sharded(model):
+      return None
+    
+    instance = hints.get('instance')
+    if instance is not None:
+      if is_sharded(type(instance)):
+        if instance._state.db:
+          return instance._state.db
+        if getattr(instance, 'user_id', None) is not None:
+          return db_for_user(instance.user_id)
+      elif instance._meta.label_lower == settings.AUTH_USER_MODEL.lower() and instance.pk is not None:
+        return db_for_user(instance.pk)
+    
+    return _current.get()
+  
+  def db_for_read(self, model, **hints):
+    return self._db(model, hints)
+  
+  def db_for_write(self, model, **hints):
+    return self._db(model, hints)
+  
+  def allow_relation(self, obj1, obj2, **hints):
+    if not is_enabled():
+      return None
+    
+    # users live on 'default' and own rows on every shard
+    user_model = settings.AUTH_USER_MODEL.lower()
+    labels = {obj1._meta.label_lower, obj2._meta.label_lower}
+    if user_model in labels and labels & set(SHARDED_MODELS):
+      return True
+    return None
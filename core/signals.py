@@ -0,0 +1,147 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core import counters, search, sharding
+from core.data_version import bump_data_version
+from core.models import Tag, Ingredient, Recipe
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def bump_owner_version(sender, instance, using, **kwargs):
+  """ Bump the owner's data version when one of their objects changes """
+  bump_data_version(instance.user_id, using=using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def bump_owner_version_on_links(sender, instance, action, using, **kwargs):
+  """ Bump the owner's data version when recipe links change """
+  if action in ('post_add', 'post_remove', 'post_clear'):
+    bump_data_version(instance.user_id, using=using)
+
+
+def linked_recipe_ids(instance):
+  """ return the ids of recipes linked to a tag or ingredient """
+  return list(
+    Recipe.objects.using(instance._state.db)
+    .filter(**{f'{instance._meta.model_name}s': instance}).values_list('id', flat=True)
+  )
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, using, **kwargs):
+  """ Keep the search index in step with the recipe title """
+  search.index_recipes([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, using, **kwargs):
+  """ Drop a deleted recipe from the search index """
+  search.remove_recipes([instance.pk], using=using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def index_relinked_recipes(sender, instance, action, reverse, pk_set, using, **kwargs):
+  """ Reindex recipes whose tags or ingredients changed """
+  if reverse and action == 'pre_clear':
+    instance._search_recipe_ids = linked_recipe_ids(instance)
+    return
+  if action not in ('post_add', 'post_remove', 'post_clear'):
+    return
+  
+  if not reverse:
+    search.index_recipes([instance.pk], using=using)
+  elif action == 'post_clear':
+    search.index_recipes(instance.__dict__.pop('_search_recipe_ids', []), using=using)
+  else:
+    search.index_recipes(pk_set, using=using)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def index_renamed_recipes(sender, instance, created, using, **kwargs):
+  """ Reindex the recipes using a tag or ingredient when it is renamed """
+  if not created:
+    search.index_recipes(linked_recipe_ids(instance), using=using)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_linked_recipes(sender, instance, **kwargs):
+  """ Remember the recipes of a tag or ingredient before its links are deleted """
+  instance._search_recipe_ids = linked_recipe_ids(instance)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def index_unlinked_recipes(sender, instance, using, **kwargs):
+  """ Reindex the recipes that lost a deleted tag or ingredient """
+  search.index_recipes(instance.__dict__.pop('_search_recipe_ids', []), using=using)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def assign_shard(sender, instance, created, using, **kwargs):
+  """ Place a new user on a shard """
+  if created and using == DEFAULT_DB_ALIAS and sharding.is_enabled():
+    sharding.assign_users([instance.pk])
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def remember_shard(sender, instance, using, **kwargs):
+  """ Remember a user's shard before their shard map entry is deleted with them """
+  if using == DEFAULT_DB_ALIAS and sharding.is_enabled():
+    instance._shard_alias = sharding.db_for_user(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def delete_shard_data(sender, instance, using, **kwargs):
+  """ Delete a deleted user's rows on their shard, which the cascade on 'default' can't reach """
+  alias = instance.__dict__.pop('_shard_alias', DEFAULT_DB_ALIAS)
+  if using == DEFAULT_DB_ALIAS and alias != DEFAULT_DB_ALIAS:
+    sharding.delete_user_data(instance.pk, alias)
+    sharding.forget_assignment(instance.pk)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_links(sender, instance, action, reverse, model, pk_set, using, **kwargs):
+  """ Keep the recipe_count of tags and ingredients in step with their links """
+  counted = type(instance) if reverse else model
+  through, column = counters.COUNTED[counted]
+  removed_key = f'_removed_{sender._meta.model_name}'
+  if action in ('pre_remove', 'pre_clear'):
+    # remove sends the ids asked for, linked or not, and clear sends none
+    if reverse:
+      links = through.objects.using(using).filter(**{column: instance.pk})
+      if pk_set is not None:
+        links = links.filter(recipe_id__in=pk_set)
+      instance.__dict__[removed_key] = {instance.pk: -links.count()}
+    else:
+      links = through.objects.using(using).filter(recipe_id=instance.pk)
+      if pk_set is not None:
+        links = links.filter(**{f'{column}__in': pk_set})
+      instance.__dict__[removed_key] = {pk: -1 for pk in links.values_list(column, flat=True)}
+  elif action in ('post_remove', 'post_clear'):
+    counters.adjust(counted, instance.__dict__.pop(removed_key, {}), using)
+  elif action == 'post_add':
+    # pk_set only holds the links that did not exist yet
+    if reverse:
+      counters.adjust(counted, {instance.pk: len(pk_set)}, using)
+    else:
+      counters.adjust(counted, dict.fromkeys(pk_set, 1), using)
+
+
+@receiver(pre_delete, sender=Recipe)
+def uncount_deleted_recipe(sender, instance, using, **kwargs):
+  """ Take a deleted recipe off the counters before its links go with it """
+  for model in counters.COUNTED:
+    counts = counters.count_links(model, [instance.pk], using)
+    counters.adjust(model, {pk: -count for pk, count in counts.items()}, using)
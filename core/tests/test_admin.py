@@ -1,7 +1,15 @@
+from unittest import mock
+
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from core import seeding
+from core.admin import EstimatedCountPaginator
+from core.models import Recipe, Tag
+
 
 class AdminTest(TestCase):
   
@@ -40,4 +48,89 @@ class AdminTest(TestCase):
     url = reverse('admin:core_user_add')
     res = self.client.get(url)
     
-    self.assertEqual(res.status_code, 200)
\ No newline at end of file
+    self.assertEqual(res.status_code, 200)
+
+
+class AdminScaleTest(TestCase):
+  """ Test the admin pages cost the same whatever the size of the tables """
+  
+  @classmethod
+  def setUpTestData(cls):
+    seeding.seed(40, tags=10, ingredients=20, recipes=50, index=False, random_seed=1)
+    with connection.cursor() as cursor:
+      cursor.execute('ANALYZE')
+  
+  def setUp(self):
+    self.client = Client()
+    self.admin_user = get_user_model().objects.create_superuser(
+      email='testsuperuser@example.com',
+      password='password1234'
+    )
+    self.client.force_login(self.admin_user)
+  
+  def get(self, url, **params):
+    """ return the response and the queries of a GET, which must stay a handful whatever the table sizes """
+    with CaptureQueriesContext(connection) as captured:
+      res = self.client.get(url, params)
+    queries = [query['sql'] for query in captured]
+    self.assertEqual(res.status_code, 200)
+    self.assertLess(len(queries), 10, queries)
+    return res, queries
+  
+  def test_changelists_estimate_counts(self):
+    """ Test unfiltered changelists read their size off the statistics instead of counting """
+    with mock.patch.object(EstimatedCountPaginator, 'estimate_threshold', 300):
+      for model in ('recipe', 'tag', 'ingredient'):
+        res, queries = self.get(reverse(f'admin:core_{model}_changelist'))
+        
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql])
+        # session, user, estimate, page rows with their owners
+        self.assertEqual(len(queries), 4, queries)
+    self.assertContains(res, '800 ingredients')
+  
+  def test_small_tables_counted(self):
+    """ Test tables under the threshold are counted exactly """
+    res, queries = self.get(reverse('admin:core_user_changelist'))
+    
+    self.assertContains(res, '41 users')
+    self.assertEqual(len([sql for sql in queries if 'COUNT(' in sql]), 1, queries)
+  
+  def test_search_by_owner(self):
+    """ Test the search seeks the owner's email prefix and counts the matches exactly """
+    res, queries = self.get(reverse('admin:core_recipe_changelist'), q='user1@')
+    
+    owner = get_user_model().objects.get(email__startswith='user1@')
+    self.assertEqual(res.context['cl'].result_count, Recipe.objects.filter(user=owner).count())
+    self.assertContains(res, '50 recipes')
+    # a range on the unique email index, LIKE could not use it
+    self.assertFalse([sql for sql in queries if ' LIKE ' in sql])
+    self.assertTrue([sql for sql in queries if '"core_user"."email" >= ' in sql], queries)
+  
+  def test_change_form_renders_no_options(self):
+    """ Test the recipe form does not list the users, tags and ingredients """
+    recipe = Recipe.objects.order_by('id').last()
+    
+    res, queries = self.get(reverse('admin:core_recipe_change', args=[recipe.id]))
+    
+    self.assertLessEqual(res.content.decode().count('<option'), 1)
+    self.assertLess(len(queries), 10, queries)
+  
+  def test_user_autocomplete(self):
+    """ Test the owner autocomplete searches emails by prefix """
+    res, queries = self.get(
+      reverse('admin:autocomplete'), app_label='core', model_name='tag', field_name='user', term='user3'
+    )
+    
+    emails = [result['text'] for result in res.json()['results']]
+    self.assertTrue(emails)
+    self.assertTrue(all(email.startswith('user3') for email in emails))
+    self.assertFalse([sql for sql in queries if ' LIKE ' in sql])
+  
+  def test_prefix_lookup(self):
+    """ Test the prefix lookup matches exactly the names starting with it """
+    user = get_user_model().objects.get(email__startswith='user1@')
+    Tag.objects.create(user=user, name='Vegam')
+    Tag.objects.create(user=user, name='Vegb')
+    
+    names = set(Tag.objects.filter(user=user, name__prefix='Vega').values_list('name', flat=True))
+    self.assertEqual(names, {'Vegam', 'Vegan'})
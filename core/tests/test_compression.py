@@ -0,0 +1,143 @@
+import gzip
+import unittest
+import zlib
+
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import compression
+from core.middleware import CompressionMiddleware, parse_accept_encoding
+from core.models import Recipe
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+BODY = b'{"title": "Spicy chicken curry", "price": "5.00"}' * 100
+
+
+def decompress(encoding, data):
+  """ Decode a body compressed with one of the supported encodings """
+  if encoding == 'gzip':
+    return gzip.decompress(data)
+  if encoding == 'br':
+    return compression.brotli.decompress(data)
+  return compression.zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+@override_settings(COMPRESSION={'MIN_SIZE': 200, 'ENCODINGS': ['zstd', 'br', 'gzip']})
+class CompressionMiddlewareTests(SimpleTestCase):
+  """ Test negotiating and applying response compression """
+  
+  def process(self, response, accept_encoding):
+    middleware = CompressionMiddleware(lambda request: response)
+    request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+    return middleware(request)
+  
+  
+  def test_parse_accept_encoding(self):
+    """ Test q-values are read from the header """
+    self.assertEqual(
+      parse_accept_encoding('gzip, br;q=0.5, zstd;q=0, *;q=0.1'),
+      {'gzip': 1.0, 'br': 0.5, 'zstd': 0.0, '*': 0.1},
+    )
+  
+  
+  def test_client_preference_wins(self):
+    """ Test the highest q-value wins and the server order breaks ties """
+    middleware = CompressionMiddleware(lambda request: None)
+    factory = RequestFactory()
+    
+    self.assertEqual(middleware.select_encoding(factory.get('/', HTTP_ACCEPT_ENCODING='gzip;q=1, br;q=0.5')), 'gzip')
+    self.assertEqual(middleware.select_encoding(factory.get('/', HTTP_ACCEPT_ENCODING='gzip, zstd')), 'zstd' if compression.zstandard else 'gzip')
+    self.assertEqual(middleware.select_encoding(factory.get('/', HTTP_ACCEPT_ENCODING='identity')), None)
+    self.assertEqual(middleware.select_encoding(factory.get('/', HTTP_ACCEPT_ENCODING='*;q=0')), None)
+  
+  
+  def test_compresses_each_encoding(self):
+    """ Test every available encoding round trips """
+    for encoding in compression.COMPRESSORS:
+      response = self.process(HttpResponse(BODY, content_type='application/json'), encoding)
+      
+      self.assertEqual(response['Content-Encoding'], encoding)
+      self.assertEqual(response['Content-Length'], str(len(response.content)))
+      self.assertIn('Accept-Encoding', response['Vary'])
+      self.assertEqual(decompress(encoding, response.content), BODY)
+  
+  
+  def test_small_bodies_are_not_compressed(self):
+    """ Test bodies below the threshold are left alone """
+    response = self.process(HttpResponse(b'{"id": 1}'), 'gzip')
+    
+    self.assertFalse(response.has_header('Content-Encoding'))
+  
+  
+  def test_compressed_types_are_skipped(self):
+    """ Test already compressed content types are left alone """
+    response = self.process(HttpResponse(BODY, content_type='application/gzip'), 'gzip')
+    
+    self.assertFalse(response.has_header('Content-Encoding'))
+  
+  
+  def test_html_is_not_compressed(self):
+    """ Test HTML pages, which carry CSRF tokens, are never compressed """
+    html = b'<html><body><input name="csrfmiddlewaretoken" value="secret"></body></html>' * 20
+    response = self.process(HttpResponse(html, content_type='text/html; charset=utf-8'), 'gzip')
+    
+    self.assertFalse(response.has_header('Content-Encoding'))
+    self.assertEqual(response.content, html)
+  
+  
+  def test_streaming_is_compressed_incrementally(self):
+    """ Test every streamed chunk is compressed and flushed as it is produced """
+    produced = []
+    
+    def chunks():
+      for i in range(3):
+        produced.append(i)
+        yield BODY
+    
+    response = self.process(StreamingHttpResponse(chunks(), content_type='application/x-ndjson'), 'gzip')
+    stream = iter(response.streaming_content)
+    first = next(stream)
+    
+    self.assertEqual(produced, [0])
+    self.assertEqual(zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(first), BODY)
+    self.assertEqual(gzip.decompress(first + b''.join(stream)), BODY * 3)
+    self.assertFalse(response.has_header('Content-Length'))
+  
+  
+  @unittest.skipUnless(compression.brotli, 'brotli is not installed')
+  def test_streaming_brotli(self):
+    """ Test streaming works with brotli """
+    response = self.process(StreamingHttpResponse([BODY, BODY], content_type='application/x-ndjson'), 'br')
+    
+    self.assertEqual(compression.brotli.decompress(b''.join(response.streaming_content)), BODY * 2)
+
+
+@override_settings(COMPRESSION={'MIN_SIZE': 200, 'ENCODINGS': ['gzip']})
+class CompressedApiTests(TestCase):
+  """ Test the API behind the compression middleware """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+    for i in range(10):
+      Recipe.objects.create(user=self.user, title=f'Curry {i}', time_minutes=20, price='5.00')
+  
+  
+  def test_list_etag_survives_compression(self):
+    """ Test the weakened etag still answers 304 """
+    res = self.client.get(RECIPE_URL, HTTP_ACCEPT_ENCODING='gzip')
+    self.assertEqual(res['Content-Encoding'], 'gzip')
+    self.assertTrue(res['ETag'].startswith('W/'))
+    
+    res = self.client.get(RECIPE_URL, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=res['ETag'])
+    
+    self.assertEqual(res.status_code, 304)
@@ -0,0 +1,112 @@
+from io import StringIO
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from core import counters
+from core.models import Recipe, Ingredient, Tag
+
+
+def sample_recipe(user, title='Curry'):
+  """ Create and return a sample recipe """
+  return Recipe.objects.create(user=user, title=title, time_minutes=20, price=5.00)
+
+
+class RecipeCountTests(TestCase):
+  """ Test the recipe counts of tags and ingredients follow their links """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user('test@example.com', 'test1234')
+    self.curry = sample_recipe(self.user, 'Curry')
+    self.salad = sample_recipe(self.user, 'Salad')
+    self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+    self.spicy = Tag.objects.create(user=self.user, name='Spicy')
+    self.tofu = Ingredient.objects.create(user=self.user, name='Tofu')
+  
+  
+  def assertCounts(self, model, expected):
+    counts = dict(model.objects.values_list('name', 'recipe_count'))
+    self.assertEqual({name: counts[name] for name in expected}, expected)
+  
+  
+  def test_add_from_either_side(self):
+    """ Test adding links counts each new one once """
+    self.curry.tags.add(self.vegan, self.spicy)
+    self.curry.tags.add(self.vegan)
+    self.vegan.recipe_set.add(self.salad, self.curry)
+    self.tofu.recipe_set.add(self.curry)
+    
+    self.assertCounts(Tag, {'Vegan': 2, 'Spicy': 1})
+    self.assertCounts(Ingredient, {'Tofu': 1})
+  
+  
+  def test_remove_and_clear(self):
+    """ Test removing only counts links that existed """
+    self.curry.tags.add(self.vegan, self.spicy)
+    self.salad.tags.add(self.vegan)
+    
+    self.curry.tags.remove(self.spicy, self.spicy)
+    self.salad.tags.remove(self.spicy)
+    self.assertCounts(Tag, {'Vegan': 2, 'Spicy': 0})
+    
+    self.vegan.recipe_set.remove(self.salad)
+    self.assertCounts(Tag, {'Vegan': 1})
+    self.curry.tags.clear()
+    self.assertCounts(Tag, {'Vegan': 0})
+    
+    self.vegan.recipe_set.add(self.curry, self.salad)
+    self.vegan.recipe_set.clear()
+    self.assertCounts(Tag, {'Vegan': 0})
+  
+  
+  def test_set(self):
+    """ Test set counts what it adds and removes """
+    self.curry.tags.set([self.vegan])
+    self.curry.tags.set([self.spicy])
+    
+    self.assertCounts(Tag, {'Vegan': 0, 'Spicy': 1})
+  
+  
+  def test_recipe_delete(self):
+    """ Test deleting recipes takes them off the counts """
+    self.curry.tags.add(self.vegan)
+    self.curry.ingredients.add(self.tofu)
+    self.salad.tags.add(self.vegan)
+    
+    self.curry.delete()
+    self.assertCounts(Tag, {'Vegan': 1})
+    self.assertCounts(Ingredient, {'Tofu': 0})
+    Recipe.objects.all().delete()
+    self.assertCounts(Tag, {'Vegan': 0})
+  
+  
+  def test_add_links_after_bulk_insert(self):
+    """ Test the bulk path counts the links of the inserted recipes only """
+    self.curry.tags.add(self.vegan)
+    Recipe.tags.through.objects.bulk_create([
+      Recipe.tags.through(recipe_id=self.salad.id, tag_id=self.vegan.id),
+      Recipe.tags.through(recipe_id=self.salad.id, tag_id=self.spicy.id),
+    ])
+    
+    with self.assertNumQueries(1):
+      counters.add_links(Tag, [self.salad.id])
+    self.assertCounts(Tag, {'Vegan': 2, 'Spicy': 1})
+  
+  
+  def test_reconcile_command(self):
+    """ Test the reconcile command fixes drifted counts in batches """
+    self.curry.tags.add(self.vegan)
+    Tag.objects.filter(pk=self.vegan.pk).update(recipe_count=5)
+    Tag.objects.filter(pk=self.spicy.pk).update(recipe_count=2)
+    
+    out = StringIO()
+    call_command('reconcile_recipe_counts', '--dry-run', stdout=out)
+    self.assertIn('Found 2 drifted', out.getvalue())
+    self.assertCounts(Tag, {'Vegan': 5})
+    
+    out = StringIO()
+    call_command('reconcile_recipe_counts', '--batch-size', '1', stdout=out)
+    self.assertIn('Fixed 2 drifted', out.getvalue())
+    self.assertCounts(Tag, {'Vegan': 1, 'Spicy': 0})
+    self.assertEqual(counters.reconcile(Tag), [])
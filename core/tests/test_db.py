@@ -0,0 +1,95 @@
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.db import sqlite_database, write_atomic
+
+
+class SqliteProfileTests(SimpleTestCase):
+  """ Test the production SQLite profile """
+  # the connections under test are separate handlers on temporary files
+  databases = {'default'}
+  
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.path = Path(directory.name) / 'db.sqlite3'
+  
+  
+  def connect(self, **kwargs):
+    """ return an open Django connection to the temporary database """
+    wrapper = ConnectionHandler({'default': sqlite_database(self.path, **kwargs)})['default']
+    wrapper.ensure_connection()
+    self.addCleanup(wrapper.close)
+    return wrapper
+  
+  
+  def pragma(self, wrapper, name):
+    with wrapper.cursor() as cursor:
+      cursor.execute(f'PRAGMA {name}')
+      return cursor.fetchone()[0]
+  
+  
+  def test_default_profile(self):
+    """ Test the development profile keeps SQLite's defaults """
+    database = sqlite_database(self.path)
+    
+    self.assertEqual(database, {'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.path})
+  
+  
+  def test_pragmas_applied_on_connect(self):
+    """ Test every production pragma is set on a new connection """
+    wrapper = self.connect(production=True, pragmas={'cache_size': -2000})
+    
+    self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+    self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+    self.assertEqual(self.pragma(wrapper, 'cache_size'), -2000)
+    self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+    self.assertEqual(self.pragma(wrapper, 'mmap_size'), 256 * 1024 * 1024)
+    self.assertEqual(self.pragma(wrapper, 'temp_store'), 2)
+  
+  
+  def test_persistent_connections(self):
+    """ Test connections are kept open between requests """
+    database = sqlite_database(self.path, production=True)
+    
+    self.assertEqual(database['CONN_MAX_AGE'], 600)
+    self.assertTrue(database['CONN_HEALTH_CHECKS'])
+  
+  
+  def test_read_transactions_leave_the_write_lock(self):
+    """ Test a transaction that only reads does not keep a writer waiting """
+    wrapper = self.connect(production=True)
+    with wrapper.cursor() as cursor:
+      cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+    
+    wrapper.set_autocommit(False)
+    self.addCleanup(wrapper.rollback)
+    wrapper._start_transaction_under_autocommit()
+    with wrapper.cursor() as cursor:
+      cursor.execute('SELECT count(*) FROM item')
+    
+    other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+    self.addCleanup(other.close)
+    other.execute('BEGIN IMMEDIATE')
+    other.execute('INSERT INTO item DEFAULT VALUES')
+    other.execute('COMMIT')
+  
+  
+  def test_write_atomic_begins_immediate(self):
+    """ Test write_atomic takes the write lock at BEGIN, leaving atomic() and nested blocks deferred """
+    with CaptureQueriesContext(connection) as queries:
+      with write_atomic():
+        with write_atomic():
+          pass
+      with transaction.atomic():
+        pass
+    
+    begins = [query['sql'] for query in queries if query['sql'].startswith('BEGIN')]
+    self.assertEqual(begins, ['BEGIN IMMEDIATE', 'BEGIN'])
+    self.assertIsNone(connection.transaction_mode)
@@ -0,0 +1,105 @@
+import re
+
+from django.test import TestCase, AsyncClient, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+
+INSTRUMENTATION = {'ENABLED': True, 'SLOW_REQUEST_MS': 10000, 'SLOW_QUERY_COUNT': 50, 'LOGGED_QUERIES': 2}
+
+
+def server_timing(response):
+  """ return {metric: {param: value}} from a Server-Timing header """
+  metrics = {}
+  for item in response['Server-Timing'].split(', '):
+    name, *params = item.split(';')
+    metrics[name] = dict(param.split('=', 1) for param in params)
+  return metrics
+
+
+@override_settings(INSTRUMENTATION=INSTRUMENTATION)
+class InstrumentationTests(TestCase):
+  """ Test the per-request timings """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+    tag = Tag.objects.create(user=self.user, name='Vegan')
+    recipe = Recipe.objects.create(user=self.user, title='Curry', time_minutes=20, price='5.00')
+    recipe.tags.add(tag)
+  
+  
+  def test_server_timing_header(self):
+    """ Test the header reports queries, db, serializer and view time """
+    with self.assertNumQueries(3):
+      res = self.client.get(RECIPE_URL)
+    
+    metrics = server_timing(res)
+    self.assertEqual(metrics['db']['desc'], '"3 queries"')
+    self.assertEqual(set(metrics), {'db', 'serialize', 'view'})
+    for metric in metrics.values():
+      self.assertGreater(float(metric['dur']), 0)
+    self.assertLessEqual(float(metrics['db']['dur']), float(metrics['view']['dur']))
+  
+  
+  def test_serializer_time_on_create(self):
+    """ Test the model serializers report their time """
+    res = self.client.post(TAG_URL, {'name': 'Dessert'})
+    
+    self.assertEqual(res.status_code, 201)
+    self.assertIn('serialize', server_timing(res))
+  
+  
+  def test_fast_requests_are_not_logged(self):
+    """ Test nothing is logged under the thresholds """
+    with self.assertNoLogs('core.instrumentation'):
+      self.client.get(TAG_URL)
+  
+  
+  @override_settings(INSTRUMENTATION={**INSTRUMENTATION, 'SLOW_QUERY_COUNT': 1})
+  def test_slow_requests_are_logged(self):
+    """ Test a request over a threshold is logged with its worst queries """
+    client = APIClient()
+    client.force_authenticate(self.user)
+    
+    with self.assertLogs('core.instrumentation', 'WARNING') as logs:
+      client.get(RECIPE_URL)
+    
+    message = logs.output[0]
+    self.assertIn(f'GET {RECIPE_URL} (200)', message)
+    self.assertIn('3 queries', message)
+    self.assertEqual(len(re.findall(r'\n  [\d.]+ ms: SELECT', message)), 2)
+  
+  
+  @override_settings(INSTRUMENTATION={'ENABLED': False})
+  def test_disabled(self):
+    """ Test the middleware is dropped when disabled """
+    client = APIClient()
+    client.force_authenticate(self.user)
+    
+    res = client.get(RECIPE_URL)
+    
+    self.assertFalse(res.has_header('Server-Timing'))
+  
+  
+  async def test_async_requests(self):
+    """ Test queries run by views under ASGI are counted """
+    token = await Token.objects.acreate(user=self.user)
+    client = AsyncClient()
+    
+    res = await client.get(TAG_URL, headers={'Authorization': f'Token {token.key}'})
+    
+    self.assertEqual(res.status_code, 200)
+    self.assertNotEqual(server_timing(res)['db']['desc'], '"0 queries"')
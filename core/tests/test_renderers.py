@@ -0,0 +1,142 @@
+import datetime
+import io
+import unittest
+from decimal import Decimal
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+
+from core import renderers as fast_renderers
+from core.models import Recipe, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+ME_URL = reverse('user:me')
+TOKEN_URL = reverse('user:token')
+
+PAYLOAD = {
+  'results': [{
+    'id': 1,
+    'title': 'Crème brûlée \u2028 and more',
+    'price': Decimal('5.50'),
+    'tags': [1, 2],
+    'created': datetime.datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc),
+    'day': datetime.date(2024, 1, 2),
+    'detail': gettext_lazy('Not found.'),
+  }],
+  'counts': {1: 2},
+  'next': None,
+}
+
+
+@unittest.skipUnless(fast_renderers.orjson, 'orjson is not installed')
+class ORJSONTests(TestCase):
+  """ Test the orjson renderer and parser match DRF's JSON classes """
+  
+  def test_render_matches_stdlib_renderer(self):
+    """ Test rendering gives the same bytes as DRF's JSONRenderer """
+    expected = renderers.JSONRenderer().render(PAYLOAD)
+    
+    self.assertEqual(fast_renderers.ORJSONRenderer().render(PAYLOAD), expected)
+  
+  
+  def test_indented_render_uses_stdlib(self):
+    """ Test an indent in the media type is honoured """
+    media_type = 'application/json; indent=4'
+    expected = renderers.JSONRenderer().render(PAYLOAD, media_type)
+    
+    self.assertEqual(fast_renderers.ORJSONRenderer().render(PAYLOAD, media_type), expected)
+  
+  
+  def test_big_integers_fall_back(self):
+    """ Test integers orjson cannot encode are still rendered """
+    data = {'big': 2 ** 70}
+    
+    self.assertEqual(fast_renderers.ORJSONRenderer().render(data), b'{"big":1180591620717411303424}')
+  
+  
+  def test_parse(self):
+    """ Test parsing JSON and rejecting invalid bodies """
+    parser = fast_renderers.ORJSONParser()
+    
+    self.assertEqual(parser.parse(io.BytesIO('{"name": "Crème"}'.encode())), {'name': 'Crème'})
+    with self.assertRaises(ParseError):
+      parser.parse(io.BytesIO(b'{"name": '))
+
+
+@unittest.skipUnless(fast_renderers.msgpack, 'msgpack is not installed')
+class MessagePackTests(TestCase):
+  """ Test the MessagePack media type """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234',
+      name='test user'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+  
+  
+  def test_values_convert_like_json(self):
+    """ Test Decimals and dates are converted as the JSON renderer does """
+    packed = fast_renderers.MessagePackRenderer().render(PAYLOAD)
+    unpacked = fast_renderers.MessagePackParser().parse(io.BytesIO(packed))
+    
+    as_json = fast_renderers.ORJSONParser().parse(io.BytesIO(renderers.JSONRenderer().render(PAYLOAD)))
+    as_json['counts'] = {1: 2}
+    self.assertEqual(unpacked, as_json)
+  
+  
+  def test_invalid_body_rejected(self):
+    """ Test a truncated body raises a parse error """
+    with self.assertRaises(ParseError):
+      fast_renderers.MessagePackParser().parse(io.BytesIO(b'\x82\xa4name'))
+  
+  
+  def test_recipe_list_negotiated(self):
+    """ Test the recipe list is served as MessagePack on request """
+    Recipe.objects.create(user=self.user, title='Curry', time_minutes=20, price='5.00')
+    json_res = self.client.get(RECIPE_URL)
+    
+    res = self.client.get(RECIPE_URL, HTTP_ACCEPT='application/msgpack')
+    
+    self.assertEqual(res['Content-Type'], 'application/msgpack')
+    data = fast_renderers.MessagePackParser().parse(io.BytesIO(res.content))
+    self.assertEqual(data, json_res.json())
+    self.assertEqual(data['results'][0]['price'], '5.00')
+  
+  
+  def test_create_from_msgpack(self):
+    """ Test a MessagePack body creates a tag """
+    body = fast_renderers.MessagePackRenderer().render({'name': 'Vegan'})
+    
+    res = self.client.post(TAG_URL, body, content_type='application/msgpack')
+    
+    self.assertEqual(res.status_code, 201)
+    self.assertTrue(Tag.objects.filter(user=self.user, name='Vegan').exists())
+  
+  
+  def test_user_endpoint_negotiated(self):
+    """ Test the user endpoints offer MessagePack too """
+    res = self.client.get(ME_URL, HTTP_ACCEPT='application/msgpack')
+    
+    data = fast_renderers.MessagePackParser().parse(io.BytesIO(res.content))
+    self.assertEqual(data, {'name': 'test user', 'email': 'test@example.com'})
+  
+  
+  def test_token_from_msgpack(self):
+    """ Test a MessagePack client can log in """
+    body = fast_renderers.MessagePackRenderer().render({'email': 'test@example.com', 'password': 'test1234'})
+    
+    res = APIClient().post(TOKEN_URL, body, content_type='application/msgpack', HTTP_ACCEPT='application/msgpack')
+    
+    self.assertEqual(res.status_code, 200)
+    self.assertIn('token', fast_renderers.MessagePackParser().parse(io.BytesIO(res.content)))
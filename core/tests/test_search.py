@@ -0,0 +1,94 @@
+from io import StringIO
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+
+from core import search
+from core.models import Recipe, Ingredient, Tag
+
+
+def found(text):
+  """ return the ids of all recipes matching text """
+  return sorted(search.search_recipes(Recipe.objects.all(), text).values_list('id', flat=True))
+
+
+class SearchIndexTests(TestCase):
+  """ Test the search index follows changes to recipes, tags and ingredients """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user('test@example.com', 'test1234')
+    self.recipe = Recipe.objects.create(
+      user=self.user, title='Curry', time_minutes=20, price=5.00
+    )
+    self.tag = Tag.objects.create(user=self.user, name='Vegan')
+    self.ingredient = Ingredient.objects.create(user=self.user, name='Lentils')
+    self.recipe.tags.add(self.tag)
+    self.recipe.ingredients.add(self.ingredient)
+  
+  
+  def test_recipe_title_change(self):
+    """ Test renaming a recipe updates the index """
+    self.recipe.title = 'Dal'
+    self.recipe.save()
+    
+    self.assertEqual(found('curry'), [])
+    self.assertEqual(found('dal'), [self.recipe.id])
+  
+  
+  def test_recipe_delete(self):
+    """ Test deleted recipes leave the index """
+    self.recipe.delete()
+    
+    self.assertEqual(found('curry'), [])
+  
+  
+  def test_tag_rename_and_delete(self):
+    """ Test renaming and deleting a tag reindexes its recipes """
+    self.tag.name = 'Plant'
+    self.tag.save()
+    self.assertEqual(found('vegan'), [])
+    self.assertEqual(found('plant'), [self.recipe.id])
+    
+    self.tag.delete()
+    self.assertEqual(found('plant'), [])
+  
+  
+  def test_link_changes(self):
+    """ Test adding, removing and clearing links from either side """
+    self.recipe.ingredients.remove(self.ingredient)
+    self.assertEqual(found('lentils'), [])
+    
+    self.ingredient.recipe_set.add(self.recipe)
+    self.assertEqual(found('lentils'), [self.recipe.id])
+    
+    self.ingredient.recipe_set.clear()
+    self.assertEqual(found('lentils'), [])
+  
+  
+  def test_rebuild_command(self):
+    """ Test the rebuild command restores a lost index """
+    if not search.is_enabled():
+      self.skipTest('search index needs SQLite')
+    with connection.cursor() as cursor:
+      cursor.execute('DELETE FROM core_recipe_fts')
+    self.assertEqual(found('curry'), [])
+    
+    out = StringIO()
+    call_command('rebuild_search_index', stdout=out)
+    
+    self.assertIn('1 recipes', out.getvalue())
+    self.assertEqual(found('curry vegan lentils'), [self.recipe.id])
+  
+  
+  def test_user_search_driven_by_index(self):
+    """ Test a user scoped search starts from the full-text index """
+    if not search.is_enabled():
+      self.skipTest('search index needs SQLite')
+    queryset = search.search_recipes(Recipe.objects.all(), 'curry', user_id=self.user.id)
+    
+    plan = queryset.explain().splitlines()
+    
+    self.assertIn('core_recipe_fts VIRTUAL TABLE', plan[0])
+    self.assertEqual(list(queryset.values_list('id', flat=True)), [self.recipe.id])
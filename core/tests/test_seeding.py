@@ -0,0 +1,88 @@
+from io import StringIO
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, F
+from django.test.utils import CaptureQueriesContext
+
+from core import search, seeding
+from core.models import Ingredient, Recipe, Tag
+
+
+class SeedingTests(TestCase):
+  """ Test the bulk synthetic data seeding """
+  
+  def test_seed_creates_rows(self):
+    """ Test every user gets their own tags, ingredients and recipes """
+    counts = seeding.seed(3, tags=4, ingredients=5, recipes=6, random_seed=1)
+    
+    self.assertEqual(counts['users'], 3)
+    self.assertEqual(Tag.objects.count(), 12)
+    self.assertEqual(Ingredient.objects.count(), 15)
+    self.assertEqual(Recipe.objects.count(), 18)
+    self.assertEqual(Recipe.tags.through.objects.count(), counts['recipe_tags'])
+    self.assertEqual(Recipe.ingredients.through.objects.count(), counts['recipe_ingredients'])
+    for user in get_user_model().objects.all():
+      self.assertEqual(Tag.objects.filter(user=user).values('name').distinct().count(), 4)
+  
+  
+  def test_links_stay_with_the_owner(self):
+    """ Test recipes only link to their owner's tags and ingredients within the fan-out """
+    seeding.seed(4, tags=3, ingredients=10, recipes=5, tags_per_recipe=2, ingredients_per_recipe=4, batch_size=7)
+    
+    self.assertFalse(Recipe.tags.through.objects.exclude(tag__user=F('recipe__user')).exists())
+    self.assertFalse(Recipe.ingredients.through.objects.exclude(ingredient__user=F('recipe__user')).exists())
+    fan_out = Recipe.objects.annotate(
+      tag_count=Count('tags', distinct=True), ingredient_count=Count('ingredients', distinct=True)
+    )
+    for recipe in fan_out:
+      self.assertLessEqual(recipe.tag_count, 2)
+      self.assertIn(recipe.ingredient_count, range(1, 5))
+  
+  
+  def test_password_hashed_once(self):
+    """ Test every seeded user can log in with the shared password """
+    seeding.seed(2, recipes=1, password='seeded123')
+    
+    users = list(get_user_model().objects.all())
+    self.assertEqual(len({user.password for user in users}), 1)
+    self.assertTrue(all(user.check_password('seeded123') for user in users))
+  
+  
+  def test_queries_scale_with_batches(self):
+    """ Test the number of queries does not grow with the number of rows """
+    with CaptureQueriesContext(connection) as small:
+      seeding.seed(2, tags=2, ingredients=3, recipes=4, batch_size=1000)
+    with CaptureQueriesContext(connection) as large:
+      seeding.seed(30, tags=2, ingredients=3, recipes=4, batch_size=1000)
+    
+    self.assertEqual(len(large), len(small))
+  
+  
+  def test_seeding_twice_adds_users(self):
+    """ Test a second run numbers its users after the existing ones """
+    seeding.seed(2, recipes=1)
+    seeding.seed(2, recipes=1)
+    
+    self.assertEqual(get_user_model().objects.count(), 4)
+  
+  
+  def test_recipes_are_searchable(self):
+    """ Test seeded recipes are in the search index """
+    seeding.seed(1, recipes=3, random_seed=2)
+    recipe = Recipe.objects.first()
+    
+    word = recipe.title.split()[-1]
+    self.assertIn(recipe, search.search_recipes(Recipe.objects.all(), word))
+  
+  
+  def test_command(self):
+    """ Test the management command reports what it created """
+    out = StringIO()
+    
+    call_command('seed_data', '2', '--recipes', '3', '--tags', '2', '--no-index', stdout=out)
+    
+    self.assertEqual(Recipe.objects.count(), 6)
+    self.assertIn('Seeded 2 users', out.getvalue())
@@ -0,0 +1,55 @@
+""" Thumbnail rendering, run in the worker processes of core.images
+
+Nothing in here may import Django: the workers are spawned fresh and only
+import this module, so they start fast and never need the settings.
+"""
+import os
+import tempfile
+
+try:
+  from PIL import Image, ImageOps
+except ImportError:
+  Image = None
+
+
+THUMBNAIL_EXTENSION = 'jpg'
+THUMBNAIL_QUALITY = 85
+
+
+def _flatten(image):
+  """ return the image as RGB, transparent parts on white as JPEG has no alpha """
+  if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+  
+  return image.convert('RGB')
+
+
+def build(source, targets, permissions=0o644):
+  """ Render source into {size: path} JPEGs that fit in size x size, return the sizes written
+  
+  The largest thumbnail is rendered first and each smaller one from the
+  previous, and each file is renamed into place complete.
+  """
+  with Image.open(source) as image:
+    # JPEGs decode straight at a fraction of their size when that is enough
+    image.draft('RGB', (max(targets), max(targets)))
+    image = _flatten(ImageOps.exif_transpose(image))
+  
+  for size in sorted(targets, reverse=True):
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    path = targets[size]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, staged = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'wb') as out:
+        image.save(out, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+      os.chmod(staged, permissions)
+      os.replace(staged, path)
+    except BaseException:
+      os.unlink(staged)
+      raise
+  
+  return sorted(targets)
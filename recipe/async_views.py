@@ -0,0 +1,209 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from core import routers, sharding
+from core.data_version import aget_data_version
+from user.authentication import CachedTokenAuthentication
+
+from recipe import views
+
+
+class AsyncViewSetView(View):
+  """ Serve list, retrieve and create of a viewset with the async ORM
+  
+  The sync viewset is still what defines the queryset, pagination and serializers:
+  it is instantiated per request and only the database round trips are awaited.
+  Creates save through the viewset's perform_create on the sync ORM, so their
+  transaction and error handling are the sync views' own.
+  Methods without an async implementation are handed to the sync viewset view.
+  """
+  viewset_class = None
+  # http method -> viewset action, for the actions served asynchronously
+  actions = None
+  # every action the sync viewset serves on this url
+  sync_actions = None
+  sync_view = None
+  authentication = CachedTokenAuthentication()
+  parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+  # the browsable API renders templates around the sync views, so it is left out here
+  renderer_classes = [
+    renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+    if not issubclass(renderer, BrowsableAPIRenderer)
+  ]
+  content_negotiation_class = DefaultContentNegotiation
+  
+  @classonlymethod
+  def as_view(cls, **initkwargs):
+    initkwargs.setdefault('sync_view', cls.viewset_class.as_view(cls.sync_actions))
+    view = super().as_view(**initkwargs)
+    # token auth only, same as the DRF views
+    view.csrf_exempt = True
+    return view
+  
+  async def get(self, request, *args, **kwargs):
+    return await self.handle('get', request, *args, **kwargs)
+  
+  async def post(self, request, *args, **kwargs):
+    return await self.handle('post', request, *args, **kwargs)
+  
+  async def put(self, request, *args, **kwargs):
+    return await self.handle('put', request, *args, **kwargs)
+  
+  async def patch(self, request, *args, **kwargs):
+    return await self.handle('patch', request, *args, **kwargs)
+  
+  async def delete(self, request, *args, **kwargs):
+    return await self.handle('delete', request, *args, **kwargs)
+  
+  async def options(self, request, *args, **kwargs):
+    return await self.fallback(request, *args, **kwargs)
+  
+  async def fallback(self, request, *args, **kwargs):
+    """ serve the request with the sync viewset """
+    response = await sync_to_async(self.sync_view)(request, *args, **kwargs)
+    return await sync_to_async(response.render)()
+  
+  async def handle(self, method, request, *args, **kwargs):
+    action = self.actions.get(method)
+    if action is None:
+      return await self.fallback(request, *args, **kwargs)
+    
+    renderers = [renderer() for renderer in self.renderer_classes]
+    self.renderer, self.media_type = renderers[0], renderers[0].media_type
+    try:
+      drf_request = Request(request, parsers=[parser() for parser in self.parser_classes])
+      self.renderer, self.media_type = self.content_negotiation_class().select_renderer(
+        drf_request, renderers
+      )
+      user_auth = await self.authentication.aauthenticate(request)
+      if user_auth is None:
+        raise exceptions.NotAuthenticated()
+      
+      drf_request.user, drf_request.auth = user_auth
+      viewset = self.viewset_class(
+        request=drf_request, args=args, kwargs=kwargs,
+        format_kwarg=None, action=action, headers={},
+      )
+      shard_token = None
+      if sharding.is_enabled():
+        if method != 'get' and await sharding.ais_moving(drf_request.user.pk):
+          raise views.DataMoving()
+        shard_token = sharding.activate(await sharding.adb_for_user(drf_request.user.pk))
+      try:
+        return await self.dispatch_action(method, action, viewset, drf_request, *args, **kwargs)
+      finally:
+        if shard_token is not None:
+          sharding.deactivate(shard_token)
+    except exceptions.APIException as exc:
+      return self.error_response(exc)
+  
+  async def dispatch_action(self, method, action, viewset, request, *args, **kwargs):
+    """ run the action, reading from a replica for gets and recording the write otherwise """
+    if method == 'get':
+      token = await routers.aallow_replica_reads(request.user.pk)
+      try:
+        return await getattr(self, action)(viewset, request, *args, **kwargs)
+      finally:
+        routers.reset_replica_reads(token)
+    
+    try:
+      return await getattr(self, action)(viewset, request, *args, **kwargs)
+    finally:
+      await routers.arecord_write(request.user.pk)
+  
+  def render(self, data, status_code=status.HTTP_200_OK):
+    content_type = self.renderer.media_type
+    if self.renderer.charset:
+      content_type = f'{content_type}; charset={self.renderer.charset}'
+    return HttpResponse(
+      self.renderer.render(data, self.media_type), status=status_code, content_type=content_type
+    )
+  
+  def error_response(self, exc):
+    response = self.render(exc.detail, exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+      response['WWW-Authenticate'] = self.authentication.authenticate_header(None)
+    return response
+  
+  async def conditional(self, viewset, request, handler, *args, **kwargs):
+    """ async counterpart of ConditionalGetMixin.conditional_response """
+    etag = viewset.make_etag(request, await aget_data_version(request.user.pk))
+    if viewset.is_not_modified(request, etag):
+      response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+      response = await handler(viewset, request, *args, **kwargs)
+    
+    return viewset.set_etag(response, etag)
+  
+  async def list(self, viewset, request, *args, **kwargs):
+    return await self.conditional(viewset, request, self._list, *args, **kwargs)
+  
+  async def _list(self, viewset, request, *args, **kwargs):
+    queryset = viewset.filter_queryset(viewset.get_queryset())
+    paginator = viewset.paginator
+    page = await paginator.apaginate_queryset(viewset.get_list_rows(queryset), request, view=viewset)
+    data = viewset.rows_to_representation(page, await viewset.aget_relation_ids(page))
+    return self.render(paginator.get_paginated_response(data).data)
+  
+  async def retrieve(self, viewset, request, *args, **kwargs):
+    return await self.conditional(viewset, request, self._retrieve, *args, **kwargs)
+  
+  async def _retrieve(self, viewset, request, *args, **kwargs):
+    queryset = viewset.filter_queryset(viewset.get_queryset())
+    lookup = {viewset.lookup_field: kwargs[viewset.lookup_url_kwarg or viewset.lookup_field]}
+    try:
+      instance = await queryset.aget(**lookup)
+    except (ObjectDoesNotExist, TypeError, ValueError):
+      return self.error_response(exceptions.NotFound())
+    
+    return self.render(viewset.get_serializer(instance).data)
+  
+  async def create(self, viewset, request, *args, **kwargs):
+    serializer = viewset.get_serializer(data=request.data)
+    # validation may look related pks up, which stays on the sync ORM
+    await sync_to_async(serializer.is_valid)(raise_exception=True)
+    
+    # saving goes through the viewset like the sync views do: one transaction for the
+    # object, its named relations and its links, and unique name races answered with 400
+    data = await sync_to_async(self.perform_create)(viewset, serializer)
+    return self.render(data, status.HTTP_201_CREATED)
+  
+  @staticmethod
+  def perform_create(viewset, serializer):
+    """ save the validated object or batch and return its representation """
+    viewset.perform_create(serializer)
+    return serializer.data
+
+
+class AsyncTagView(AsyncViewSetView):
+  viewset_class = views.TagViewSet
+  actions = {'get': 'list', 'post': 'create'}
+  sync_actions = {'get': 'list', 'post': 'create'}
+
+
+class AsyncIngredientView(AsyncViewSetView):
+  viewset_class = views.IngredientViewSet
+  actions = {'get': 'list', 'post': 'create'}
+  sync_actions = {'get': 'list', 'post': 'create'}
+
+
+class AsyncRecipeListView(AsyncViewSetView):
+  viewset_class = views.RecipeViewSet
+  actions = {'get': 'list', 'post': 'create'}
+  sync_actions = {'get': 'list', 'post': 'create'}
+
+
+class AsyncRecipeDetailView(AsyncViewSetView):
+  viewset_class = views.RecipeViewSet
+  actions = {'get': 'retrieve'}
+  sync_actions = {
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+  }
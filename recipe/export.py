@@ -0,0 +1,44 @@
+""" Stream a user's recipes as newline delimited JSON """
+from itertools import islice
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from core import compression
+from core.models import Recipe
+
+from recipe.serializers import RecipeDetailSerializer
+
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def export_queryset(user):
+  """ return the recipes of a user with their relations in a stable order for export """
+  return Recipe.objects.for_user(user).with_relations().order_by('id')
+
+
+def iter_recipe_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+  """ Yield lists of recipes one chunk at a time
+
+  iterator() with a chunk size runs the queryset's prefetches once per chunk, so
+  only one chunk of recipes and their relations is held in memory at any time.
+  """
+  recipes = queryset.iterator(chunk_size=chunk_size)
+  while True:
+    chunk = list(islice(recipes, chunk_size))
+    if not chunk:
+      return
+    yield chunk
+
+
+def iter_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+  """ Yield the recipes as encoded NDJSON, one bytes block per chunk """
+  encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+  for chunk in iter_recipe_chunks(queryset, chunk_size):
+    lines = [encoder.encode(item) for item in RecipeDetailSerializer(chunk, many=True).data]
+    yield ('\n'.join(lines) + '\n').encode()
+
+
+def gzip_stream(blocks, level=6):
+  """ Compress a stream of bytes blocks into one gzip member as it goes """
+  return compression.compress_stream('gzip', blocks, level)
@@ -0,0 +1,112 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from core import images
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+  """ Primary key field limited to rows owned by the requesting user """
+  
+  def get_queryset(self):
+    """ return the queryset filtered to the user in the serializer context """
+    queryset = super().get_queryset()
+    user = self.context.get('user')
+    request = self.context.get('request')
+    if user is None and request is not None:
+      user = request.user
+    
+    if user is None or not user.is_authenticated:
+      return queryset.none()
+    
+    return queryset.filter(user=user)
+  
+  @classmethod
+  def many_init(cls, *args, **kwargs):
+    """ resolve many pks with one query instead of one per pk """
+    list_kwargs = {'child_relation': cls(*args, **kwargs)}
+    for key in kwargs:
+      if key in MANY_RELATION_KWARGS:
+        list_kwargs[key] = kwargs[key]
+    
+    return BatchedManyRelatedField(**list_kwargs)
+
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+  """ Many related field that resolves every submitted pk in a single IN query
+  
+  A list serializer can fetch the pks of all its items up front with
+  prefetch(), the items then pick their objects from that one result.
+  """
+  default_error_messages = {
+    'does_not_exist': _('Invalid pks {pk_values} - objects do not exist.'),
+    'incorrect_type': _('Incorrect type. Expected pk values, received {data_types}.'),
+  }
+  # {pk: object} of the batch being validated, set by prefetch()
+  prefetched = None
+  
+  def to_pks(self, data):
+    """ return the distinct pks of the submitted data, failing on anything else """
+    if isinstance(data, str) or not hasattr(data, '__iter__'):
+      self.fail('not_a_list', input_type=type(data).__name__)
+    if not self.allow_empty and len(data) == 0:
+      self.fail('empty')
+    
+    pk_field = self.child_relation.pk_field
+    pks = []
+    wrong_types = []
+    for item in data:
+      if pk_field is not None:
+        item = pk_field.to_internal_value(item)
+      try:
+        if isinstance(item, bool):
+          raise TypeError
+        pks.append(int(item))
+      except (TypeError, ValueError):
+        wrong_types.append(type(item).__name__)
+    
+    if wrong_types:
+      self.fail('incorrect_type', data_types=', '.join(sorted(set(wrong_types))))
+    
+    return list(dict.fromkeys(pks))
+  
+  def prefetch(self, values):
+    """ Fetch the pks of several submitted values with one query for the following to_internal_value calls """
+    pks = set()
+    for data in values:
+      try:
+        pks.update(self.to_pks(data))
+      except serializers.ValidationError:
+        # reported against its item when that is validated
+        pass
+    self.prefetched = self.child_relation.get_queryset().in_bulk(pks)
+  
+  def to_internal_value(self, data):
+    """ validate the pks, then fetch them together and report every missing one """
+    pks = self.to_pks(data)
+    found = self.prefetched
+    if found is None:
+      found = self.child_relation.get_queryset().in_bulk(pks)
+    missing = [pk for pk in pks if pk not in found]
+    if missing:
+      self.fail('does_not_exist', pk_values=missing)
+    
+    return [found[pk] for pk in pks]
+
+
+class RecipeImageField(serializers.Field):
+  """ Read only field rendering a stored image as its URL and the URLs of its thumbnails
+
+  Takes the FieldFile of a model or the bare name of a values() row.
+  """
+  
+  def __init__(self, **kwargs):
+    kwargs['read_only'] = True
+    super().__init__(**kwargs)
+  
+  def to_representation(self, value):
+    name = getattr(value, 'name', value)
+    if not name:
+      return None
+    
+    return images.image_urls(name, self.context.get('request'))
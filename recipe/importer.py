@@ -0,0 +1,198 @@
+""" Import recipes from NDJSON or CSV streams in fixed-size batches """
+import codecs
+import csv
+import json
+
+from core import counters, search, sharding
+from core.data_version import bump_data_version
+from core.db import write_atomic
+from core.models import Tag, Ingredient, Recipe
+
+from recipe.serializers import RecipeImportSerializer
+
+
+IMPORT_BATCH_SIZE = 1000
+# errors past this many are counted but not reported row by row
+MAX_REPORTED_ERRORS = 100
+# separator of the tag and ingredient names in a CSV cell
+CSV_LIST_SEPARATOR = '|'
+
+FORMATS = {
+  'ndjson': ('application/x-ndjson', 'application/jsonl', '.ndjson', '.jsonl'),
+  'csv': ('text/csv', '.csv'),
+}
+
+
+def detect_format(value):
+  """ return the import format for a content type or file name, or None """
+  value = (value or '').split(';')[0].strip().lower()
+  for name, markers in FORMATS.items():
+    if any(value == marker or value.endswith(marker) for marker in markers):
+      return name
+  return None
+
+
+def decode_lines(stream, encoding='utf-8-sig'):
+  """ Yield the text lines of a binary stream, decoding incrementally """
+  decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+  for raw in stream:
+    yield decoder.decode(raw)
+  tail = decoder.decode(b'', final=True)
+  if tail:
+    yield tail
+
+
+def _names(values):
+  """ return the names of a list of names or of exported {id, name} objects """
+  if not isinstance(values, list):
+    return values
+  return [value.get('name') if isinstance(value, dict) else value for value in values]
+
+
+def read_ndjson(lines):
+  """ Yield (line number, record or None, error) for every non blank line """
+  for number, line in enumerate(lines, 1):
+    if not line.strip():
+      continue
+    try:
+      record = json.loads(line)
+    except ValueError as exc:
+      yield number, None, {'non_field_errors': [f'Invalid JSON: {exc}']}
+      continue
+    if not isinstance(record, dict):
+      yield number, None, {'non_field_errors': ['Expected a JSON object.']}
+      continue
+    
+    for name in ('tags', 'ingredients'):
+      if name in record:
+        record[name] = _names(record[name])
+    yield number, record, None
+
+
+def read_csv(lines):
+  """ Yield (line number, record, None) for every CSV row after the header """
+  reader = csv.DictReader(lines)
+  for row in reader:
+    record = {key: value for key, value in row.items() if key is not None}
+    for name in ('tags', 'ingredients'):
+      value = record.pop(name, None) or ''
+      record[name] = [item.strip() for item in value.split(CSV_LIST_SEPARATOR) if item.strip()]
+    yield reader.line_num, record, None
+
+
+READERS = {'ndjson': read_ndjson, 'csv': read_csv}
+
+
+class RecipeImport:
+  """ Create a user's recipes from a stream of records
+
+  Records are validated one by one and written in batches: every batch looks
+  up the tag and ingredient names it uses, inserts the missing ones, then the
+  recipes and their links, each with one bulk insert, in its own transaction.
+  Only the current batch and the name to id maps are kept in memory.
+  """
+  
+  def __init__(self, user, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    self.user = user
+    self.using = sharding.db_for_user(user.pk)
+    self.batch_size = batch_size
+    self.progress = progress
+    self.imported = 0
+    self.failed = 0
+    self.batches = 0
+    self.errors = []
+    self.tag_ids = {}
+    self.ingredient_ids = {}
+  
+  def run(self, records):
+    """ Import (line, record, error) tuples and return the summary """
+    batch = []
+    try:
+      for line, record, error in records:
+        if error is None:
+          serializer = RecipeImportSerializer(data=record)
+          if serializer.is_valid():
+            batch.append(serializer.validated_data)
+          else:
+            error = serializer.errors
+        
+        if error is not None:
+          self.add_error(line, error)
+        
+        if len(batch) >= self.batch_size:
+          self.write_batch(batch)
+          batch = []
+      
+      if batch:
+        self.write_batch(batch)
+    finally:
+      # bulk inserts send no signals, and committed batches stay even if a later one fails
+      if self.batches:
+        bump_data_version(self.user.pk, using=self.using)
+    
+    return self.summary()
+  
+  def add_error(self, line, error):
+    self.failed += 1
+    if len(self.errors) < MAX_REPORTED_ERRORS:
+      self.errors.append({'line': line, 'errors': error})
+  
+  def summary(self):
+    return {
+      'imported': self.imported,
+      'failed': self.failed,
+      'batches': self.batches,
+      'errors': self.errors,
+    }
+  
+  def resolve_names(self, model, known, names):
+    """ Fill known with the ids of names, inserting the names that do not exist yet """
+    missing = {name for name in names if name not in known}
+    if missing:
+      resolved = model.objects.using(self.using).resolve_names(self.user.pk, missing)
+      known.update((name, obj.id) for name, obj in resolved.items())
+  
+  def write_batch(self, batch):
+    """ Insert one batch of validated recipes with their links in one transaction """
+    TagLink = Recipe.tags.through
+    IngredientLink = Recipe.ingredients.through
+    
+    with write_atomic(using=self.using):
+      self.resolve_names(Tag, self.tag_ids, {name for attrs in batch for name in attrs['tags']})
+      self.resolve_names(
+        Ingredient, self.ingredient_ids, {name for attrs in batch for name in attrs['ingredients']}
+      )
+      recipes = Recipe.objects.using(self.using).bulk_create([
+        Recipe(
+          user=self.user, title=attrs['title'], time_minutes=attrs['time_minutes'],
+          price=attrs['price'], link=attrs.get('link', ''),
+        )
+        for attrs in batch
+      ])
+      tag_links = []
+      ingredient_links = []
+      for recipe, attrs in zip(recipes, batch):
+        tag_links.extend(
+          TagLink(recipe_id=recipe.id, tag_id=self.tag_ids[name])
+          for name in dict.fromkeys(attrs['tags'])
+        )
+        ingredient_links.extend(
+          IngredientLink(recipe_id=recipe.id, ingredient_id=self.ingredient_ids[name])
+          for name in dict.fromkeys(attrs['ingredients'])
+        )
+      TagLink.objects.using(self.using).bulk_create(tag_links)
+      IngredientLink.objects.using(self.using).bulk_create(ingredient_links)
+      counters.add_links(Tag, [recipe.id for recipe in recipes], self.using)
+      counters.add_links(Ingredient, [recipe.id for recipe in recipes], self.using)
+      search.index_recipes([recipe.id for recipe in recipes], using=self.using)
+    
+    self.imported += len(recipes)
+    self.batches += 1
+    if self.progress is not None:
+      self.progress(self.summary())
+
+
+def import_recipes(user, stream, file_format, batch_size=IMPORT_BATCH_SIZE, progress=None):
+  """ Import recipes for a user from a binary stream of NDJSON or CSV """
+  records = READERS[file_format](decode_lines(stream))
+  return RecipeImport(user, batch_size=batch_size, progress=progress).run(records)
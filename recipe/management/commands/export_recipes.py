@@ -0,0 +1,40 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe import export
+
+
+class Command(BaseCommand):
+  """ Django command to export the recipes of a user as NDJSON """
+  help = 'Stream the recipes of a user with their tags and ingredients as NDJSON'
+  
+  def add_arguments(self, parser):
+    parser.add_argument('email', help='email of the user to export')
+    parser.add_argument('--output', '-o', default='-', help='file to write, - for stdout')
+    parser.add_argument('--gzip', action='store_true', help='gzip compress the output')
+    parser.add_argument('--chunk-size', type=int, default=export.EXPORT_CHUNK_SIZE)
+  
+  def handle(self, *args, **options):
+    try:
+      user = get_user_model().objects.get(email=options['email'])
+    except get_user_model().DoesNotExist:
+      raise CommandError(f'No user with email {options["email"]}')
+    
+    content = export.iter_ndjson(export.export_queryset(user), chunk_size=options['chunk_size'])
+    if options['gzip']:
+      content = export.gzip_stream(content)
+    
+    if options['output'] == '-':
+      self.write(sys.stdout.buffer, content)
+      sys.stdout.buffer.flush()
+      return
+    
+    with open(options['output'], 'wb') as out:
+      self.write(out, content)
+    self.stderr.write(f'Exported recipes of {user.email} to {options["output"]}')
+  
+  def write(self, out, content):
+    for block in content:
+      out.write(block)
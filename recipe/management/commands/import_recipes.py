@@ -0,0 +1,50 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe import importer
+
+
+class Command(BaseCommand):
+  """ Django command to import recipes for a user from NDJSON or CSV """
+  help = 'Import recipes for a user from an NDJSON or CSV file, creating missing tags and ingredients'
+  
+  def add_arguments(self, parser):
+    parser.add_argument('email', help='email of the user to import for')
+    parser.add_argument('path', help='file to read, - for stdin')
+    parser.add_argument('--format', choices=sorted(importer.READERS), default=None,
+                        help='input format, guessed from the file name by default')
+    parser.add_argument('--batch-size', type=int, default=importer.IMPORT_BATCH_SIZE)
+  
+  def handle(self, *args, **options):
+    try:
+      user = get_user_model().objects.get(email=options['email'])
+    except get_user_model().DoesNotExist:
+      raise CommandError(f'No user with email {options["email"]}')
+    
+    file_format = options['format'] or importer.detect_format(options['path'])
+    if file_format is None:
+      raise CommandError('Cannot tell the format from the file name, pass --format')
+    
+    def progress(summary):
+      self.stdout.write(f'Imported {summary["imported"]} recipes, {summary["failed"]} rows failed')
+    
+    if options['path'] == '-':
+      summary = importer.import_recipes(
+        user, sys.stdin.buffer, file_format, batch_size=options['batch_size'], progress=progress
+      )
+    else:
+      with open(options['path'], 'rb') as stream:
+        summary = importer.import_recipes(
+          user, stream, file_format, batch_size=options['batch_size'], progress=progress
+        )
+    
+    for error in summary['errors']:
+      self.stderr.write(f'line {error["line"]}: {error["errors"]}')
+    if summary['failed'] > len(summary['errors']):
+      self.stderr.write(f'... and {summary["failed"] - len(summary["errors"])} more rows failed')
+    
+    self.stdout.write(self.style.SUCCESS(
+      f'Imported {summary["imported"]} recipes for {user.email}, {summary["failed"]} rows failed'
+    ))
@@ -0,0 +1,173 @@
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class UserCursorPagination(CursorPagination):
+  """ Keyset pagination over the rows owned by one user
+
+  DRF's paginate_queryset is split in two around the single query it runs, so
+  the async views can evaluate the page with aiterator() and share the rest.
+
+  DRF keeps only the first ordering field in the cursor and steps over its
+  ties with an offset, which is slow on a heavily tied field such as
+  recipe_count and skips or repeats rows when they change between pages. The
+  cursor here holds the values of every ordering field, which end with the
+  unique id, so a page always starts strictly after the last row of the one
+  before.
+  """
+  page_size = 100
+  page_size_query_param = 'page_size'
+  max_page_size = 1000
+  
+  def paginate_queryset(self, queryset, request, view=None):
+    page_queryset = self.get_page_queryset(queryset, request, view)
+    if page_queryset is None:
+      return None
+    
+    return self.build_page(list(page_queryset))
+  
+  async def apaginate_queryset(self, queryset, request, view=None):
+    """ async variant of paginate_queryset """
+    page_queryset = self.get_page_queryset(queryset, request, view)
+    if page_queryset is None:
+      return None
+    
+    results = [obj async for obj in page_queryset.aiterator(chunk_size=self.page_size + 1)]
+    return self.build_page(results)
+  
+  def get_page_queryset(self, queryset, request, view=None):
+    """ return the query for this page plus one extra row, or None when not paginating """
+    self.request = request
+    self.page_size = self.get_page_size(request)
+    if not self.page_size:
+      return None
+    
+    self.base_url = request.build_absolute_uri()
+    self.ordering = self.get_ordering(request, queryset, view)
+    
+    self.cursor = self.decode_cursor(request)
+    if self.cursor is None:
+      (self.offset, self.reverse, self.current_position) = (0, False, None)
+    else:
+      (self.offset, self.reverse, self.current_position) = self.cursor
+    
+    # Cursor pagination always enforces an ordering.
+    if self.reverse:
+      queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+    else:
+      queryset = queryset.order_by(*self.ordering)
+    
+    # If we have a cursor with a fixed position then filter by that.
+    if self.current_position is not None:
+      queryset = queryset.filter(self.position_filter(self.current_position))
+    
+    # We always fetch an extra item to know if there is a following page.
+    return queryset[self.offset:self.offset + self.page_size + 1]
+  
+  def position_filter(self, position):
+    """ return the condition of the rows after position, compared on every ordering field """
+    try:
+      values = json.loads(position)
+    except ValueError:
+      values = None
+    if not isinstance(values, list) or len(values) != len(self.ordering):
+      raise NotFound(self.invalid_cursor_message)
+    
+    lookups = []
+    for order in self.ordering:
+      # Test for: (cursor reversed) XOR (queryset reversed)
+      before = self.cursor.reverse != order.startswith('-')
+      lookups.append((order.lstrip('-'), 'lt' if before else 'gt', 'lte' if before else 'gte'))
+    
+    # (a, b) > (x, y) as a > x OR (a = x AND b > y), bounded by a >= x so the index range is seeked
+    after = None
+    for (name, strict, _), value in reversed(list(zip(lookups, values))):
+      condition = Q(**{f'{name}__{strict}': value})
+      after = condition if after is None else condition | (Q(**{name: value}) & after)
+    name, _, bound = lookups[0]
+    return Q(**{f'{name}__{bound}': values[0]}) & after
+  
+  def _get_position_from_instance(self, instance, ordering):
+    """ return the values of every ordering field of a model instance or values() row """
+    values = [
+      instance[order.lstrip('-')] if isinstance(instance, dict) else getattr(instance, order.lstrip('-'))
+      for order in ordering
+    ]
+    return json.dumps(values, separators=(',', ':'))
+  
+  def build_page(self, results):
+    """ set up the next/previous positions from the fetched rows and return the page """
+    self.page = list(results[:self.page_size])
+    
+    # Determine the position of the final item following the page.
+    if len(results) > len(self.page):
+      has_following_position = True
+      following_position = self._get_position_from_instance(results[-1], self.ordering)
+    else:
+      has_following_position = False
+      following_position = None
+    
+    if self.reverse:
+      # The query ran in reverse order, so flip the page back for the client.
+      self.page = list(reversed(self.page))
+      
+      self.has_next = (self.current_position is not None) or (self.offset > 0)
+      self.has_previous = has_following_position
+      if self.has_next:
+        self.next_position = self.current_position
+      if self.has_previous:
+        self.previous_position = following_position
+    else:
+      self.has_next = has_following_position
+      self.has_previous = (self.current_position is not None) or (self.offset > 0)
+      if self.has_next:
+        self.next_position = following_position
+      if self.has_previous:
+        self.previous_position = self.current_position
+    
+    # Display page controls in the browsable API if there is more than one page.
+    if (self.has_previous or self.has_next) and self.template is not None:
+      self.display_page_controls = True
+    
+    return self.page
+
+
+def _reverse_ordering(ordering_tuple):
+  """ Reverse every field of an ordering tuple """
+  def invert(x):
+    return x[1:] if x.startswith('-') else '-' + x
+  
+  return tuple([invert(item) for item in ordering_tuple])
+
+
+class NameCursorPagination(UserCursorPagination):
+  """ Paginate tags and ingredients by name, backed by the (user, name) index
+
+  ?ordering=popular pages them by recipe_count instead, most used first,
+  backed by the (user, recipe_count, id) index.
+  """
+  ordering = ('-name', '-id')
+  popular_ordering = ('-recipe_count', '-id')
+  
+  def get_ordering(self, request, queryset, view):
+    """ order by use when asked for the popular ones """
+    if request.query_params.get('ordering') == 'popular':
+      return self.popular_ordering
+    
+    return super().get_ordering(request, queryset, view)
+
+
+class RecipeCursorPagination(UserCursorPagination):
+  """ Paginate recipes by id, backed by the (user, id) index, or by rank for searches """
+  ordering = ('id',)
+  search_ordering = ('rank', 'id')
+  
+  def get_ordering(self, request, queryset, view):
+    """ order search results by their rank """
+    if 'rank' in queryset.query.annotations:
+      return self.search_ordering
+    
+    return super().get_ordering(request, queryset, view)
@@ -1,42 +1,240 @@
+from collections.abc import Mapping
+
+from django.db import IntegrityError
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework.fields import empty
 
+from core import counters, search, sharding
+from core.db import write_atomic
+from core.instrumentation import TimedSerializerMixin
+from core.data_version import bump_data_version
 from core.models import Tag, Ingredient, Recipe
 
+from recipe.fields import BatchedManyRelatedField, RecipeImageField, UserPrimaryKeyRelatedField
+
+
+def context_user(context):
+  """ return the user in a serializer context, given directly or through the request """
+  user = context.get('user')
+  request = context.get('request')
+  if user is None and request is not None:
+    user = request.user
+  return user
+
+
+class BulkCreateListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+  """ Create a list of objects with one bulk insert """
+  
+  def to_internal_value(self, data):
+    """ resolve the related pks of the whole batch with one query per field, not one per item """
+    fields = [
+      field for field in self.child.fields.values()
+      if isinstance(field, BatchedManyRelatedField) and not field.read_only
+    ]
+    if isinstance(data, list):
+      for field in fields:
+        values = (field.get_value(item) for item in data if isinstance(item, Mapping))
+        field.prefetch([value for value in values if value is not empty])
+    try:
+      return super().to_internal_value(data)
+    finally:
+      for field in fields:
+        field.prefetched = None
+  
+  def validate(self, attrs):
+    """ check the names of the whole batch with one query """
+    if isinstance(self.child, UniqueNameMixin):
+      names = [item['name'] for item in attrs]
+      taken = set(self.child.taken_names(names))
+      errors = []
+      seen = set()
+      for name in names:
+        errors.append({'name': [self.child.error_messages['name_taken']]} if name in taken or name in seen else {})
+        seen.add(name)
+      if any(errors):
+        raise serializers.ValidationError(errors)
+    
+    return attrs
+  
+  def create(self, validated_data):
+    """ Insert every object in one query and return them in input order """
+    model = self.child.Meta.model
+    using = self.get_database(validated_data)
+    with write_atomic(using=using):
+      objs = model.objects.using(using).bulk_create([model(**attrs) for attrs in validated_data])
+      # bulk inserts send no signals, so bump the owners' versions here
+      for user_id in {obj.user_id for obj in objs}:
+        bump_data_version(user_id, using=using)
+    
+    return objs
+  
+  @staticmethod
+  def get_database(validated_data):
+    """ return the shard of the user the batch is created for """
+    return sharding.db_for_user(validated_data[0]['user'].pk)
+
+
+class RecipeListSerializer(BulkCreateListSerializer):
+  """ Create a list of recipes and their tag and ingredient links in bulk """
+  
+  def create(self, validated_data):
+    """ Insert the recipes, then their links into the through tables """
+    TagLink = Recipe.tags.through
+    IngredientLink = Recipe.ingredients.through
+    using = self.get_database(validated_data)
+    
+    with write_atomic(using=using):
+      self.child.resolve_names(validated_data, validated_data[0]['user'].pk, using)
+      relations = [
+        (attrs.pop('tags', []), attrs.pop('ingredients', [])) for attrs in validated_data
+      ]
+      recipes = super().create(validated_data)
+      tag_links = []
+      ingredient_links = []
+      for recipe, (tags, ingredients) in zip(recipes, relations):
+        tag_links.extend(
+          TagLink(recipe_id=recipe.id, tag_id=tag_id)
+          for tag_id in dict.fromkeys(tag.id for tag in tags)
+        )
+        ingredient_links.extend(
+          IngredientLink(recipe_id=recipe.id, ingredient_id=ingredient_id)
+          for ingredient_id in dict.fromkeys(ingredient.id for ingredient in ingredients)
+        )
+      TagLink.objects.using(using).bulk_create(tag_links)
+      IngredientLink.objects.using(using).bulk_create(ingredient_links)
+      counters.add_links(Tag, [recipe.id for recipe in recipes], using)
+      counters.add_links(Ingredient, [recipe.id for recipe in recipes], using)
+      search.index_recipes([recipe.id for recipe in recipes], using=using)
+    
+    # reload with the relations prefetched so rendering the batch is a fixed cost
+    by_id = Recipe.objects.using(using).with_relations().in_bulk(
+      [recipe.id for recipe in recipes]
+    )
+    return [by_id[recipe.id] for recipe in recipes]
+
+
+class UniqueNameMixin:
+  """ Refuse a name the user already has with a validation error, not the constraint's """
+  default_error_messages = {
+    'name_taken': _('You already have one with this name.'),
+  }
+  
+  def taken_names(self, names):
+    """ return the names among names the user already has """
+    queryset = self.Meta.model.objects.for_user(context_user(self.context)).filter(name__in=names)
+    if self.instance is not None:
+      queryset = queryset.exclude(pk=self.instance.pk)
+    return queryset.values_list('name', flat=True)
+  
+  def validate_name(self, value):
+    # a batch checks all its names at once in its list serializer
+    if self.parent is None and self.taken_names([value]).exists():
+      self.fail('name_taken')
+    return value
+  
+  def save(self, **kwargs):
+    # a concurrent request can still take the name between the check and the insert
+    try:
+      return super().save(**kwargs)
+    except IntegrityError:
+      raise serializers.ValidationError({'name': [self.error_messages['name_taken']]})
+
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(UniqueNameMixin, TimedSerializerMixin, serializers.ModelSerializer):
   """ Serializer for tag objects """
   class Meta:
     model = Tag
-    fields = ('id','name')
-    read_only_fields = ('id',)
+    fields = ('id','name', 'recipe_count')
+    read_only_fields = ('id', 'recipe_count')
+    list_serializer_class = BulkCreateListSerializer
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(UniqueNameMixin, TimedSerializerMixin, serializers.ModelSerializer):
   """ Serializer for ingredient objects """
   class Meta:
     model = Ingredient
-    fields = ('id','name')
-    read_only_fields = ('id',)
+    fields = ('id','name', 'recipe_count')
+    read_only_fields = ('id', 'recipe_count')
+    list_serializer_class = BulkCreateListSerializer
 
-class RecipeSerializer(serializers.ModelSerializer):
-  """ Serializer for recipe objects """
-  ingredients = serializers.PrimaryKeyRelatedField(
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+  """ Serializer for recipe objects
+
+  Tags and ingredients are given by id, by name in tag_names and
+  ingredient_names, or both. Names the user doesn't have yet are created.
+  The image is read only here, it is uploaded through the upload-image action.
+  """
+  ingredients = UserPrimaryKeyRelatedField(
     many = True,
+    required = False,
     queryset = Ingredient.objects.all()
   )
-  tags = serializers.PrimaryKeyRelatedField(
+  tags = UserPrimaryKeyRelatedField(
     many = True,
+    required = False,
     queryset = Tag.objects.all() 
   )
+  ingredient_names = serializers.ListField(
+    child=serializers.CharField(max_length=250), write_only=True, required=False
+  )
+  tag_names = serializers.ListField(
+    child=serializers.CharField(max_length=250), write_only=True, required=False
+  )
+  image = RecipeImageField()
+  # names field -> (relation it adds to, model)
+  name_fields = {
+    'tag_names': ('tags', Tag),
+    'ingredient_names': ('ingredients', Ingredient),
+  }
   
   class Meta:
     model = Recipe
     fields = (
-      'id','title','ingredients', 'tags', 'time_minutes', 'price', 'link'
+      'id','title','ingredients', 'tags', 'time_minutes', 'price', 'link', 'image',
+      'ingredient_names', 'tag_names',
       )
     read_only_fields = ('id',)
+    list_serializer_class = RecipeListSerializer
+  
+  def resolve_names(self, items, user_id, using):
+    """ Turn the names of validated items into objects, one lookup and one insert per model for all items """
+    for names_field, (relation, model) in self.name_fields.items():
+      resolved = model.objects.using(using).resolve_names(
+        user_id, {name for attrs in items for name in attrs.get(names_field, ())}
+      )
+      for attrs in items:
+        if names_field in attrs:
+          named = [resolved[name] for name in attrs.pop(names_field)]
+          attrs[relation] = list(dict.fromkeys([*attrs.get(relation, ()), *named]))
+  
+  def create(self, validated_data):
+    using = sharding.db_for_user(validated_data['user'].pk)
+    with write_atomic(using=using):
+      self.resolve_names([validated_data], validated_data['user'].pk, using)
+      return super().create(validated_data)
+  
+  def update(self, instance, validated_data):
+    using = instance._state.db
+    with write_atomic(using=using):
+      self.resolve_names([validated_data], instance.user_id, using)
+      return super().update(instance, validated_data)
 
 
 class RecipeDetailSerializer(RecipeSerializer):
   """ Serialize a recipe details """
   ingredients = IngredientSerializer(many=True, read_only=True)
-  tags = TagSerializer(many=True, read_only=True)
\ No newline at end of file
+  tags = TagSerializer(many=True, read_only=True)
+
+
+class RecipeImportSerializer(serializers.ModelSerializer):
+  """ Validate one imported recipe, naming its tags and ingredients """
+  tags = serializers.ListField(
+    child=serializers.CharField(max_length=250), required=False, default=list
+  )
+  ingredients = serializers.ListField(
+    child=serializers.CharField(max_length=250), required=False, default=list
+  )
+  
+  class Meta:
+    model = Recipe
+    fields = ('title', 'time_minutes', 'price', 'link', 'tags', 'ingredients')
@@ -0,0 +1,110 @@
+""" Per-user recipe statistics, aggregated in the database and cached per data version
+
+A summary is computed on first request after the user's data changed and
+cached under their current data version, so it is never recomputed while
+nothing changes and never served once something has.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Max, Min, Q, Window
+from django.db.models.functions import RowNumber
+
+from core import sharding
+from core.data_version import get_data_version
+from core.models import Tag, Ingredient, Recipe
+
+
+# upper bounds of the time_minutes buckets, the last bucket is open ended
+TIME_BUCKETS = (15, 30, 60, 120)
+PRICE_PERCENTILES = (25, 50, 75, 90)
+TOP_COUNT = 5
+# summaries of older versions are never read again, this only bounds their lifetime
+STATS_CACHE_SECONDS = 24 * 60 * 60
+
+CENT = Decimal('0.01')
+
+
+def _stats_key(user_id, version):
+  return f'recipe:stats:{user_id}:{version}'
+
+
+def _price(value):
+  """ return a price as the API renders prices """
+  return None if value is None else str(Decimal(value).quantize(CENT))
+
+
+def time_buckets():
+  """ return the (min, max) bounds of the time_minutes histogram, max None for the last """
+  lower = (0, *TIME_BUCKETS)
+  return list(zip(lower, (*TIME_BUCKETS, None)))
+
+
+def price_percentiles(recipes, count):
+  """ return {pN: price} by nearest rank, all percentiles from one windowed query """
+  if not count:
+    return {f'p{percentile}': None for percentile in PRICE_PERCENTILES}
+  
+  # the 1 based rank of the price at or below which percentile % of the recipes fall
+  ranks = {percentile: max(1, -(-percentile * count // 100)) for percentile in PRICE_PERCENTILES}
+  prices = dict(
+    recipes.annotate(position=Window(RowNumber(), order_by=(F('price').asc(), F('id').asc())))
+    .filter(position__in=set(ranks.values())).values_list('position', 'price')
+  )
+  return {f'p{percentile}': _price(prices[rank]) for percentile, rank in ranks.items()}
+
+
+def top_used(model, user_id, using):
+  """ return the most used tags or ingredients, read off their recipe counts """
+  return list(
+    model.objects.using(using).filter(user_id=user_id, recipe_count__gt=0)
+    .order_by('-recipe_count', '-id').values('id', 'name', 'recipe_count')[:TOP_COUNT]
+  )
+
+
+def compute_stats(user_id):
+  """ Aggregate the statistics of a user's recipes """
+  # summaries outlive the request, so they are read where the user's data is written
+  using = sharding.db_for_user(user_id)
+  recipes = Recipe.objects.using(using).filter(user_id=user_id)
+  buckets = time_buckets()
+  totals = recipes.aggregate(
+    count=Count('id'),
+    average_price=Avg('price'),
+    min_price=Min('price'),
+    max_price=Max('price'),
+    **{
+      f'bucket_{index}': Count('id', filter=Q(time_minutes__gte=low, **(
+        {} if high is None else {'time_minutes__lt': high}
+      )))
+      for index, (low, high) in enumerate(buckets)
+    },
+  )
+  return {
+    'count': totals['count'],
+    'price': {
+      'average': _price(totals['average_price']),
+      'min': _price(totals['min_price']),
+      'max': _price(totals['max_price']),
+      'percentiles': price_percentiles(recipes, totals['count']),
+    },
+    'time_minutes_histogram': [
+      {'min': low, 'max': high, 'count': totals[f'bucket_{index}']}
+      for index, (low, high) in enumerate(buckets)
+    ],
+    'top_tags': top_used(Tag, user_id, using),
+    'top_ingredients': top_used(Ingredient, user_id, using),
+  }
+
+
+def get_stats(user_id, version=None):
+  """ return the user's statistics, computing them only if their data changed since last time """
+  if version is None:
+    version = get_data_version(user_id)
+  key = _stats_key(user_id, version)
+  stats = cache.get(key)
+  if stats is None:
+    stats = compute_stats(user_id)
+    cache.set(key, stats, STATS_CACHE_SECONDS)
+  
+  return stats
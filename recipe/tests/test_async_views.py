@@ -0,0 +1,212 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import include, path, reverse
+
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe, Ingredient, Tag
+from user.authentication import token_cache
+
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer, TagSerializer
+from recipe.urls import async_urlpatterns, router
+
+
+# the deployment switch is read at import, so mount the async views explicitly
+urlpatterns = [
+  path('api/recipe/', include((async_urlpatterns + router.urls, 'recipe'))),
+]
+
+
+def detail_url(recipe_id):
+  """ Return recipe details url """
+  return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncRecipeViewsTests(TestCase):
+  """ Test the async views serve the same API as the sync viewsets """
+  
+  def setUp(self):
+    cache.clear()
+    token_cache.clear()
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.token = Token.objects.create(user=self.user)
+    self.headers = {'Authorization': f'Token {self.token.key}'}
+    self.tag = Tag.objects.create(user=self.user, name='Vegan')
+    self.ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+    self.recipe = Recipe.objects.create(
+      user=self.user, title='Curry', time_minutes=20, price=5.00
+    )
+    self.recipe.tags.add(self.tag)
+    self.recipe.ingredients.add(self.ingredient)
+  
+  
+  async def test_authentication_required(self):
+    """ Test the async views reject requests without a valid token """
+    res = await self.async_client.get(reverse('recipe:recipe-list'))
+    self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+    self.assertEqual(res['WWW-Authenticate'], 'Token')
+    
+    res = await self.async_client.get(
+      reverse('recipe:tag-list'), headers={'Authorization': 'Token wrong'}
+    )
+    self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+  
+  
+  async def test_list_recipes(self):
+    """ Test listing recipes returns the sync payload """
+    other = await get_user_model().objects.acreate(email='other@example.com')
+    await Recipe.objects.acreate(user=other, title='Other', time_minutes=5, price=1)
+    
+    res = await self.async_client.get(reverse('recipe:recipe-list'), headers=self.headers)
+    
+    recipes = Recipe.objects.filter(user=self.user)
+    expected = await sync_to_async(lambda: RecipeSerializer(recipes, many=True).data)()
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(res.json()['results'], [dict(item) for item in expected])
+    self.assertIsNone(res.json()['next'])
+  
+  
+  async def test_list_paginates(self):
+    """ Test the async list follows the cursor pagination """
+    await Tag.objects.abulk_create([Tag(user=self.user, name=f'tag {i:02}') for i in range(5)])
+    url = reverse('recipe:tag-list')
+    
+    res = await self.async_client.get(url, {'page_size': 4}, headers=self.headers)
+    names = [item['name'] for item in res.json()['results']]
+    res = await self.async_client.get(res.json()['next'], headers=self.headers)
+    names += [item['name'] for item in res.json()['results']]
+    
+    self.assertEqual(names, ['tag 04', 'tag 03', 'tag 02', 'tag 01', 'tag 00', 'Vegan'])
+  
+  
+  async def test_list_not_modified(self):
+    """ Test the async list answers a current etag with 304 """
+    url = reverse('recipe:ingredient-list')
+    res = await self.async_client.get(url, headers=self.headers)
+    
+    res = await self.async_client.get(url, headers={**self.headers, 'If-None-Match': res['ETag']})
+    
+    self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+  
+  
+  async def test_retrieve_recipe(self):
+    """ Test the async detail view returns the nested recipe """
+    res = await self.async_client.get(detail_url(self.recipe.id), headers=self.headers)
+    
+    recipe = await Recipe.objects.with_relations().aget(pk=self.recipe.pk)
+    expected = await sync_to_async(lambda: RecipeDetailSerializer(recipe).data)()
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(res.json(), expected)
+  
+  
+  async def test_retrieve_other_users_recipe(self):
+    """ Test recipes of other users are not found """
+    other = await get_user_model().objects.acreate(email='other@example.com')
+    recipe = await Recipe.objects.acreate(user=other, title='Other', time_minutes=5, price=1)
+    
+    for recipe_id in (recipe.id, 'abc'):
+      res = await self.async_client.get(detail_url(recipe_id), headers=self.headers)
+      self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+  
+  
+  async def test_create_tag(self):
+    """ Test creating a tag with the async ORM """
+    res = await self.async_client.post(
+      reverse('recipe:tag-list'), {'name': 'Dessert'},
+      content_type='application/json', headers=self.headers,
+    )
+    
+    tag = await Tag.objects.aget(user=self.user, name='Dessert')
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(res.json(), TagSerializer(tag).data)
+  
+  
+  async def test_create_recipe_with_links(self):
+    """ Test creating a recipe sets its tags and ingredients """
+    payload = {
+      'title': 'Soup', 'time_minutes': 10, 'price': '2.50',
+      'tags': [self.tag.id], 'ingredients': [self.ingredient.id],
+    }
+    res = await self.async_client.post(
+      reverse('recipe:recipe-list'), payload,
+      content_type='application/json', headers=self.headers,
+    )
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    recipe = await Recipe.objects.aget(pk=res.json()['id'])
+    self.assertEqual([tag.id async for tag in recipe.tags.all()], [self.tag.id])
+    self.assertEqual(res.json()['ingredients'], [self.ingredient.id])
+  
+  
+  async def test_create_recipe_with_names(self):
+    """ Test creating a recipe resolves tag and ingredient names """
+    payload = {
+      'title': 'Soup', 'time_minutes': 10, 'price': '2.50',
+      'tag_names': ['Vegan', 'Starter'], 'ingredient_names': ['Salt'],
+    }
+    res = await self.async_client.post(
+      reverse('recipe:recipe-list'), payload,
+      content_type='application/json', headers=self.headers,
+    )
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    starter = await Tag.objects.aget(user=self.user, name='Starter')
+    self.assertEqual(sorted(res.json()['tags']), sorted([self.tag.id, starter.id]))
+    self.assertEqual(res.json()['ingredients'], [self.ingredient.id])
+  
+  
+  async def test_create_tag_name_race(self):
+    """ Test a name taken between validation and insert is a 400 as in the sync views """
+    # as if another request created the tag right after this one checked the name
+    with mock.patch.object(TagSerializer, 'taken_names', return_value=Tag.objects.none()):
+      res = await self.async_client.post(
+        reverse('recipe:tag-list'), {'name': 'Vegan'},
+        content_type='application/json', headers=self.headers,
+      )
+    
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertIn('name', res.json())
+  
+  
+  async def test_create_invalid_recipe(self):
+    """ Test validation errors are returned as by the sync views """
+    payload = {'title': 'Soup', 'time_minutes': 10, 'price': '2.50', 'tags': [0]}
+    res = await self.async_client.post(
+      reverse('recipe:recipe-list'), payload,
+      content_type='application/json', headers=self.headers,
+    )
+    
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertIn('tags', res.json())
+  
+  
+  async def test_batch_create(self):
+    """ Test list payloads still use the bulk insert path """
+    res = await self.async_client.post(
+      reverse('recipe:ingredient-list'), [{'name': 'Pepper'}, {'name': 'Oil'}],
+      content_type='application/json', headers=self.headers,
+    )
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual([item['name'] for item in res.json()], ['Pepper', 'Oil'])
+  
+  
+  async def test_update_falls_back_to_sync_view(self):
+    """ Test methods without an async implementation use the sync viewset """
+    res = await self.async_client.patch(
+      detail_url(self.recipe.id), {'title': 'Green curry'},
+      content_type='application/json', headers=self.headers,
+    )
+    
+    await self.recipe.arefresh_from_db()
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(self.recipe.title, 'Green curry')
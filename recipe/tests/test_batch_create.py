@@ -0,0 +1,165 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+INGREDIENT_URL = reverse('recipe:ingredient-list')
+
+
+def insert_count(queries):
+  """ Count the INSERT statements into model tables among captured queries """
+  return sum(
+    1 for query in queries
+    if query['sql'].startswith('INSERT') and 'core_recipe_fts' not in query['sql']
+  )
+
+
+class BatchCreateTests(TestCase):
+  """ Test creating tags, ingredients and recipes from a list payload """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+  
+  
+  def test_batch_create_tags(self):
+    """ Test a list of tags is created in one insert, ids in input order """
+    payload = [{'name': 'Vegan'}, {'name': 'Dessert'}, {'name': 'Curry'}]
+    
+    with CaptureQueriesContext(connection) as queries:
+      res = self.client.post(TAG_URL, payload, format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(insert_count(queries), 1)
+    self.assertEqual([t['name'] for t in res.data], [t['name'] for t in payload])
+    for item in res.data:
+      tag = Tag.objects.get(id=item['id'])
+      self.assertEqual(tag.name, item['name'])
+      self.assertEqual(tag.user, self.user)
+  
+  
+  def test_batch_create_ingredients(self):
+    """ Test a list of ingredients is created for the user """
+    payload = [{'name': 'Salt'}, {'name': 'Pepper'}]
+    
+    res = self.client.post(INGREDIENT_URL, payload, format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 2)
+  
+  
+  def test_batch_create_recipes_with_relations(self):
+    """ Test recipes and their links are created with one insert per table """
+    tag = Tag.objects.create(user=self.user, name='Vegan')
+    ingredient1 = Ingredient.objects.create(user=self.user, name='Salt')
+    ingredient2 = Ingredient.objects.create(user=self.user, name='Tofu')
+    payload = [
+      {
+        'title': f'recipe {i}',
+        'time_minutes': 10 + i,
+        'price': '5.00',
+        'tags': [tag.id],
+        'ingredients': [ingredient1.id, ingredient2.id, ingredient1.id],
+      }
+      for i in range(5)
+    ]
+    
+    with CaptureQueriesContext(connection) as queries:
+      res = self.client.post(RECIPE_URL, payload, format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(insert_count(queries), 3)
+    self.assertEqual([r['title'] for r in res.data], [r['title'] for r in payload])
+    for item in res.data:
+      recipe = Recipe.objects.get(id=item['id'])
+      self.assertEqual(list(recipe.tags.all()), [tag])
+      self.assertEqual(recipe.ingredients.count(), 2)
+      self.assertEqual(item['ingredients'], [ingredient1.id, ingredient2.id])
+  
+  
+  def test_batch_create_recipes_fixed_queries(self):
+    """ Test validating and creating a batch of recipes costs the same queries whatever its size """
+    tags = [Tag.objects.create(user=self.user, name=f'tag {i}') for i in range(3)]
+    ingredients = [Ingredient.objects.create(user=self.user, name=f'ingredient {i}') for i in range(3)]
+    
+    def payload(size, start):
+      return [
+        {
+          'title': f'recipe {start + i}',
+          'time_minutes': 10,
+          'price': '5.00',
+          'tags': [tags[i % 3].id],
+          'ingredients': [ingredients[i % 3].id, ingredients[(i + 1) % 3].id],
+          'tag_names': [f'named {start} {i % 2}'],
+        }
+        for i in range(size)
+      ]
+    
+    for size, start in ((2, 0), (50, 2)):
+      with self.subTest(size=size), self.assertNumQueries(20):
+        res = self.client.post(RECIPE_URL, payload(size, start), format='json')
+      self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+  
+  
+  def test_batch_invalid_pks_reported_per_item(self):
+    """ Test the pks fetched for the whole batch are still checked item by item """
+    tag = Tag.objects.create(user=self.user, name='Vegan')
+    other = get_user_model().objects.create_user(email='other@example.com', password='test1234')
+    other_tag = Tag.objects.create(user=other, name='Vegan')
+    payload = [
+      {'title': 'Curry', 'time_minutes': 10, 'price': '5.00', 'tags': [tag.id]},
+      {'title': 'Soup', 'time_minutes': 10, 'price': '5.00', 'tags': [other_tag.id]},
+      {'title': 'Stew', 'time_minutes': 10, 'price': '5.00', 'tags': 'Vegan'},
+    ]
+    
+    res = self.client.post(RECIPE_URL, payload, format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(set(res.data), {1, 2})
+    self.assertEqual(res.data[1]['tags'][0].code, 'does_not_exist')
+    self.assertEqual(res.data[2]['tags'][0].code, 'not_a_list')
+    self.assertFalse(Recipe.objects.exists())
+  
+  
+  def test_batch_is_all_or_nothing(self):
+    """ Test one invalid item rejects the whole batch """
+    payload = [{'name': 'Vegan'}, {'name': ''}]
+    
+    res = self.client.post(TAG_URL, payload, format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertIn('name', res.data[1])
+    self.assertFalse(Tag.objects.exists())
+  
+  
+  def test_empty_batch_invalid(self):
+    """ Test an empty list is rejected """
+    res = self.client.post(TAG_URL, [], format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+  
+  
+  def test_list_update_invalid(self):
+    """ Test a list body on update is a validation error, batches are for create only """
+    recipe = Recipe.objects.create(user=self.user, title='Curry', time_minutes=20, price=5.00)
+    url = reverse('recipe:recipe-detail', args=[recipe.id])
+    payload = [{'title': 'Soup', 'time_minutes': 10, 'price': '2.50'}]
+    
+    for method in (self.client.put, self.client.patch):
+      res = method(url, payload, format='json')
+      self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    recipe.refresh_from_db()
+    self.assertEqual(recipe.title, 'Curry')
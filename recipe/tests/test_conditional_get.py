@@ -0,0 +1,95 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+INGREDIENT_URL = reverse('recipe:ingredient-list')
+
+
+def detail_url(recipe_id):
+  """ Return recipe details url """
+  return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ConditionalGetTests(TestCase):
+  """ Test ETag and 304 handling of the recipe API """
+  
+  def setUp(self):
+    cache.clear()
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+    self.recipe = Recipe.objects.create(
+      user=self.user, title='Curry', time_minutes=20, price=5.00
+    )
+  
+  
+  def assertNotModified(self, url, etag):
+    """ Assert the url answers 304 for the etag without any query """
+    with self.assertNumQueries(0):
+      res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+    self.assertEqual(res['ETag'], etag)
+  
+  
+  def test_unchanged_list_not_modified(self):
+    """ Test every list endpoint answers a current etag with 304 """
+    for url in (RECIPE_URL, TAG_URL, INGREDIENT_URL):
+      res = self.client.get(url)
+      self.assertEqual(res.status_code, status.HTTP_200_OK)
+      self.assertIn('ETag', res)
+      self.assertNotModified(url, res['ETag'])
+  
+  
+  def test_unchanged_detail_not_modified(self):
+    """ Test the recipe detail answers a current etag with 304 """
+    url = detail_url(self.recipe.id)
+    res = self.client.get(url)
+    
+    self.assertNotModified(url, res['ETag'])
+  
+  
+  def test_changes_invalidate_etag(self):
+    """ Test creating, linking and deleting objects change the etag """
+    etag = self.client.get(RECIPE_URL)['ETag']
+    changes = [
+      lambda: Tag.objects.create(user=self.user, name='Vegan'),
+      lambda: self.recipe.tags.add(Tag.objects.get(name='Vegan')),
+      lambda: self.recipe.tags.clear(),
+      lambda: Ingredient.objects.create(user=self.user, name='Salt').delete(),
+      lambda: self.client.post(TAG_URL, [{'name': 'Batch'}], format='json'),
+    ]
+    for change in changes:
+      change()
+      res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+      self.assertEqual(res.status_code, status.HTTP_200_OK)
+      self.assertNotEqual(res['ETag'], etag)
+      etag = res['ETag']
+  
+  
+  def test_other_users_changes_keep_etag(self):
+    """ Test another user's changes do not invalidate the etag """
+    etag = self.client.get(TAG_URL)['ETag']
+    user2 = get_user_model().objects.create_user('other@example.com', 'test1234')
+    Tag.objects.create(user=user2, name='Dessert')
+    
+    self.assertNotModified(TAG_URL, etag)
+  
+  
+  def test_etag_depends_on_query(self):
+    """ Test each page of a list has its own etag """
+    first = self.client.get(RECIPE_URL)['ETag']
+    second = self.client.get(f'{RECIPE_URL}?page_size=1')['ETag']
+    
+    self.assertNotEqual(first, second)
@@ -0,0 +1,93 @@
+import gzip
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient, Tag
+
+from recipe import export
+from recipe.serializers import RecipeDetailSerializer
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def read_lines(content):
+  """ Decode NDJSON bytes into a list of objects """
+  return [json.loads(line) for line in content.decode().splitlines()]
+
+
+class RecipeExportTests(TestCase):
+  """ Test streaming the recipe export """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+    tags = Tag.objects.bulk_create([Tag(user=self.user, name=f'tag {i}') for i in range(3)])
+    ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+    for i in range(5):
+      recipe = Recipe.objects.create(
+        user=self.user, title=f'Recipe {i}', time_minutes=10 + i, price='4.50'
+      )
+      recipe.tags.set(tags[:i % 3 + 1])
+      recipe.ingredients.add(ingredient)
+  
+  
+  def expected(self):
+    recipes = Recipe.objects.filter(user=self.user).with_relations().order_by('id')
+    return json.loads(json.dumps(RecipeDetailSerializer(recipes, many=True).data))
+  
+  
+  def test_export_streams_ndjson(self):
+    """ Test the export streams one detail object per line """
+    other = get_user_model().objects.create_user(email='other@example.com', password='test1234')
+    Recipe.objects.create(user=other, title='Other', time_minutes=5, price=1)
+    
+    res = self.client.get(EXPORT_URL)
+    
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertTrue(res.streaming)
+    self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+    self.assertIn('recipes.ndjson', res['Content-Disposition'])
+    self.assertEqual(read_lines(b''.join(res.streaming_content)), self.expected())
+  
+  
+  def test_export_gzip(self):
+    """ Test the export can be gzip compressed """
+    res = self.client.get(EXPORT_URL, {'gzip': '1'})
+    
+    self.assertEqual(res['Content-Type'], 'application/gzip')
+    content = gzip.decompress(b''.join(res.streaming_content))
+    self.assertEqual(read_lines(content), self.expected())
+  
+  
+  def test_queries_per_chunk(self):
+    """ Test the recipes are read by one cursor and each chunk prefetches its relations """
+    queryset = export.export_queryset(self.user)
+    
+    with self.assertNumQueries(1 + 3 * 2):
+      blocks = list(export.iter_ndjson(queryset, chunk_size=2))
+    
+    self.assertEqual(len(blocks), 3)
+  
+  
+  def test_export_command(self):
+    """ Test the command writes the same NDJSON to a file """
+    with tempfile.TemporaryDirectory() as tmp:
+      path = Path(tmp) / 'recipes.ndjson.gz'
+      call_command('export_recipes', self.user.email, output=str(path), gzip=True, stderr=StringIO())
+      
+      self.assertEqual(read_lines(gzip.decompress(path.read_bytes())), self.expected())
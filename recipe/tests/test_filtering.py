@@ -0,0 +1,151 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+INGREDIENT_URL = reverse('recipe:ingredient-list')
+
+
+def sample_recipe(user, title='Briyani'):
+  """ Create and return sample recipe object"""
+  return Recipe.objects.create(user=user, title=title, time_minutes=30, price=5.00)
+
+
+class FilteringTests(TestCase):
+  """ Test filtering recipes by relations and tags/ingredients by use """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+    
+    self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+    self.spicy = Tag.objects.create(user=self.user, name='Spicy')
+    self.unused_tag = Tag.objects.create(user=self.user, name='Unused')
+    self.tofu = Ingredient.objects.create(user=self.user, name='Tofu')
+    self.unused_ingredient = Ingredient.objects.create(user=self.user, name='Saffron')
+    
+    self.curry = sample_recipe(self.user, 'Curry')
+    self.curry.tags.add(self.vegan, self.spicy)
+    self.curry.ingredients.add(self.tofu)
+    self.salad = sample_recipe(self.user, 'Salad')
+    self.salad.tags.add(self.vegan)
+    self.stew = sample_recipe(self.user, 'Stew')
+  
+  
+  def ids(self, url, params):
+    res = self.client.get(url, params)
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    return sorted(item['id'] for item in res.data['results'])
+  
+  
+  def test_filter_recipes_by_tags(self):
+    """ Test recipes having any of the given tags are returned once each """
+    ids = self.ids(RECIPE_URL, {'tags': f'{self.vegan.id},{self.spicy.id}'})
+    
+    self.assertEqual(ids, [self.curry.id, self.salad.id])
+  
+  
+  def test_filter_recipes_by_tags_and_ingredients(self):
+    """ Test the tag and ingredient filters combine """
+    ids = self.ids(RECIPE_URL, {'tags': str(self.vegan.id), 'ingredients': str(self.tofu.id)})
+    
+    self.assertEqual(ids, [self.curry.id])
+  
+  
+  def test_filter_invalid_ids(self):
+    """ Test non numeric ids are rejected """
+    res = self.client.get(RECIPE_URL, {'tags': '1,abc'})
+    
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+  
+  
+  def test_assigned_only(self):
+    """ Test tags and ingredients can be limited to those used by a recipe """
+    self.assertEqual(self.ids(TAG_URL, {'assigned_only': 1}), sorted([self.vegan.id, self.spicy.id]))
+    self.assertEqual(self.ids(INGREDIENT_URL, {'assigned_only': 1}), [self.tofu.id])
+    self.assertEqual(len(self.ids(TAG_URL, {})), 3)
+  
+  
+  def test_popular_ordering(self):
+    """ Test tags can be listed most used first with their recipe counts """
+    res = self.client.get(TAG_URL, {'ordering': 'popular', 'page_size': 2})
+    page = [(tag['name'], tag['recipe_count']) for tag in res.data['results']]
+    res = self.client.get(res.data['next'])
+    page += [(tag['name'], tag['recipe_count']) for tag in res.data['results']]
+    
+    self.assertEqual(page, [('Vegan', 2), ('Spicy', 1), ('Unused', 0)])
+  
+  
+  def test_batch_create_counts_links(self):
+    """ Test recipes created in a batch are counted on their tags """
+    payload = [
+      {'title': title, 'time_minutes': 5, 'price': '1.00', 'tags': [self.spicy.id], 'ingredients': []}
+      for title in ('Chili', 'Salsa')
+    ]
+    res = self.client.post(RECIPE_URL, payload, format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.spicy.refresh_from_db()
+    self.assertEqual(self.spicy.recipe_count, 3)
+
+
+class FilterQueryPlanTests(TestCase):
+  """ Test the filters stay index driven """
+  
+  def setUp(self):
+    if connection.vendor != 'sqlite':
+      self.skipTest('query plans are checked on SQLite')
+    self.user = get_user_model().objects.create_user('test@example.com', 'test1234')
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+  
+  
+  def plan_for(self, url, params):
+    """ return the query plans of the queries run for a request """
+    with CaptureQueriesContext(connection) as queries:
+      self.client.get(url, params)
+    
+    plans = []
+    with connection.cursor() as cursor:
+      for query in queries:
+        if 'EXISTS' not in query['sql']:
+          continue
+        cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+        plans.append('\n'.join(row[-1] for row in cursor.fetchall()))
+    
+    self.assertTrue(plans)
+    return plans
+  
+  
+  def assertIndexDriven(self, plan, table):
+    """ Assert the plan never scans table or the through tables """
+    for line in plan.splitlines():
+      self.assertNotIn('SCAN core_recipe_', line)
+      self.assertFalse(line.startswith(f'SCAN {table}'), plan)
+    self.assertIn('USING COVERING INDEX', plan)
+  
+  
+  def test_recipe_filter_plan(self):
+    """ Test the recipe filter probes the through tables by index """
+    for plan in self.plan_for(RECIPE_URL, {'tags': '1,2', 'ingredients': '3'}):
+      self.assertIndexDriven(plan, 'core_recipe')
+  
+  
+  def test_assigned_only_plan(self):
+    """ Test the assigned only filter probes the through tables by index """
+    for url, table in ((TAG_URL, 'core_tag'), (INGREDIENT_URL, 'core_ingredient')):
+      for plan in self.plan_for(url, {'assigned_only': 1}):
+        self.assertIndexDriven(plan, table)
@@ -0,0 +1,174 @@
+import io
+import json
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient, Tag
+
+from recipe import export, importer
+
+
+IMPORT_URL = reverse('recipe:recipe-import')
+
+
+def ndjson(*records):
+  """ Encode records as NDJSON bytes """
+  return ''.join(json.dumps(record) + '\n' for record in records).encode()
+
+
+class RecipeImportTests(TestCase):
+  """ Test the streaming recipe import """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+  
+  
+  def test_import_ndjson_creates_missing_names(self):
+    """ Test importing NDJSON reuses existing tags and creates missing ones """
+    vegan = Tag.objects.create(user=self.user, name='Vegan')
+    other = get_user_model().objects.create_user(email='other@example.com', password='test1234')
+    Tag.objects.create(user=other, name='Quick')
+    body = ndjson(
+      {'title': 'Soup', 'time_minutes': 10, 'price': '2.50', 'tags': ['Vegan', 'Quick'], 'ingredients': ['Salt']},
+      {'title': 'Stew', 'time_minutes': 60, 'price': '7.00', 'tags': ['Quick'], 'ingredients': ['Salt', 'Salt']},
+    )
+    
+    res = self.client.post(IMPORT_URL, body, content_type='application/x-ndjson')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(res.data['imported'], 2)
+    self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+    self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+    soup = Recipe.objects.get(user=self.user, title='Soup')
+    self.assertEqual(soup.price, Decimal('2.50'))
+    self.assertIn(vegan, soup.tags.all())
+    self.assertEqual(Recipe.objects.get(title='Stew').ingredients.count(), 1)
+  
+  
+  def test_import_csv(self):
+    """ Test importing CSV with | separated names """
+    body = (
+      'title,time_minutes,price,link,tags,ingredients\n'
+      'Curry,20,5.00,,Spicy|Dinner,Rice|Chili\n'
+      '"Pie, apple",45,3.25,https://example.com,Dessert,\n'
+    ).encode()
+    
+    res = self.client.post(IMPORT_URL, body, content_type='text/csv')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    pie = Recipe.objects.get(title='Pie, apple')
+    self.assertEqual(list(pie.tags.values_list('name', flat=True)), ['Dessert'])
+    self.assertEqual(pie.ingredients.count(), 0)
+    self.assertEqual(Recipe.objects.get(title='Curry').tags.count(), 2)
+  
+  
+  def test_rows_with_errors_are_reported(self):
+    """ Test invalid rows are reported by line and the others imported """
+    body = ndjson({'title': 'Soup', 'time_minutes': 10, 'price': '2.50'}) + b'not json\n' + ndjson(
+      {'title': 'Stew', 'time_minutes': 'long', 'price': '7.00'},
+    )
+    
+    res = self.client.post(IMPORT_URL, body, content_type='application/x-ndjson')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(res.data['imported'], 1)
+    self.assertEqual(res.data['failed'], 2)
+    self.assertEqual([error['line'] for error in res.data['errors']], [2, 3])
+    self.assertIn('time_minutes', res.data['errors'][1]['errors'])
+  
+  
+  def test_names_longer_than_the_model_allows_are_reported(self):
+    """ Test a tag or ingredient name over 250 characters fails its row, not the insert """
+    body = ndjson(
+      {'title': 'Soup', 'time_minutes': 10, 'price': '2.50', 'tags': ['x' * 250]},
+      {'title': 'Stew', 'time_minutes': 60, 'price': '7.00', 'tags': ['x' * 251]},
+      {'title': 'Pie', 'time_minutes': 45, 'price': '3.25', 'ingredients': ['y' * 251]},
+    )
+    
+    res = self.client.post(IMPORT_URL, body, content_type='application/x-ndjson')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(res.data['imported'], 1)
+    self.assertEqual([error['line'] for error in res.data['errors']], [2, 3])
+    self.assertIn('tags', res.data['errors'][0]['errors'])
+    self.assertIn('ingredients', res.data['errors'][1]['errors'])
+    self.assertEqual(list(Tag.objects.values_list('name', flat=True)), ['x' * 250])
+  
+  
+  def test_import_uploaded_file(self):
+    """ Test a multipart upload is imported by its file name """
+    upload = SimpleUploadedFile('recipes.ndjson', ndjson({'title': 'Soup', 'time_minutes': 1, 'price': '1'}))
+    
+    res = self.client.post(IMPORT_URL, {'file': upload}, format='multipart')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(res.data['imported'], 1)
+  
+  
+  def test_unknown_format_rejected(self):
+    """ Test a body in an unknown format is rejected """
+    res = self.client.post(IMPORT_URL, b'<recipes/>', content_type='application/xml')
+    
+    self.assertEqual(res.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+  
+  
+  def test_batches_use_fixed_queries(self):
+    """ Test every batch costs the same bulk queries whatever its size """
+    records = [
+      (n, {'title': f'Recipe {n}', 'time_minutes': n, 'price': '1.00', 'tags': [f'tag {n % 3}'],
+           'ingredients': ['Salt']}, None)
+      for n in range(1, 11)
+    ]
+    progress = []
+    
+    # the first batch looks up and inserts the names, the second finds them all known
+    run = importer.RecipeImport(self.user, batch_size=5, progress=progress.append)
+    with self.assertNumQueries(15 + 11):
+      summary = run.run(iter(records))
+    
+    self.assertEqual(summary['batches'], 2)
+    self.assertEqual([item['imported'] for item in progress], [5, 10])
+  
+  
+  def test_export_round_trip(self):
+    """ Test an export imports back as the same recipes """
+    recipe = Recipe.objects.create(user=self.user, title='Curry', time_minutes=20, price='5.00')
+    recipe.tags.add(Tag.objects.create(user=self.user, name='Spicy'))
+    content = b''.join(export.iter_ndjson(export.export_queryset(self.user)))
+    other = get_user_model().objects.create_user(email='other@example.com', password='test1234')
+    
+    summary = importer.import_recipes(other, io.BytesIO(content), 'ndjson')
+    
+    self.assertEqual(summary['imported'], 1)
+    copy = Recipe.objects.get(user=other)
+    self.assertEqual(copy.title, 'Curry')
+    self.assertEqual(list(copy.tags.values_list('name', flat=True)), ['Spicy'])
+  
+  
+  def test_import_command(self):
+    """ Test the command imports a file and reports the failed rows """
+    with tempfile.TemporaryDirectory() as tmp:
+      path = Path(tmp) / 'recipes.csv'
+      path.write_text('title,time_minutes,price\nSoup,10,2.50\nStew,,7.00\n')
+      out, err = io.StringIO(), io.StringIO()
+      
+      call_command('import_recipes', self.user.email, str(path), stdout=out, stderr=err)
+    
+    self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+    self.assertIn('line 3', err.getvalue())
+    self.assertIn('Imported 1 recipes', out.getvalue())
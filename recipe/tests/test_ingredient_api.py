@@ -51,7 +51,7 @@ class PrivateIngredientApiTest(TestCase):
     serializer = IngredientSerializer(ingredients, many=True)
     
     self.assertEqual(res.status_code, status.HTTP_200_OK)
-    self.assertEqual(res.data, serializer.data)
+    self.assertEqual(res.data['results'], serializer.data)
   
   
   def test_ingredient_limited_to_user(self):
@@ -64,8 +64,8 @@ class PrivateIngredientApiTest(TestCase):
     res = self.client.get(INGREDIENT_URL)
     
     self.assertEqual(res.status_code, status.HTTP_200_OK)
-    self.assertEqual(len(res.data), 1)
-    self.assertEqual(res.data[0]['name'], ingredient.name)
+    self.assertEqual(len(res.data['results']), 1)
+    self.assertEqual(res.data['results'][0]['name'], ingredient.name)
   
   
   def test_create_ingredient_successfuly(self):
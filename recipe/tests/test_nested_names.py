@@ -0,0 +1,135 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+INGREDIENT_URL = reverse('recipe:ingredient-list')
+
+
+def detail_url(recipe_id):
+  """ Return recipe details url """
+  return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def table_queries(queries, table):
+  """ return the captured queries reading or writing a table """
+  return [query['sql'] for query in queries if f'"{table}"' in query['sql'].split(' WHERE ')[0]]
+
+
+class NestedNamesTests(TestCase):
+  """ Test recipes take their tags and ingredients by name """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user('test@example.com', 'test1234')
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+    self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+    self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+  
+  
+  def payload(self, **fields):
+    return {'title': 'Curry', 'time_minutes': 20, 'price': '5.00', **fields}
+  
+  
+  def test_create_with_names(self):
+    """ Test existing names are reused and missing ones created for the user """
+    other = get_user_model().objects.create_user('other@example.com', 'test1234')
+    Tag.objects.create(user=other, name='Spicy')
+    
+    res = self.client.post(RECIPE_URL, self.payload(
+      tag_names=['Vegan', 'Spicy'], ingredient_names=['Salt', 'Rice', 'Salt'],
+    ), format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    recipe = Recipe.objects.get(pk=res.data['id'])
+    spicy = Tag.objects.get(user=self.user, name='Spicy')
+    rice = Ingredient.objects.get(user=self.user, name='Rice')
+    self.assertEqual(set(recipe.tags.all()), {self.vegan, spicy})
+    self.assertEqual(set(recipe.ingredients.all()), {self.salt, rice})
+    self.assertEqual(sorted(res.data['tags']), sorted([self.vegan.id, spicy.id]))
+    self.assertNotIn('tag_names', res.data)
+    self.assertEqual(Tag.objects.filter(name='Spicy').count(), 2)
+    self.assertEqual(Ingredient.objects.get(pk=rice.pk).recipe_count, 1)
+  
+  
+  def test_create_mixes_ids_and_names(self):
+    """ Test names add to the pks given for the same relation """
+    dessert = Tag.objects.create(user=self.user, name='Dessert')
+    
+    res = self.client.post(RECIPE_URL, self.payload(
+      tags=[dessert.id], tag_names=['Vegan', 'Dessert'],
+    ), format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(sorted(res.data['tags']), sorted([dessert.id, self.vegan.id]))
+  
+  
+  def test_names_resolved_in_one_lookup_and_one_insert(self):
+    """ Test the number of names does not change the queries on tags and ingredients """
+    def post(prefix, count):
+      with CaptureQueriesContext(connection) as queries:
+        res = self.client.post(RECIPE_URL, self.payload(
+          tag_names=[f'{prefix} tag {i}' for i in range(count)],
+          ingredient_names=[f'{prefix} ingredient {i}' for i in range(count)],
+        ), format='json')
+      self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+      return queries
+    
+    small = post('small', 1)
+    large = post('large', 30)
+    
+    self.assertEqual(len(large), len(small))
+    tag_queries = table_queries(large, 'core_tag')
+    self.assertEqual(sum(sql.startswith('INSERT') for sql in tag_queries), 1)
+    self.assertEqual(Tag.objects.filter(user=self.user, name__startswith='large').count(), 30)
+  
+  
+  def test_update_with_names(self):
+    """ Test names replace the links on update like pks do """
+    recipe = Recipe.objects.create(user=self.user, title='Curry', time_minutes=20, price=5.00)
+    recipe.tags.add(self.vegan)
+    
+    res = self.client.patch(detail_url(recipe.id), {'tag_names': ['Spicy']}, format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual([tag.name for tag in recipe.tags.all()], ['Spicy'])
+    self.assertEqual(Tag.objects.get(pk=self.vegan.pk).recipe_count, 0)
+  
+  
+  def test_batch_create_with_names(self):
+    """ Test names shared by a batch are created once """
+    res = self.client.post(RECIPE_URL, [
+      self.payload(title='Curry', tag_names=['Spicy', 'Vegan']),
+      self.payload(title='Soup', tag_names=['Spicy'], ingredient_names=['Salt']),
+    ], format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    spicy = Tag.objects.get(user=self.user, name='Spicy')
+    self.assertEqual(spicy.recipe_count, 2)
+    self.assertEqual(Recipe.objects.get(title='Soup').ingredients.get(), self.salt)
+  
+  
+  def test_duplicate_tag_rejected(self):
+    """ Test creating a tag or ingredient the user already has is a validation error """
+    res = self.client.post(TAG_URL, {'name': 'Vegan'})
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertIn('name', res.data)
+    
+    res = self.client.post(INGREDIENT_URL, [{'name': 'Rice'}, {'name': 'Rice'}], format='json')
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertFalse(Ingredient.objects.filter(name='Rice').exists())
+  
+  
+  def test_unique_constraint(self):
+    """ Test the database refuses a second tag with the same name for the user """
+    with self.assertRaises(IntegrityError), transaction.atomic():
+      Tag.objects.create(user=self.user, name='Vegan')
@@ -0,0 +1,116 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+
+
+def sample_recipe(user, title='Briyani'):
+  """ Create and return sample recipe object"""
+  return Recipe.objects.create(user=user, title=title, time_minutes=30, price=5.00)
+
+
+class CursorPaginationTests(TestCase):
+  """ Test the cursor pagination of the recipe API """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+  
+  
+  def collect(self, url):
+    """ Follow next links and return every page's results """
+    results = []
+    while url:
+      res = self.client.get(url)
+      self.assertEqual(res.status_code, status.HTTP_200_OK)
+      results.extend(res.data['results'])
+      url = res.data['next']
+    
+    return results
+  
+  
+  def test_recipes_paginated_by_id(self):
+    """ Test walking every recipe page returns each recipe once in id order """
+    recipes = [sample_recipe(self.user, title=f'recipe {i}') for i in range(7)]
+    
+    results = self.collect(f'{RECIPE_URL}?page_size=3')
+    
+    self.assertEqual([r['id'] for r in results], [r.id for r in recipes])
+  
+  
+  def test_tags_paginated_by_name(self):
+    """ Test tags are paginated in descending name order """
+    for name in ['Apple', 'Banana', 'Cherry', 'Date', 'Elder']:
+      Tag.objects.create(user=self.user, name=name)
+    
+    results = self.collect(f'{TAG_URL}?page_size=2')
+    
+    self.assertEqual(
+      [t['name'] for t in results],
+      ['Elder', 'Date', 'Cherry', 'Banana', 'Apple']
+    )
+  
+  
+  def test_cursor_stable_under_inserts(self):
+    """ Test rows inserted before the cursor do not shift the next page """
+    for i in range(4):
+      sample_recipe(self.user, title=f'recipe {i}')
+    
+    first = self.client.get(f'{RECIPE_URL}?page_size=2')
+    Tag.objects.create(user=self.user, name='noise')
+    Recipe.objects.filter(id=first.data['results'][0]['id']).delete()
+    second = self.client.get(first.data['next'])
+    
+    seen = [r['id'] for r in first.data['results'] + second.data['results']]
+    self.assertEqual(len(seen), len(set(seen)))
+    self.assertEqual(len(second.data['results']), 2)
+  
+  
+  def test_popular_tags_paginated_through_ties(self):
+    """ Test tied recipe counts are paged on (recipe_count, id), never by an offset """
+    tags = [Tag.objects.create(user=self.user, name=f'tag {i}') for i in range(7)]
+    Tag.objects.filter(id=tags[2].id).update(recipe_count=3)
+    
+    first = self.client.get(f'{TAG_URL}?ordering=popular&page_size=3')
+    # a tag of the next page gains a recipe, which moves it onto the page already read
+    Tag.objects.filter(id=tags[3].id).update(recipe_count=1)
+    with CaptureQueriesContext(connection) as queries:
+      second = self.client.get(first.data['next'])
+    rest = self.collect(second.data['next'])
+    
+    self.assertEqual([t['id'] for t in first.data['results']], [tags[2].id, tags[6].id, tags[5].id])
+    self.assertEqual([t['id'] for t in second.data['results'] + rest], [tags[4].id, tags[1].id, tags[0].id])
+    self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+  
+  
+  def test_invalid_cursor(self):
+    """ Test a malformed cursor returns not found """
+    res = self.client.get(f'{RECIPE_URL}?cursor=not-a-cursor')
+    
+    self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+  
+  
+  def test_pages_use_composite_indexes(self):
+    """ Test the page queries are served by the user composite indexes """
+    tags = Tag.objects.filter(user=self.user).order_by('-name', '-id')
+    recipes = Recipe.objects.filter(user=self.user, id__gt=0).order_by('id')
+    
+    if connection.vendor == 'sqlite':
+      # the index of the (user, name) unique constraint
+      self.assertIn('USING INDEX sqlite_autoindex_core_tag', tags.explain())
+      self.assertNotIn('TEMP B-TREE', tags.explain())
+      self.assertNotIn('TEMP B-TREE', recipes.explain())
@@ -0,0 +1,134 @@
+from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+INGREDIENT_URL = reverse('recipe:ingredient-list')
+
+
+def detail_url(recipe_id):
+  """ Return recipe details url """
+  return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def seed_recipes(user, recipes, tags=3, ingredients=3):
+  """ Create recipes each linked to every tag and ingredient of the user """
+  tag_objs = [Tag.objects.get_or_create(user=user, name=f'tag {i}')[0] for i in range(tags)]
+  ingredient_objs = [
+    Ingredient.objects.get_or_create(user=user, name=f'ingredient {i}')[0] for i in range(ingredients)
+  ]
+  created = []
+  for i in range(recipes):
+    recipe = Recipe.objects.create(
+      user=user, title=f'recipe {i}', time_minutes=10, price=5.00
+    )
+    recipe.tags.add(*tag_objs)
+    recipe.ingredients.add(*ingredient_objs)
+    created.append(recipe)
+  
+  return created
+
+
+class RecipeQueryBudgetTests(TestCase):
+  """ Test the number of queries per endpoint does not grow with the data """
+  
+  # recipes, tags and ingredients; authentication is forced
+  LIST_QUERIES = 3
+  RETRIEVE_QUERIES = 3
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+  
+  
+  def test_recipe_list_query_count_is_constant(self):
+    """ Test listing recipes costs the same queries for 1 or many recipes """
+    seed_recipes(self.user, recipes=1, tags=1, ingredients=1)
+    with self.assertNumQueries(self.LIST_QUERIES):
+      res = self.client.get(RECIPE_URL)
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    
+    seed_recipes(self.user, recipes=20, tags=5, ingredients=8)
+    with self.assertNumQueries(self.LIST_QUERIES):
+      res = self.client.get(RECIPE_URL)
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(len(res.data['results']), 21)
+  
+  
+  def test_recipe_list_renders_related_pks(self):
+    """ Test the pk-only prefetches still render every related id """
+    recipe = seed_recipes(self.user, recipes=1, tags=2, ingredients=3)[0]
+    
+    res = self.client.get(RECIPE_URL)
+    
+    self.assertEqual(
+      res.data['results'][0]['tags'],
+      sorted(recipe.tags.values_list('id', flat=True))
+    )
+    self.assertEqual(
+      res.data['results'][0]['ingredients'],
+      sorted(recipe.ingredients.values_list('id', flat=True))
+    )
+  
+  
+  def test_recipe_detail_query_count_is_constant(self):
+    """ Test retrieving a recipe costs the same queries regardless of its relations """
+    small = seed_recipes(self.user, recipes=1, tags=1, ingredients=1)[0]
+    large = seed_recipes(self.user, recipes=1, tags=10, ingredients=15)[0]
+    
+    with self.assertNumQueries(self.RETRIEVE_QUERIES):
+      self.client.get(detail_url(small.id))
+    with self.assertNumQueries(self.RETRIEVE_QUERIES):
+      res = self.client.get(detail_url(large.id))
+    
+    self.assertEqual(len(res.data['tags']), 10)
+    self.assertEqual(len(res.data['ingredients']), 15)
+  
+  
+  def test_recipe_write_query_count_is_constant(self):
+    """ Test submitted tag and ingredient pks are resolved in one query each """
+    def payload(prefix, tags, ingredients):
+      return {
+        'title': 'Curry',
+        'time_minutes': 20,
+        'price': '5.00',
+        'tags': [Tag.objects.create(user=self.user, name=f'{prefix} tag {i}').id for i in range(tags)],
+        'ingredients': [
+          Ingredient.objects.create(user=self.user, name=f'{prefix} ingredient {i}').id
+          for i in range(ingredients)
+        ],
+      }
+    
+    small = payload('small', tags=1, ingredients=1)
+    large = payload('large', tags=20, ingredients=30)
+    
+    with CaptureQueriesContext(connection) as small_queries:
+      self.client.post(RECIPE_URL, small, format='json')
+    with CaptureQueriesContext(connection) as large_queries:
+      res = self.client.post(RECIPE_URL, large, format='json')
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(len(large_queries), len(small_queries))
+  
+  
+  def test_tag_and_ingredient_list_query_count(self):
+    """ Test listing tags and ingredients is a single query """
+    seed_recipes(self.user, recipes=5, tags=10, ingredients=10)
+    
+    with self.assertNumQueries(1):
+      self.client.get(TAG_URL)
+    with self.assertNumQueries(1):
+      self.client.get(INGREDIENT_URL)
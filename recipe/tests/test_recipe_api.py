@@ -79,7 +79,7 @@ class PrivateRecipeApiTest(TestCase):
     serializer = RecipeSerializer(recipes, many=True)
     
     self.assertEqual(res.status_code, status.HTTP_200_OK)
-    self.assertEqual(res.data, serializer.data)
+    self.assertEqual(res.data['results'], serializer.data)
   
   
   def test_recipes_limited_to_user(self):
@@ -97,8 +97,8 @@ class PrivateRecipeApiTest(TestCase):
     serializer = RecipeSerializer(recipes, many=True)
     
     self.assertEqual(res.status_code, status.HTTP_200_OK)
-    self.assertEqual(len(res.data), 1)
-    self.assertEqual(res.data, serializer.data)
+    self.assertEqual(len(res.data['results']), 1)
+    self.assertEqual(res.data['results'], serializer.data)
   
   
   def test_retrieve_recipe_detail(self):
@@ -220,3 +220,39 @@ class PrivateRecipeApiTest(TestCase):
     self.assertEqual(len(tags), 0)
     ingredients = recipe.ingredients.all()
     self.assertEqual(len(ingredients), 0)
+  
+  
+  def test_create_recipe_with_other_users_tag(self):
+    """ Test tags owned by another user can not be assigned """
+    user2 = sample_user(email='other@example.com', password='password1234')
+    foreign_tag = sample_tag(user=user2, name='Foreign')
+    
+    payload = {
+      'title' : 'Chocolates Cheesecake',
+      'time_minutes' : 30,
+      'tags' : [foreign_tag.id],
+      'price' : 6.00
+    }
+    res = self.client.post(RECIPE_URL, payload)
+    
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertFalse(Recipe.objects.exists())
+  
+  
+  def test_create_recipe_reports_all_missing_ingredients(self):
+    """ Test every unknown ingredient id is reported in one error """
+    ingredient = sample_ingredients(user=self.user)
+    
+    payload = {
+      'title' : 'Chocolates Cheesecake',
+      'time_minutes' : 30,
+      'ingredients' : [ingredient.id, 9998, 9999],
+      'price' : 6.00
+    }
+    res = self.client.post(RECIPE_URL, payload)
+    
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    error = str(res.data['ingredients'][0])
+    self.assertIn('9998', error)
+    self.assertIn('9999', error)
+    self.assertNotIn(str(ingredient.id) + ',', error)
@@ -0,0 +1,202 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import skipUnless
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import images, thumbnails
+from core.models import Recipe
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def image_upload_url(recipe_id):
+  """ Return the image upload url of a recipe """
+  return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def sample_recipe(user, title='Curry'):
+  """ Create and return a sample recipe """
+  return Recipe.objects.create(user=user, title=title, time_minutes=20, price=5.00)
+
+
+def sample_image(width=800, height=600, color='red', image_format='PNG'):
+  """ return the bytes of a plain image """
+  out = io.BytesIO()
+  thumbnails.Image.new('RGB', (width, height), color).save(out, image_format)
+  return out.getvalue()
+
+
+# not a decodable PNG, but the signature is all the upload checks and it needs no Pillow
+PNG_BYTES = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+class RecipeImageTests(TestCase):
+  """ Test uploading recipe images """
+  
+  def setUp(self):
+    media_root = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, media_root)
+    settings_override = override_settings(MEDIA_ROOT=media_root)
+    settings_override.enable()
+    self.addCleanup(settings_override.disable)
+    self.media_root = media_root
+    
+    self.user = get_user_model().objects.create_user('test@example.com', 'test1234')
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+    self.recipe = sample_recipe(self.user)
+  
+  
+  def upload(self, recipe, content, filename='image.png'):
+    return self.client.post(
+      image_upload_url(recipe.id), {'image': SimpleUploadedFile(filename, content)}, format='multipart'
+    )
+  
+  
+  def stored_files(self):
+    """ return the paths of the stored images and thumbnails, relative to MEDIA_ROOT """
+    root = os.path.join(self.media_root, images.IMAGE_DIR)
+    return sorted(
+      os.path.relpath(os.path.join(directory, name), self.media_root)
+      for directory, _, names in os.walk(root) for name in names
+    )
+  
+  
+  def staged_files(self):
+    directory = os.path.join(self.media_root, images.STAGING_DIR)
+    return os.listdir(directory) if os.path.isdir(directory) else []
+  
+  
+  def test_upload_image(self):
+    """ Test the image is stored under its digest and returned with its thumbnails """
+    res = self.upload(self.recipe, PNG_BYTES)
+    
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.recipe.refresh_from_db()
+    name = self.recipe.image.name
+    self.assertRegex(name, r'^recipes/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+    with open(os.path.join(self.media_root, name), 'rb') as stored:
+      self.assertEqual(stored.read(), PNG_BYTES)
+    self.assertEqual(res.data['image']['url'], f'http://testserver/media/{name}')
+    # without Pillow no thumbnails are rendered, so none are listed
+    labels = set(images.config()['THUMBNAIL_SIZES']) if thumbnails.Image else set()
+    self.assertEqual(set(res.data['image']['thumbnails']), labels)
+    self.assertEqual(self.staged_files(), [])
+  
+  
+  def test_same_image_stored_once(self):
+    """ Test uploading the same bytes again reuses the stored file """
+    other = sample_recipe(self.user, 'Soup')
+    
+    self.upload(self.recipe, PNG_BYTES, 'first.png')
+    self.upload(other, PNG_BYTES, 'second.png')
+    
+    self.recipe.refresh_from_db()
+    other.refresh_from_db()
+    self.assertEqual(self.recipe.image.name, other.image.name)
+    self.assertEqual(self.stored_files(), [self.recipe.image.name])
+  
+  
+  def test_upload_not_an_image(self):
+    """ Test files that are not images are refused and not kept """
+    res = self.upload(self.recipe, b'<html>not an image</html>', 'image.png')
+    
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertIn('image', res.data)
+    self.assertEqual(self.stored_files(), [])
+    self.assertEqual(self.staged_files(), [])
+  
+  
+  def test_upload_missing_file(self):
+    """ Test a request without the image field is a validation error """
+    res = self.client.post(image_upload_url(self.recipe.id), {'other': 'value'}, format='multipart')
+    
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+  
+  
+  def test_upload_too_large(self):
+    """ Test an image over the size limit is dropped while it streams in """
+    with self.settings(RECIPE_IMAGES={'MAX_UPLOAD_SIZE': 32}):
+      res = self.upload(self.recipe, PNG_BYTES)
+    
+    self.assertEqual(res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    self.assertEqual(self.stored_files(), [])
+    self.assertEqual(self.staged_files(), [])
+  
+  
+  def test_upload_other_users_recipe(self):
+    """ Test images can only be uploaded to the user's own recipes """
+    other = get_user_model().objects.create_user('other@example.com', 'test1234')
+    
+    res = self.upload(sample_recipe(other), PNG_BYTES)
+    
+    self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+  
+  
+  def test_list_returns_image(self):
+    """ Test the list renders the image urls from its values() rows """
+    self.upload(self.recipe, PNG_BYTES)
+    sample_recipe(self.user, 'Soup')
+    
+    res = self.client.get(RECIPE_URL)
+    
+    by_title = {recipe['title']: recipe['image'] for recipe in res.data['results']}
+    self.assertIsNone(by_title['Soup'])
+    self.assertTrue(by_title['Curry']['url'].endswith('.png'))
+  
+  
+  def test_handler_streams_to_disk(self):
+    """ Test the upload handler writes each chunk to the staging file and hashes it """
+    handler = images.ContentAddressedUploadHandler()
+    handler.new_file('image', 'image.png', 'image/png', None)
+    handler.receive_data_chunk(PNG_BYTES[:10], 0)
+    handler.receive_data_chunk(PNG_BYTES[10:], 10)
+    upload = handler.file_complete(len(PNG_BYTES))
+    
+    with open(upload.temporary_file_path(), 'rb') as staged:
+      self.assertEqual(staged.read(), PNG_BYTES)
+    self.assertEqual(upload.extension, 'png')
+    name = images.store(upload)
+    self.assertTrue(name.endswith(f'{upload.digest}.png'))
+    self.assertFalse(os.path.exists(upload.temporary_file_path()))
+  
+  
+  @skipUnless(thumbnails.Image, 'Pillow is not installed')
+  def test_thumbnails_rendered_by_the_pool(self):
+    """ Test the thumbnails are rendered outside the request, fitting their sizes """
+    with self.captureOnCommitCallbacks(execute=True):
+      res = self.upload(self.recipe, sample_image(800, 600, image_format='JPEG'), 'image.jpg')
+    images.wait_for_thumbnails(timeout=60)
+    
+    self.recipe.refresh_from_db()
+    for label, size in images.config()['THUMBNAIL_SIZES'].items():
+      self.assertTrue(res.data['image']['thumbnails'][label].endswith(f'-{size}.jpg'))
+      path = os.path.join(self.media_root, images.thumbnail_name(self.recipe.image.name, size))
+      with thumbnails.Image.open(path) as thumbnail:
+        self.assertEqual(thumbnail.size, (min(size, 800), min(size, 800) * 3 // 4))
+    self.assertEqual(images.missing_thumbnails(self.recipe.image.name), {})
+  
+  
+  @skipUnless(thumbnails.Image, 'Pillow is not installed')
+  def test_build_thumbnails_command(self):
+    """ Test the command renders the thumbnails the pool skipped """
+    with self.settings(RECIPE_IMAGES={'MAX_PENDING': 0}), self.assertLogs('core.images', 'WARNING'):
+      with self.captureOnCommitCallbacks(execute=True):
+        self.upload(self.recipe, sample_image(300, 300, 'blue'), 'image.png')
+    self.recipe.refresh_from_db()
+    self.assertEqual(len(images.missing_thumbnails(self.recipe.image.name)), 3)
+    
+    call_command('build_thumbnails', stdout=io.StringIO())
+    
+    self.assertEqual(images.missing_thumbnails(self.recipe.image.name), {})
@@ -0,0 +1,110 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def sample_recipe(user, title, tags=(), ingredients=()):
+  """ Create and return a recipe linked to the given tag and ingredient names """
+  recipe = Recipe.objects.create(user=user, title=title, time_minutes=20, price=5.00)
+  for name in tags:
+    recipe.tags.add(Tag.objects.create(user=user, name=name))
+  for name in ingredients:
+    recipe.ingredients.add(Ingredient.objects.create(user=user, name=name))
+  
+  return recipe
+
+
+class RecipeSearchApiTests(TestCase):
+  """ Test searching recipes with the q parameter """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+  
+  
+  def search(self, text, **params):
+    """ return the ids of the recipes found for text """
+    res = self.client.get(RECIPE_URL, {'q': text, **params})
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    return [recipe['id'] for recipe in res.data['results']]
+  
+  
+  def test_search_title_tags_and_ingredients(self):
+    """ Test recipes are found by title, tag and ingredient names """
+    curry = sample_recipe(self.user, 'Thai Curry', tags=['Spicy'], ingredients=['Coconut'])
+    stew = sample_recipe(self.user, 'Beef Stew', tags=['Winter'], ingredients=['Carrot'])
+    
+    self.assertEqual(self.search('curry'), [curry.id])
+    self.assertEqual(self.search('winter'), [stew.id])
+    self.assertEqual(self.search('coconut'), [curry.id])
+    self.assertEqual(self.search('thai spicy'), [curry.id])
+    self.assertEqual(self.search('car'), [stew.id])
+  
+  
+  def test_search_ranks_title_matches_first(self):
+    """ Test a title match ranks above an ingredient match """
+    by_ingredient = sample_recipe(self.user, 'Green Salad', ingredients=['Chicken'])
+    by_title = sample_recipe(self.user, 'Chicken Tikka')
+    
+    self.assertEqual(self.search('chicken'), [by_title.id, by_ingredient.id])
+  
+  
+  def test_search_limited_to_user(self):
+    """ Test other users' recipes are never returned """
+    user2 = get_user_model().objects.create_user('other@example.com', 'test1234')
+    sample_recipe(user2, 'Chicken Soup')
+    mine = sample_recipe(self.user, 'Chicken Pie')
+    
+    self.assertEqual(self.search('chicken'), [mine.id])
+  
+  
+  def test_search_ignores_owner_column(self):
+    """ Test the owner token indexed with each recipe is not searchable """
+    sample_recipe(self.user, 'Chicken Pie')
+    
+    self.assertEqual(self.search('u'), [])
+    self.assertEqual(self.search(f'u{self.user.id}'), [])
+  
+  
+  def test_search_syntax_is_not_interpreted(self):
+    """ Test FTS operators and quotes in the query are treated as text """
+    recipe = sample_recipe(self.user, 'Fish AND Chips')
+    
+    self.assertEqual(self.search('"fish" AND (chips'), [recipe.id])
+    self.assertEqual(self.search('***'), [])
+  
+  
+  def test_search_results_are_paginated(self):
+    """ Test search results can be walked with the cursor """
+    recipes = [sample_recipe(self.user, f'Pasta {i}') for i in range(5)]
+    
+    res = self.client.get(RECIPE_URL, {'q': 'pasta', 'page_size': 2})
+    found = [r['id'] for r in res.data['results']]
+    while res.data['next']:
+      res = self.client.get(res.data['next'])
+      found.extend(r['id'] for r in res.data['results'])
+    
+    self.assertEqual(sorted(found), [r.id for r in recipes])
+  
+  
+  def test_batch_created_recipes_are_searchable(self):
+    """ Test recipes created as a batch are indexed """
+    tag = Tag.objects.create(user=self.user, name='Breakfast')
+    payload = [
+      {'title': 'Pancakes', 'time_minutes': 10, 'price': '2.00', 'tags': [tag.id], 'ingredients': []},
+    ]
+    res = self.client.post(RECIPE_URL, payload, format='json')
+    
+    self.assertEqual(self.search('breakfast'), [res.data[0]['id']])
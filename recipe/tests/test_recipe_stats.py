@@ -0,0 +1,100 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient, Tag
+
+
+STATS_URL = reverse('recipe:recipe-stats')
+
+
+def sample_recipe(user, price, time_minutes=30, title='Curry'):
+  """ Create and return a sample recipe """
+  return Recipe.objects.create(user=user, title=title, time_minutes=time_minutes, price=price)
+
+
+class RecipeStatsTests(TestCase):
+  """ Test the recipe statistics endpoint """
+  
+  def setUp(self):
+    cache.clear()
+    self.user = get_user_model().objects.create_user('test@example.com', 'test1234')
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+  
+  
+  def test_login_required(self):
+    """ Test the stats need authentication """
+    res = APIClient().get(STATS_URL)
+    
+    self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+  
+  
+  def test_empty(self):
+    """ Test a user without recipes gets zeroed stats """
+    res = self.client.get(STATS_URL)
+    
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(res.data['count'], 0)
+    self.assertIsNone(res.data['price']['average'])
+    self.assertEqual(res.data['price']['percentiles']['p50'], None)
+    self.assertEqual(sum(bucket['count'] for bucket in res.data['time_minutes_histogram']), 0)
+  
+  
+  def test_stats(self):
+    """ Test the aggregates cover only the user's own recipes """
+    vegan = Tag.objects.create(user=self.user, name='Vegan')
+    spicy = Tag.objects.create(user=self.user, name='Spicy')
+    Tag.objects.create(user=self.user, name='Unused')
+    salt = Ingredient.objects.create(user=self.user, name='Salt')
+    for n, (price, minutes) in enumerate([('1.00', 10), ('2.00', 20), ('3.00', 45), ('4.00', 200)]):
+      recipe = sample_recipe(self.user, price, minutes)
+      recipe.tags.add(vegan)
+      if n % 2:
+        recipe.tags.add(spicy)
+      recipe.ingredients.add(salt)
+    other = get_user_model().objects.create_user('other@example.com', 'test1234')
+    sample_recipe(other, '99.00', 5)
+    
+    res = self.client.get(STATS_URL)
+    
+    self.assertEqual(res.data['count'], 4)
+    self.assertEqual(res.data['price'], {
+      'average': '2.50', 'min': '1.00', 'max': '4.00',
+      'percentiles': {'p25': '1.00', 'p50': '2.00', 'p75': '3.00', 'p90': '4.00'},
+    })
+    self.assertEqual(
+      [(bucket['min'], bucket['max'], bucket['count']) for bucket in res.data['time_minutes_histogram']],
+      [(0, 15, 1), (15, 30, 1), (30, 60, 1), (60, 120, 0), (120, None, 1)],
+    )
+    self.assertEqual(
+      [(tag['name'], tag['recipe_count']) for tag in res.data['top_tags']], [('Vegan', 4), ('Spicy', 2)]
+    )
+    self.assertEqual([ingredient['name'] for ingredient in res.data['top_ingredients']], ['Salt'])
+  
+  
+  def test_cached_until_data_changes(self):
+    """ Test the summary is computed once per change of the user's data """
+    sample_recipe(self.user, '5.00')
+    self.client.get(STATS_URL)
+    
+    with self.assertNumQueries(0):
+      res = self.client.get(STATS_URL)
+    self.assertEqual(res.data['count'], 1)
+    
+    sample_recipe(self.user, '7.00')
+    res = self.client.get(STATS_URL)
+    self.assertEqual(res.data['count'], 2)
+    self.assertEqual(res.data['price']['average'], '6.00')
+  
+  
+  def test_not_modified(self):
+    """ Test a current etag gets 304 """
+    res = self.client.get(STATS_URL)
+    
+    res = self.client.get(STATS_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+    self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
@@ -0,0 +1,135 @@
+import tempfile
+from pathlib import Path
+
+from django.test import TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import routers
+from core.db import sqlite_database
+from core.models import Recipe, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+
+
+def detail_url(recipe_id):
+  """ Return recipe details url """
+  return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKINESS_SECONDS=60)
+class ReplicaRoutingTests(TransactionTestCase):
+  """ Test safe requests read from a replica with read-your-writes stickiness
+
+  The replica is a second SQLite file which only changes when sync_replica()
+  copies the primary into it, so any read that reaches it sees stale data.
+  """
+  
+  # the replica alias is only added in setUpClass, after the runner created the test databases
+  databases = '__all__'
+  
+  @classmethod
+  def setUpClass(cls):
+    directory = tempfile.TemporaryDirectory()
+    cls.addClassCleanup(directory.cleanup)
+    replica = sqlite_database(Path(directory.name) / 'replica.sqlite3')
+    connections.settings['replica'] = connections.configure_settings(
+      {'default': connections.settings['default'], 'replica': replica}
+    )['replica']
+    cls.addClassCleanup(connections.settings.pop, 'replica')
+    cls.addClassCleanup(connections.__delitem__, 'replica')
+    cls.addClassCleanup(lambda: connections['replica'].close())
+    super().setUpClass()
+  
+  
+  def setUp(self):
+    cache.clear()
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+    self.sync_replica()
+  
+  
+  def sync_replica(self):
+    """ Copy the primary into the replica, as replication would """
+    connections['default'].ensure_connection()
+    connections['replica'].ensure_connection()
+    connections['default'].connection.backup(connections['replica'].connection)
+  
+  
+  def test_reads_use_the_replica(self):
+    """ Test a list only shows what has reached the replica """
+    Recipe.objects.create(user=self.user, title='Curry', time_minutes=20, price='5.00')
+    
+    res = self.client.get(RECIPE_URL)
+    self.assertEqual(res.data['results'], [])
+    
+    self.sync_replica()
+    cache.clear()
+    res = self.client.get(RECIPE_URL)
+    self.assertEqual([recipe['title'] for recipe in res.data['results']], ['Curry'])
+  
+  
+  def test_writes_go_to_the_primary(self):
+    """ Test a create lands on the primary only """
+    res = self.client.post(TAG_URL, {'name': 'Vegan'})
+    
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertTrue(Tag.objects.using('default').filter(name='Vegan').exists())
+    self.assertFalse(Tag.objects.using('replica').filter(name='Vegan').exists())
+  
+  
+  def test_read_your_writes(self):
+    """ Test the writer reads from the primary within the stickiness window """
+    res = self.client.post(RECIPE_URL, {'title': 'Curry', 'time_minutes': 20, 'price': '5.00'})
+    recipe_id = res.data['id']
+    
+    res = self.client.get(RECIPE_URL)
+    self.assertEqual([recipe['id'] for recipe in res.data['results']], [recipe_id])
+    res = self.client.get(detail_url(recipe_id))
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+  
+  
+  def test_other_users_read_from_the_replica(self):
+    """ Test only the writing user is pinned to the primary """
+    other = get_user_model().objects.create_user(email='other@example.com', password='test1234')
+    self.sync_replica()
+    self.client.post(TAG_URL, {'name': 'Vegan'})
+    
+    self.client.force_authenticate(other)
+    with self.assertNumQueries(0, using='default'):
+      self.client.get(TAG_URL)
+  
+  
+  @override_settings(REPLICA_STICKINESS_SECONDS=0)
+  def test_reads_return_to_the_replica_after_the_window(self):
+    """ Test reads go back to the replica once the window has passed """
+    res = self.client.post(RECIPE_URL, {'title': 'Curry', 'time_minutes': 20, 'price': '5.00'})
+    
+    res = self.client.get(detail_url(res.data['id']))
+    
+    self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+  
+  
+  def test_router_without_request(self):
+    """ Test reads outside of an opted-in request stay on the primary """
+    router = routers.ReplicaRouter()
+    
+    self.assertEqual(router.db_for_read(Recipe), 'default')
+    self.assertEqual(router.db_for_write(Recipe), 'default')
+    token = routers.allow_replica_reads(self.user.pk)
+    try:
+      self.assertEqual(router.db_for_read(Recipe), 'replica')
+    finally:
+      routers.reset_replica_reads(token)
+    self.assertEqual(router.db_for_read(Recipe), 'default')
@@ -0,0 +1,239 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.test import TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import sharding
+from core.db import sqlite_database
+from core.models import Ingredient, Recipe, ShardAssignment, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+INGREDIENT_URL = reverse('recipe:ingredient-list')
+SHARDS = ('shard1', 'shard2')
+
+
+def detail_url(recipe_id):
+  """ Return recipe details url """
+  return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+@override_settings(SHARDING={
+  'SHARDS': ['default', *SHARDS],
+  'NEW_USERS': list(SHARDS),
+  'CACHE_SECONDS': 300,
+  'MOVE_GRACE_SECONDS': 0,
+})
+class ShardingTests(TransactionTestCase):
+  """ Test user owned data lives on, and moves between, separate SQLite shards """
+  
+  # the shard aliases are only added in setUpClass, after the runner created the test databases
+  databases = '__all__'
+  
+  @classmethod
+  def setUpClass(cls):
+    directory = tempfile.TemporaryDirectory()
+    cls.addClassCleanup(directory.cleanup)
+    configured = connections.configure_settings({
+      'default': connections.settings['default'],
+      **{alias: sqlite_database(Path(directory.name) / f'{alias}.sqlite3') for alias in SHARDS},
+    })
+    for alias in SHARDS:
+      connections.settings[alias] = configured[alias]
+      cls.addClassCleanup(connections.settings.pop, alias)
+      cls.addClassCleanup(connections.__delitem__, alias)
+      cls.addClassCleanup(lambda alias=alias: connections[alias].close())
+      call_command('migrate', database=alias, verbosity=0)
+    super().setUpClass()
+  
+  
+  def setUp(self):
+    cache.clear()
+    # the moves wait out CACHE_SECONDS
+    sleep = mock.patch('core.sharding.time.sleep')
+    self.sleep = sleep.start()
+    self.addCleanup(sleep.stop)
+    self.user = get_user_model().objects.create_user(email='test@example.com', password='test1234')
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+  
+  
+  def other_shard(self, user):
+    return next(alias for alias in SHARDS if alias != sharding.db_for_user(user.pk))
+  
+  
+  def create_recipe(self):
+    """ Create a tagged recipe through the API and return its id """
+    tag = self.client.post(TAG_URL, {'name': 'Vegan'}).data
+    ingredient = self.client.post(INGREDIENT_URL, {'name': 'Tofu'}).data
+    res = self.client.post(RECIPE_URL, {
+      'title': 'Tofu curry', 'time_minutes': 20, 'price': '5.00',
+      'tags': [tag['id']], 'ingredients': [ingredient['id']],
+    })
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    return res.data['id']
+  
+  
+  def test_new_users_are_spread_over_the_shards(self):
+    """ Test new users are assigned round robin with a stub user on their shard """
+    other = get_user_model().objects.create_user(email='other@example.com', password='test1234')
+    
+    aliases = {sharding.db_for_user(self.user.pk), sharding.db_for_user(other.pk)}
+    self.assertEqual(aliases, set(SHARDS))
+    for user in (self.user, other):
+      alias = ShardAssignment.objects.get(user=user).alias
+      self.assertTrue(get_user_model().objects.using(alias).filter(pk=user.pk).exists())
+  
+  
+  def test_requests_use_the_shard_of_the_user(self):
+    """ Test created rows land on the user's shard only and are read back from it """
+    recipe_id = self.create_recipe()
+    alias = sharding.db_for_user(self.user.pk)
+    
+    self.assertTrue(Recipe.objects.using(alias).filter(pk=recipe_id, user=self.user).exists())
+    for other in ('default', self.other_shard(self.user)):
+      self.assertFalse(Recipe.objects.using(other).exists())
+      self.assertFalse(Tag.objects.using(other).exists())
+    res = self.client.get(detail_url(recipe_id))
+    self.assertEqual([tag['name'] for tag in res.data['tags']], ['Vegan'])
+    res = self.client.get(RECIPE_URL, {'q': 'curry'})
+    self.assertEqual([recipe['id'] for recipe in res.data['results']], [recipe_id])
+  
+  
+  def test_users_on_other_shards_are_isolated(self):
+    """ Test a user on another shard neither sees nor can link the rows of the first """
+    self.create_recipe()
+    other = get_user_model().objects.create_user(email='other@example.com', password='test1234')
+    self.assertNotEqual(sharding.db_for_user(other.pk), sharding.db_for_user(self.user.pk))
+    tag_id = Tag.objects.for_user(self.user).get().id
+    
+    self.client.force_authenticate(other)
+    self.assertEqual(self.client.get(RECIPE_URL).data['results'], [])
+    res = self.client.post(RECIPE_URL, {
+      'title': 'Stew', 'time_minutes': 60, 'price': '8.00', 'tags': [tag_id], 'ingredients': [],
+    })
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+  
+  
+  def test_move_user(self):
+    """ Test the move command copies the rows with their links and clears the source """
+    recipe_id = self.create_recipe()
+    tag_id = Tag.objects.for_user(self.user).get().id
+    source = sharding.db_for_user(self.user.pk)
+    target = self.other_shard(self.user)
+    etag = self.client.get(RECIPE_URL)['ETag']
+    
+    out = StringIO()
+    call_command('move_user_shard', self.user.email, target, stdout=out)
+    
+    self.assertIn('1 recipes', out.getvalue())
+    self.assertEqual(self.sleep.call_args_list, [mock.call(300), mock.call(300)])
+    self.assertEqual(sharding.db_for_user(self.user.pk), target)
+    self.assertFalse(Recipe.objects.using(source).exists())
+    self.assertFalse(get_user_model().objects.using(source).filter(pk=self.user.pk).exists())
+    recipe = Recipe.objects.using(target).get(user=self.user)
+    self.assertEqual([tag.name for tag in recipe.tags.all()], ['Vegan'])
+    self.assertEqual([ingredient.name for ingredient in recipe.ingredients.all()], ['Tofu'])
+    res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual([row['title'] for row in res.data['results']], ['Tofu curry'])
+    res = self.client.get(RECIPE_URL, {'q': 'tofu'})
+    self.assertEqual([row['id'] for row in res.data['results']], [recipe_id])
+    self.assertEqual(recipe.id, recipe_id)
+    self.assertEqual(self.client.get(detail_url(recipe_id)).data['tags'][0]['id'], tag_id)
+  
+  
+  def test_ids_are_unique_across_shards(self):
+    """ Test rows get ids no other shard uses, so moved rows never collide with new ones """
+    first_id = self.create_recipe()
+    other = get_user_model().objects.create_user(email='other@example.com', password='test1234')
+    self.client.force_authenticate(other)
+    second_id = self.create_recipe()
+    self.assertNotEqual(sharding.db_for_user(other.pk), sharding.db_for_user(self.user.pk))
+    self.assertGreater(second_id, first_id)
+    
+    sharding.move_user(other.pk, sharding.db_for_user(self.user.pk))
+    third_id = self.client.post(RECIPE_URL, {'title': 'Stew', 'time_minutes': 60, 'price': '8.00'}).data['id']
+    
+    self.assertGreater(third_id, second_id)
+    self.assertEqual(
+      sorted(Recipe.objects.using(sharding.db_for_user(self.user.pk)).values_list('id', flat=True)),
+      [first_id, second_id, third_id],
+    )
+  
+  
+  def test_move_user_from_default(self):
+    """ Test a user from before sharding moves off the default database, their user row staying """
+    ShardAssignment.objects.filter(user=self.user).delete()
+    sharding.forget_assignment(self.user.pk)
+    self.create_recipe()
+    self.assertTrue(Recipe.objects.using('default').exists())
+    
+    sharding.move_user(self.user.pk, 'shard1')
+    
+    self.assertFalse(Recipe.objects.using('default').exists())
+    self.assertFalse(Ingredient.objects.using('default').exists())
+    self.assertTrue(get_user_model().objects.filter(pk=self.user.pk).exists())
+    self.assertEqual(Recipe.objects.for_user(self.user).count(), 1)
+  
+  
+  def test_writes_refused_while_moving(self):
+    """ Test a moving user can read but gets 503 on writes """
+    ShardAssignment.objects.filter(user=self.user).update(moving=True)
+    sharding.forget_assignment(self.user.pk)
+    
+    res = self.client.post(TAG_URL, {'name': 'Vegan'})
+    self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+    res = self.client.get(TAG_URL)
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+  
+  
+  def test_writes_check_the_moving_flag_past_the_cache(self):
+    """ Test a shard map entry cached before the move started does not let writes through """
+    sharding.get_assignment(self.user.pk)
+    cache.set(sharding._assignment_key(self.user.pk), (sharding.db_for_user(self.user.pk), False), 300)
+    ShardAssignment.objects.filter(user=self.user).update(moving=True)
+    
+    res = self.client.post(TAG_URL, {'name': 'Vegan'})
+    self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+  
+  
+  @override_settings(ROOT_URLCONF='recipe.tests.test_async_views')
+  async def test_async_views_use_the_shard_of_the_user(self):
+    """ Test the async views write to and read from the user's shard """
+    token = await Token.objects.acreate(user=self.user)
+    headers = {'Authorization': f'Token {token.key}'}
+    alias = await sharding.adb_for_user(self.user.pk)
+    
+    res = await self.async_client.post(
+      reverse('recipe:tag-list'), {'name': 'Vegan'}, content_type='application/json', headers=headers,
+    )
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertTrue(await Tag.objects.using(alias).filter(pk=res.json()['id']).aexists())
+    res = await self.async_client.get(reverse('recipe:tag-list'), headers=headers)
+    self.assertEqual([tag['name'] for tag in res.json()['results']], ['Vegan'])
+    self.assertFalse(await Tag.objects.using('default').aexists())
+  
+  
+  def test_deleting_a_user_deletes_their_shard_rows(self):
+    """ Test deleting a user also removes their rows and stub on the shard """
+    self.create_recipe()
+    alias = sharding.db_for_user(self.user.pk)
+    
+    self.user.delete()
+    
+    self.assertFalse(get_user_model().objects.using(alias).exists())
+    self.assertFalse(Recipe.objects.using(alias).exists())
+    self.assertFalse(Tag.objects.using(alias).exists())
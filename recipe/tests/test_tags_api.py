@@ -52,7 +52,7 @@ class PrivateTagsApiTests(TestCase):
     serializer = TagSerializer(tags, many=True)
     
     self.assertEqual(res.status_code, status.HTTP_200_OK)
-    self.assertEqual(res.data, serializer.data)
+    self.assertEqual(res.data['results'], serializer.data)
   
   def test_tags_limited_to_user(self):
     """ Test that tags limited to the authenticated user only """
@@ -67,8 +67,8 @@ class PrivateTagsApiTests(TestCase):
     res = self.client.get(TAG_URL)
     
     self.assertEqual(res.status_code, status.HTTP_200_OK)
-    self.assertEqual(len(res.data), 1)
-    self.assertEqual(res.data[0]['name'], tag.name )
+    self.assertEqual(len(res.data['results']), 1)
+    self.assertEqual(res.data['results'][0]['name'], tag.name )
   
   def test_create_tags_successful(self):
     """ Test creating a new tag"""
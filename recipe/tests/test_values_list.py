@@ -0,0 +1,77 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient, Tag
+
+from recipe.serializers import RecipeSerializer, TagSerializer, IngredientSerializer
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+INGREDIENT_URL = reverse('recipe:ingredient-list')
+
+
+def render(data):
+  return JSONRenderer().render(data)
+
+
+class ValuesListTests(TestCase):
+  """ Test the list pages built from values() match the serializers byte for byte """
+  
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234'
+    )
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+    tags = [Tag.objects.create(user=self.user, name=name) for name in ('Vegan', 'Dinner', 'Ünïcode')]
+    ingredients = [Ingredient.objects.create(user=self.user, name=f'ingredient {i}') for i in range(4)]
+    prices = ('5.00', '0.5', '999.99', '10')
+    for i, price in enumerate(prices):
+      recipe = Recipe.objects.create(
+        user=self.user, title=f'spicy recipe {i}', time_minutes=i, price=price,
+        link='https://example.com' if i % 2 else '',
+      )
+      recipe.tags.set(tags[:i])
+      recipe.ingredients.set(reversed(ingredients[i:]))
+  
+  
+  def test_recipe_list_is_identical(self):
+    """ Test the recipe list renders the same bytes as RecipeSerializer """
+    recipes = Recipe.objects.filter(user=self.user).with_relations().order_by('id')
+    expected = {'next': None, 'previous': None, 'results': RecipeSerializer(recipes, many=True).data}
+    
+    res = self.client.get(RECIPE_URL)
+    
+    self.assertEqual(res.content, render(expected))
+  
+  
+  def test_tag_and_ingredient_lists_are_identical(self):
+    """ Test the tag and ingredient lists render the same bytes as their serializers """
+    for url, model, serializer_class in (
+      (TAG_URL, Tag, TagSerializer),
+      (INGREDIENT_URL, Ingredient, IngredientSerializer),
+    ):
+      objs = model.objects.filter(user=self.user).order_by('-name', '-id')
+      expected = {'next': None, 'previous': None, 'results': serializer_class(objs, many=True).data}
+      
+      res = self.client.get(url)
+      
+      self.assertEqual(res.content, render(expected))
+  
+  
+  def test_search_pages_are_identical(self):
+    """ Test ranked search pages keep their order and content across pages """
+    res = self.client.get(RECIPE_URL, {'q': 'spicy', 'page_size': 3})
+    second = self.client.get(res.data['next'])
+    
+    ids = [item['id'] for item in res.data['results'] + second.data['results']]
+    recipes = Recipe.objects.with_relations().in_bulk(ids)
+    expected = RecipeSerializer([recipes[pk] for pk in ids], many=True).data
+    self.assertEqual(render(res.data['results'] + second.data['results']), render(expected))
+    self.assertEqual(len(ids), 4)
@@ -1,8 +1,9 @@
+from django.conf import settings
 from django.urls import path, include
 
 from rest_framework.routers import DefaultRouter
 
-from recipe import views
+from recipe import async_views, views
 
 app_name = 'recipe'
 
@@ -11,6 +12,17 @@ router.register('tags', views.TagViewSet)
 router.register('ingredients', views.IngredientViewSet)
 router.register('recipes', views.RecipeViewSet)
 
+# async views for the hot paths, matched before the router's sync views
+async_urlpatterns = [
+  path('tags/', async_views.AsyncTagView.as_view(), name='tag-list'),
+  path('ingredients/', async_views.AsyncIngredientView.as_view(), name='ingredient-list'),
+  path('recipes/', async_views.AsyncRecipeListView.as_view(), name='recipe-list'),
+  path('recipes/<int:pk>/', async_views.AsyncRecipeDetailView.as_view(), name='recipe-detail'),
+]
+
 urlpatterns = [
   path('', include(router.urls)),
-]
\ No newline at end of file
+]
+
+if settings.RECIPE_ASYNC_VIEWS:
+  urlpatterns = async_urlpatterns + urlpatterns
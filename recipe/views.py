@@ -1,52 +1,403 @@
-from rest_framework import viewsets, mixins
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+import hashlib
 
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.utils.translation import gettext_lazy as _
+from rest_framework import viewsets, mixins, serializers as drf_serializers, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, UnsupportedMediaType, ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.response import Response
+
+from core import images, instrumentation, routers, search, sharding
+from core.data_version import get_data_version
 from core.models import Tag, Ingredient, Recipe
+from user.authentication import CachedTokenAuthentication
 
-from recipe import serializers
+from recipe import export, importer, serializers, stats
+from recipe.pagination import NameCursorPagination, RecipeCursorPagination
 
 
-class TagViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin):
-  """ Manage tags in the database """
-  authentication_classes = (TokenAuthentication,)
+def param_to_ints(request, name):
+  """ Convert a comma separated query param into a list of ids """
+  value = request.query_params.get(name)
+  if not value:
+    return []
+  
+  try:
+    return [int(item) for item in value.split(',') if item.strip()]
+  except ValueError:
+    raise ValidationError({name: _('Expected a comma separated list of ids.')})
+
+
+def param_to_bool(request, name):
+  """ Read a 1/true style flag from the query params """
+  return request.query_params.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+class BatchCreateMixin:
+  """ Accept a list payload on create and insert it as one batch """
+  batch_max_size = 1000
+  
+  def get_serializer(self, *args, **kwargs):
+    """ return a list serializer when a create's request body is a list """
+    # updates of one object validate a list body as the object, which fails with 400
+    if self.action == 'create' and isinstance(kwargs.get('data'), list):
+      kwargs.update(many=True, allow_empty=False, max_length=self.batch_max_size)
+    
+    return super().get_serializer(*args, **kwargs)
+
+
+class ReplicaReadMixin:
+  """ Read from a replica on safe requests, unless the user wrote recently """
+  replica_token = None
+  
+  def initial(self, request, *args, **kwargs):
+    super().initial(request, *args, **kwargs)
+    if request.method in SAFE_METHODS:
+      self.replica_token = routers.allow_replica_reads(request.user.pk)
+  
+  def finalize_response(self, request, response, *args, **kwargs):
+    if self.replica_token is not None:
+      routers.reset_replica_reads(self.replica_token)
+      self.replica_token = None
+    elif request.method not in SAFE_METHODS and request.user.is_authenticated:
+      routers.record_write(request.user.pk)
+    
+    return super().finalize_response(request, response, *args, **kwargs)
+
+
+class DataMoving(APIException):
+  status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+  default_detail = _('Your data is being moved, try again in a moment.')
+  default_code = 'data_moving'
+
+
+class ImageTooLarge(APIException):
+  status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+  default_detail = _('The image is too large.')
+  default_code = 'image_too_large'
+
+
+class ShardMixin:
+  """ Route the request's queries to the shard of the user, refusing writes while it moves """
+  shard_token = None
+  
+  def initial(self, request, *args, **kwargs):
+    super().initial(request, *args, **kwargs)
+    if not sharding.is_enabled():
+      return
+    
+    user_id = request.user.pk
+    if request.method not in SAFE_METHODS and sharding.is_moving(user_id):
+      raise DataMoving()
+    self.shard_token = sharding.activate(sharding.db_for_user(user_id))
+  
+  def finalize_response(self, request, response, *args, **kwargs):
+    if self.shard_token is not None:
+      sharding.deactivate(self.shard_token)
+      self.shard_token = None
+    
+    return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+  """ Answer list and retrieve with 304 when the user's data version is unchanged """
+  
+  @staticmethod
+  def make_etag(request, version):
+    """ return an etag for a data version and this exact request """
+    parts = (
+      str(request.user.pk),
+      version,
+      request.get_full_path(),
+      request.META.get('HTTP_ACCEPT', ''),
+    )
+    return quote_etag(hashlib.sha1('|'.join(parts).encode()).hexdigest())
+  
+  @staticmethod
+  def is_not_modified(request, etag):
+    """ compare weakly, the compression middleware hands out W/ etags """
+    client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in client_etags)
+  
+  @staticmethod
+  def set_etag(response, etag):
+    """ attach the etag to successful responses """
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+      response['ETag'] = etag
+      patch_cache_control(response, private=True, no_cache=True)
+    
+    return response
+  
+  def get_etag(self, request):
+    """ return an etag for the user's current data version and this exact request """
+    return self.make_etag(request, get_data_version(request.user.pk))
+  
+  def conditional_response(self, handler, request, *args, **kwargs):
+    """ return 304 before touching the queryset if the client's etag is current """
+    etag = self.get_etag(request)
+    if self.is_not_modified(request, etag):
+      response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+      response = handler(request, *args, **kwargs)
+    
+    return self.set_etag(response, etag)
+  
+  def list(self, request, *args, **kwargs):
+    return self.conditional_response(super().list, request, *args, **kwargs)
+
+
+class ValuesListMixin:
+  """ Render list responses straight from values() rows
+
+  Building model instances and running every ModelSerializer field dominates
+  large list pages. The rows select the list serializer's own fields, related
+  ids come from one query per through table grouped in a single pass, and only
+  fields whose representation differs from the stored value (like Decimal
+  prices) go through their serializer field, so the output is unchanged.
+  """
+  # many to many fields of the list: name -> (through model, column of the related id)
+  list_relations = {}
+  # columns of the serializer that render the stored value as it is
+  plain_fields = (drf_serializers.IntegerField, drf_serializers.CharField)
+  
+  def list(self, request, *args, **kwargs):
+    queryset = self.filter_queryset(self.get_queryset())
+    rows = self.get_list_rows(queryset)
+    
+    page = self.paginate_queryset(rows)
+    if page is not None:
+      data = self.rows_to_representation(page, self.get_relation_ids(page))
+      return self.get_paginated_response(data)
+    
+    rows = list(rows)
+    return Response(self.rows_to_representation(rows, self.get_relation_ids(rows)))
+  
+  def get_list_fields(self):
+    """ return the fields of the list serializer in output order """
+    return [(name, field) for name, field in self.get_serializer().fields.items() if not field.write_only]
+  
+  def get_list_rows(self, queryset):
+    """ return the values() queryset with the columns the list renders """
+    columns = [name for name, _ in self.get_list_fields() if name not in self.list_relations]
+    # annotations such as the search rank stay selected for the pagination ordering
+    return queryset.prefetch_related(None).values(*columns, *queryset.query.annotation_select)
+  
+  def get_relation_ids(self, rows):
+    """ return {relation name: {owner id: [related ids]}} for the rows """
+    ids = [row['id'] for row in rows]
+    return {
+      name: self.group_links(self.get_link_rows(name, ids))
+      for name in self.list_relations
+    }
+  
+  async def aget_relation_ids(self, rows):
+    """ async variant of get_relation_ids """
+    ids = [row['id'] for row in rows]
+    return {
+      name: self.group_links([link async for link in self.get_link_rows(name, ids)])
+      for name in self.list_relations
+    }
+  
+  def get_link_rows(self, name, ids):
+    """ return (owner id, related id) pairs ordered by the related id """
+    through, column = self.list_relations[name]
+    owner_column = through._meta.get_field(self.queryset.model._meta.model_name).column
+    return (
+      through.objects.filter(**{f'{owner_column}__in': ids})
+      .order_by(column).values_list(owner_column, column)
+    )
+  
+  @staticmethod
+  def group_links(links):
+    grouped = {}
+    for owner_id, related_id in links:
+      grouped.setdefault(owner_id, []).append(related_id)
+    return grouped
+  
+  def rows_to_representation(self, rows, relation_ids):
+    """ return the list representation of values() rows """
+    converters = []
+    for name, field in self.get_list_fields():
+      if name in self.list_relations:
+        ids = relation_ids[name]
+        converters.append((name, lambda row, ids=ids: ids.get(row['id'], [])))
+      elif isinstance(field, self.plain_fields):
+        converters.append((name, lambda row, name=name: row[name]))
+      else:
+        converters.append((name, lambda row, name=name, field=field: (
+          None if row[name] is None else field.to_representation(row[name])
+        )))
+    
+    with instrumentation.timed('serialize'):
+      return [{name: convert(row) for name, convert in converters} for row in rows]
+
+
+class BaseRecipeAttrViewSet(ShardMixin, ReplicaReadMixin, ConditionalGetMixin, ValuesListMixin, BatchCreateMixin, viewsets.GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin):
+  """ Base viewset for the user owned attributes of recipes """
+  authentication_classes = (CachedTokenAuthentication,)
   permission_classes = (IsAuthenticated,)
-  queryset = Tag.objects.all()
-  serializer_class = serializers.TagSerializer
+  pagination_class = NameCursorPagination
+  # the recipe through table and its column pointing at this model
+  link_model = None
+  link_field = None
   
   def get_queryset(self):
     """ return object for the current authenticated user only """
-    return self.queryset.filter(user=self.request.user).order_by('-name')
+    queryset = self.queryset.for_user(self.request.user)
+    
+    if param_to_bool(self.request, 'assigned_only'):
+      links = self.link_model.objects.filter(**{self.link_field: OuterRef('pk')})
+      queryset = queryset.filter(Exists(links))
+    
+    return queryset.order_by('-name')
   
   def perform_create(self, serializer):
-    """ Create a new tag"""
+    """ Create a new object for the user """
     return serializer.save(user = self.request.user)
 
-class IngredientViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin):
+
+class TagViewSet(BaseRecipeAttrViewSet):
+  """ Manage tags in the database """
+  queryset = Tag.objects.all()
+  serializer_class = serializers.TagSerializer
+  link_model = Recipe.tags.through
+  link_field = 'tag_id'
+
+
+class IngredientViewSet(BaseRecipeAttrViewSet):
   """ Manage Ingredient in the database """
-  authentication_classes = (TokenAuthentication,)
-  permission_classes = (IsAuthenticated,)
   queryset = Ingredient.objects.all()
   serializer_class = serializers.IngredientSerializer
-  
-  def get_queryset(self):
-    """ return object for the current authenticated user only """
-    return self.queryset.filter(user=self.request.user).order_by('-name')
-  
-  def perform_create(self, serializer):
-    """ Create a new tag"""
-    return serializer.save(user = self.request.user)
+  link_model = Recipe.ingredients.through
+  link_field = 'ingredient_id'
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(ShardMixin, ReplicaReadMixin, ConditionalGetMixin, ValuesListMixin, BatchCreateMixin, viewsets.ModelViewSet):
   """ Manage Recipe in the database """
   queryset = Recipe.objects.all()
   serializer_class = serializers.RecipeSerializer
-  authentication_classes = (TokenAuthentication,)
+  pagination_class = RecipeCursorPagination
+  authentication_classes = (CachedTokenAuthentication,)
   permission_classes = (IsAuthenticated,)
+  list_relations = {
+    'ingredients': (Recipe.ingredients.through, 'ingredient_id'),
+    'tags': (Recipe.tags.through, 'tag_id'),
+  }
   
   def get_queryset(self):
     """ return object for the current authenticated user only """
-    return self.queryset.filter(user=self.request.user)
+    query = self.request.query_params.get('q')
+    if query is not None and self.action == 'list':
+      # the search scopes to the user itself so the full-text index drives the query
+      queryset = self.queryset
+      if sharding.is_enabled():
+        queryset = queryset.using(sharding.db_for_user(self.request.user.pk))
+      queryset = search.search_recipes(queryset, query, user_id=self.request.user.pk)
+    else:
+      queryset = self.queryset.for_user(self.request.user)
+    
+    tag_ids = param_to_ints(self.request, 'tags')
+    if tag_ids:
+      tag_links = Recipe.tags.through.objects.filter(recipe_id=OuterRef('pk'), tag_id__in=tag_ids)
+      queryset = queryset.filter(Exists(tag_links))
+    
+    ingredient_ids = param_to_ints(self.request, 'ingredients')
+    if ingredient_ids:
+      ingredient_links = Recipe.ingredients.through.objects.filter(
+        recipe_id=OuterRef('pk'), ingredient_id__in=ingredient_ids
+      )
+      queryset = queryset.filter(Exists(ingredient_links))
+    
+    # the list reads the related ids from the through tables itself
+    if self.action == 'list':
+      return queryset
+    
+    return queryset.with_relations()
+  
+  def retrieve(self, request, *args, **kwargs):
+    return self.conditional_response(super().retrieve, request, *args, **kwargs)
+  
+  @action(detail=False, methods=['get'])
+  def export(self, request):
+    """ Stream all the user's recipes as NDJSON, gzip compressed with ?gzip=1 """
+    queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+    content = export.iter_ndjson(queryset)
+    filename = 'recipes.ndjson'
+    content_type = 'application/x-ndjson'
+    if param_to_bool(request, 'gzip'):
+      content = export.gzip_stream(content)
+      filename += '.gz'
+      content_type = 'application/gzip'
+    
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+  
+  @action(detail=False, methods=['get'])
+  def stats(self, request):
+    """ Summarize the user's recipes: count, prices, cooking times and most used tags and ingredients """
+    version = get_data_version(request.user.pk)
+    etag = self.make_etag(request, version)
+    if self.is_not_modified(request, etag):
+      return self.set_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+    
+    return self.set_etag(Response(stats.get_stats(request.user.pk, version)), etag)
+  
+  @action(detail=False, methods=['post'], url_path='import', url_name='import')
+  def import_recipes(self, request):
+    """ Import NDJSON or CSV recipes, from the raw body or an uploaded file """
+    if request.content_type.startswith('multipart/'):
+      upload = request.FILES.get('file')
+      if upload is None:
+        raise ValidationError({'file': _('No file was submitted.')})
+      stream = upload
+      file_format = importer.detect_format(upload.content_type) or importer.detect_format(upload.name)
+    else:
+      stream = request.stream or []
+      file_format = importer.detect_format(request.content_type)
+    
+    if file_format is None:
+      raise UnsupportedMediaType(request.content_type)
+    
+    summary = importer.import_recipes(request.user, stream, file_format)
+    if summary['failed'] and not summary['imported']:
+      return Response(summary, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(summary, status=status.HTTP_201_CREATED)
+  
+  @action(detail=True, methods=['post'], url_path='upload-image', url_name='upload-image',
+          parser_classes=(MultiPartParser,))
+  def upload_image(self, request, pk=None):
+    """ Store the image file of a recipe, its thumbnails are rendered after the response """
+    recipe = self.get_object()
+    handler = images.ContentAddressedUploadHandler(request)
+    # read by the parser, so the upload goes to disk in chunks whatever its size
+    request.upload_handlers = [handler]
+    
+    upload = request.FILES.get('image')
+    for _name, files in request.FILES.lists():
+      for other in files:
+        if other is not upload:
+          other.discard()
+    if handler.too_large:
+      raise ImageTooLarge(_('Upload an image of at most %(size)s bytes.') % {'size': handler.max_size})
+    if upload is None:
+      raise ValidationError({'image': _('No file was submitted.')})
+    if upload.extension is None:
+      upload.discard()
+      raise ValidationError({'image': _('Upload a JPEG, PNG, GIF or WebP image.')})
+    
+    name = images.store(upload)
+    recipe.image = name
+    recipe.save(update_fields=['image'])
+    transaction.on_commit(lambda: images.schedule_thumbnails(name), using=recipe._state.db)
+    return Response(self.get_serializer(recipe).data)
   
   def get_serializer_class(self):
     """ return appropiate serializer class for different action """
@@ -57,4 +408,4 @@ class RecipeViewSet(viewsets.ModelViewSet):
   
   def perform_create(self, serializer):
     """ Create a new recipe """
-    return serializer.save(user = self.request.user)
\ No newline at end of file
+    return serializer.save(user = self.request.user)
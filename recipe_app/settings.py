@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
+from core.db import sqlite_database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -47,7 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -80,10 +86,62 @@ WSGI_APPLICATION = 'recipe_app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# SQLITE_PRODUCTION=1 selects the production profile of core.db.sqlite_database:
+# WAL journal, tuned pragmas, persistent connections and BEGIN IMMEDIATE.
+
 DATABASES = {
+    'default': sqlite_database(
+        os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        production=os.environ.get('SQLITE_PRODUCTION', '') == '1',
+    ),
+}
+
+# Read replicas of 'default', as SQLite files kept in sync by an external
+# replication tool and listed comma separated in SQLITE_REPLICA_PATHS. Safe API
+# requests read from one of them through core.routers.ReplicaRouter, unless the
+# user wrote within REPLICA_STICKINESS_SECONDS; keep that above the replication lag.
+
+DATABASE_REPLICAS = []
+for number, path in enumerate(filter(None, os.environ.get('SQLITE_REPLICA_PATHS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = sqlite_database(
+        path, production=os.environ.get('SQLITE_PRODUCTION', '') == '1',
+    )
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+REPLICA_STICKINESS_SECONDS = 5
+
+# Horizontal sharding of tags, ingredients and recipes by user id (core.sharding).
+# Every SQLite file listed comma separated in SQLITE_SHARD_PATHS becomes a shard
+# next to 'default'; new users are spread over NEW_USERS (all shards when empty)
+# and existing ones are rebalanced with the move_user_shard command. With only
+# 'default' listed sharding is off. Replica reads do not apply to sharded data.
+
+SHARDING = {
+    'SHARDS': ['default'],
+    'NEW_USERS': [],
+    # how long a user's shard map entry is cached for reads, writes always check 'default'
+    'CACHE_SECONDS': 60,
+    # wait this long after blocking a moving user's writes for those in flight, and
+    # again before deleting the source copy; never less than CACHE_SECONDS
+    'MOVE_GRACE_SECONDS': 5,
+}
+for number, path in enumerate(filter(None, os.environ.get('SQLITE_SHARD_PATHS', '').split(',')), 1):
+    DATABASES[f'shard{number}'] = sqlite_database(
+        path, production=os.environ.get('SQLITE_PRODUCTION', '') == '1',
+    )
+    SHARDING['SHARDS'].append(f'shard{number}')
+
+DATABASE_ROUTERS = ['core.sharding.ShardRouter', 'core.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Per-user data versions (core.data_version) live here; deployments running
+# several workers need a shared backend such as Redis or Memcached.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -124,10 +182,77 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded recipe images and their thumbnails, see core.images
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', BASE_DIR / 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-AUTH_USER_MODEL = 'core.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'core.User'
+
+
+# In-process token -> user cache used by user.authentication.CachedTokenAuthentication.
+# Deleting or rotating a token, or deactivating its user, evicts it at once only
+# in the process that did it: every other worker keeps accepting it for up to
+# TTL seconds, which is the worst case revocation delay.
+
+TOKEN_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 30,
+}
+
+# Serve recipe list, retrieve and create from async views with the async ORM.
+# Only worth enabling when the project runs under an ASGI server (recipe_app.asgi).
+RECIPE_ASYNC_VIEWS = os.environ.get('RECIPE_ASYNC_VIEWS', '') == '1'
+
+# orjson backed JSON for every API view, plus MessagePack when it is installed;
+# clients pick with the Accept and Content-Type headers.
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        *(['core.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.renderers.ORJSONParser',
+        *(['core.renderers.MessagePackParser'] if find_spec('msgpack') else []),
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# Response compression: encodings in order of preference when the client
+# accepts several equally (br and zstd need the brotli and zstandard packages),
+# bodies smaller than MIN_SIZE bytes are sent uncompressed. Only the API's
+# JSON, MessagePack and NDJSON bodies are compressed (core.middleware.COMPRESSIBLE_TYPES),
+# never HTML, which carries CSRF tokens and would be open to BREACH.
+COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'ENCODINGS': ['zstd', 'br', 'gzip'],
+    'LEVELS': {'gzip': 6, 'br': 4, 'zstd': 3},
+}
+
+# Per-request Server-Timing headers and slow request logging, see
+# core.middleware.InstrumentationMiddleware. Slow requests are logged as
+# warnings on the core.instrumentation logger with their LOGGED_QUERIES
+# slowest statements.
+INSTRUMENTATION = {
+    'ENABLED': os.environ.get('REQUEST_INSTRUMENTATION', '') == '1',
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_QUERY_COUNT': 50,
+    'LOGGED_QUERIES': 3,
+}
+
+# Recipe image uploads, see core.images. Thumbnails are rendered to fit in
+# THUMBNAIL_SIZES squares by WORKERS processes, with at most MAX_PENDING
+# images waiting for them, and need Pillow.
+RECIPE_IMAGES = {
+    'MAX_UPLOAD_SIZE': 10 * 1024 * 1024,
+    'THUMBNAIL_SIZES': {'small': 160, 'medium': 480, 'large': 1024},
+    'WORKERS': 2,
+    'MAX_PENDING': 100,
+}
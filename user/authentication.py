@@ -0,0 +1,179 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+
+class TokenCache:
+  """ Thread safe LRU cache of token key to token (with its user) that expires entries after a ttl
+
+  The cache lives in one process and the signals in user.signals only evict
+  there, so a token revoked by another worker is served from here until its
+  ttl runs out: the ttl is the worst case revocation delay.
+  """
+  
+  def __init__(self, max_size=10000, ttl=30, clock=time.monotonic):
+    self.max_size = max_size
+    self.ttl = ttl
+    self.clock = clock
+    self._entries = OrderedDict()
+    self._keys_by_user = {}
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+  
+  def get(self, key):
+    """ Return the cached token for a key or None, counting the hit or miss """
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[1] <= self.clock():
+        self._discard(key)
+        entry = None
+      
+      if entry is None:
+        self.misses += 1
+        return None
+      
+      self._entries.move_to_end(key)
+      self.hits += 1
+      token = entry[0]
+    
+    return _detach(token)
+  
+  def set(self, key, token):
+    """ Cache a token (with its user loaded) under its key """
+    token = _detach(token)
+    with self._lock:
+      self._discard(key)
+      self._entries[key] = (token, self.clock() + self.ttl)
+      self._keys_by_user.setdefault(token.user_id, set()).add(key)
+      
+      while len(self._entries) > self.max_size:
+        oldest = next(iter(self._entries))
+        self._discard(oldest)
+        self.evictions += 1
+  
+  def evict(self, key):
+    """ Drop a single token key """
+    with self._lock:
+      self._discard(key)
+  
+  def evict_user(self, user_id):
+    """ Drop every token cached for a user """
+    with self._lock:
+      for key in list(self._keys_by_user.get(user_id, ())):
+        self._discard(key)
+  
+  def clear(self):
+    """ Drop every entry and reset the counters """
+    with self._lock:
+      self._entries.clear()
+      self._keys_by_user.clear()
+      self.hits = self.misses = self.evictions = 0
+  
+  def stats(self):
+    """ Return the counters used for monitoring the cache """
+    with self._lock:
+      lookups = self.hits + self.misses
+      return {
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+        'hit_rate': self.hits / lookups if lookups else 0.0,
+        'size': len(self._entries),
+        'max_size': self.max_size,
+        'ttl': self.ttl,
+      }
+  
+  def _discard(self, key):
+    entry = self._entries.pop(key, None)
+    if entry is None:
+      return
+    
+    user_id = entry[0].user_id
+    keys = self._keys_by_user.get(user_id)
+    if keys is not None:
+      keys.discard(key)
+      if not keys:
+        del self._keys_by_user[user_id]
+
+
+def _detach(token):
+  """ Copy a token and its user so requests never share mutable instances """
+  user = copy.copy(token.user)
+  token = copy.copy(token)
+  token.user = user
+  return token
+
+
+TOKEN_CACHE_SETTINGS = getattr(settings, 'TOKEN_CACHE', {})
+
+token_cache = TokenCache(
+  max_size=TOKEN_CACHE_SETTINGS.get('MAX_SIZE', 10000),
+  ttl=TOKEN_CACHE_SETTINGS.get('TTL', 30),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+  """ Token authentication that serves warm tokens from the in-process token cache
+
+  A token deleted in another process stays valid here for up to
+  TOKEN_CACHE['TTL'] seconds.
+  """
+  cache = token_cache
+  
+  def authenticate_credentials(self, key):
+    """ Look the token up in the cache before falling back to the database """
+    token = self.cache.get(key)
+    if token is not None:
+      return (token.user, token)
+    
+    user, token = super().authenticate_credentials(key)
+    self.cache.set(key, token)
+    
+    return (user, token)
+  
+  async def aauthenticate(self, request):
+    """ async variant of authenticate used by the async views """
+    auth = get_authorization_header(request).split()
+    
+    if not auth or auth[0].lower() != self.keyword.lower().encode():
+      return None
+    
+    if len(auth) == 1:
+      raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+    elif len(auth) > 2:
+      raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+    
+    try:
+      key = auth[1].decode()
+    except UnicodeError:
+      raise exceptions.AuthenticationFailed(
+        _('Invalid token header. Token string should not contain invalid characters.')
+      )
+    
+    return await self.aauthenticate_credentials(key)
+  
+  async def aauthenticate_credentials(self, key):
+    """ look the token up in the cache, then with the async ORM """
+    token = self.cache.get(key)
+    if token is not None:
+      return (token.user, token)
+    
+    model = self.get_model()
+    try:
+      token = await model.objects.select_related('user').aget(key=key)
+    except model.DoesNotExist:
+      raise exceptions.AuthenticationFailed(_('Invalid token.'))
+    
+    if not token.user.is_active:
+      raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+    
+    self.cache.set(key, token)
+    return (token.user, token)
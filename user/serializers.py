@@ -2,9 +2,11 @@ from django.contrib.auth import get_user_model , authenticate
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
+from core.instrumentation import TimedSerializerMixin
 
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
   """Serializer for user object"""
   class Meta:
     model = get_user_model()
@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from user.authentication import token_cache
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def evict_token(sender, instance, **kwargs):
+  """ Drop a token from the cache when it is changed or deleted """
+  token_cache.evict(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def evict_user_tokens(sender, instance, **kwargs):
+  """ Drop a user's tokens when the user changes, is deactivated or deleted """
+  token_cache.evict_user(instance.pk)
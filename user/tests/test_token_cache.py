@@ -0,0 +1,173 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework import exceptions, status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import CachedTokenAuthentication, TokenCache, token_cache
+
+
+ME_URL = reverse('user:me')
+TOKEN_CACHE_URL = reverse('user:token-cache')
+
+
+class FakeClock:
+  """ Clock that only moves when told to """
+  
+  def __init__(self):
+    self.now = 0.0
+  
+  def __call__(self):
+    return self.now
+
+
+class CachedTokenAuthenticationTests(TestCase):
+  """ Test the cached token authentication """
+  
+  def setUp(self):
+    token_cache.clear()
+    self.user = get_user_model().objects.create_user(
+      email='test@example.com',
+      password='test1234',
+      name='test user'
+    )
+    self.token = Token.objects.create(user=self.user)
+    self.client = APIClient()
+    self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+  
+  
+  def test_warm_cache_costs_no_queries(self):
+    """ Test authenticating with a cached token does not query the database """
+    self.client.get(ME_URL)
+    
+    with self.assertNumQueries(0):
+      res = self.client.get(ME_URL)
+    
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(res.data['email'], self.user.email)
+    self.assertEqual(token_cache.stats()['hits'], 1)
+    self.assertEqual(token_cache.stats()['misses'], 1)
+  
+  
+  async def test_async_authentication_shares_the_cache(self):
+    """ Test the async authentication fills and reads the same cache """
+    auth = CachedTokenAuthentication()
+    
+    user, token = await auth.aauthenticate_credentials(self.token.key)
+    await auth.aauthenticate_credentials(self.token.key)
+    
+    self.assertEqual(user.email, self.user.email)
+    self.assertEqual(token.key, self.token.key)
+    self.assertEqual(token_cache.stats()['hits'], 1)
+    with self.assertRaises(exceptions.AuthenticationFailed):
+      await auth.aauthenticate_credentials('wrong')
+  
+  
+  def test_deleted_token_is_rejected(self):
+    """ Test deleting a token evicts it from the cache """
+    self.client.get(ME_URL)
+    self.token.delete()
+    
+    res = self.client.get(ME_URL)
+    
+    self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+  
+  
+  def test_deactivated_user_is_rejected(self):
+    """ Test deactivating a user evicts their tokens """
+    self.client.get(ME_URL)
+    self.user.is_active = False
+    self.user.save()
+    
+    res = self.client.get(ME_URL)
+    
+    self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+  
+  
+  def test_user_change_is_visible(self):
+    """ Test an updated user is not served stale from the cache """
+    self.client.get(ME_URL)
+    self.client.patch(ME_URL, {'name': 'new name'})
+    
+    res = self.client.get(ME_URL)
+    
+    self.assertEqual(res.data['name'], 'new name')
+  
+  
+  def test_stats_require_admin(self):
+    """ Test the cache counters are only exposed to staff """
+    res = self.client.get(TOKEN_CACHE_URL)
+    self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+    
+    self.user.is_staff = True
+    self.user.save()
+    res = self.client.get(TOKEN_CACHE_URL)
+    
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertIn('hits', res.data)
+    self.assertIn('misses', res.data)
+
+
+class TokenCacheTests(TestCase):
+  """ Test the LRU and ttl behaviour of the token cache """
+  
+  def setUp(self):
+    self.clock = FakeClock()
+    self.cache = TokenCache(max_size=2, ttl=10, clock=self.clock)
+    self.tokens = []
+    for i in range(3):
+      user = get_user_model().objects.create_user(email=f'user{i}@example.com', password='test1234')
+      self.tokens.append(Token.objects.create(user=user))
+  
+  
+  def test_entries_expire_after_ttl(self):
+    """ Test an entry is a miss once its ttl has passed """
+    token = self.tokens[0]
+    self.cache.set(token.key, token)
+    self.assertIsNotNone(self.cache.get(token.key))
+    
+    self.clock.now = 11
+    
+    self.assertIsNone(self.cache.get(token.key))
+    self.assertEqual(self.cache.stats()['size'], 0)
+  
+  
+  def test_least_recently_used_is_evicted(self):
+    """ Test the least recently used entry is dropped when the cache is full """
+    first, second, third = self.tokens
+    self.cache.set(first.key, first)
+    self.cache.set(second.key, second)
+    self.cache.get(first.key)
+    self.cache.set(third.key, third)
+    
+    self.assertIsNotNone(self.cache.get(first.key))
+    self.assertIsNone(self.cache.get(second.key))
+    self.assertEqual(self.cache.stats()['evictions'], 1)
+  
+  
+  def test_token_revoked_elsewhere_rejected_after_ttl(self):
+    """ Test a token deleted by another process stops working here once its ttl has passed """
+    # a worker whose cache the deleting process's signals never reach
+    auth = CachedTokenAuthentication()
+    auth.cache = self.cache
+    token = self.tokens[0]
+    auth.authenticate_credentials(token.key)
+    Token.objects.filter(pk=token.pk).delete()
+    
+    self.clock.now = 9
+    self.assertEqual(auth.authenticate_credentials(token.key)[1].key, token.key)
+    self.clock.now = 10
+    with self.assertRaises(exceptions.AuthenticationFailed):
+      auth.authenticate_credentials(token.key)
+  
+  
+  def test_cached_users_are_copies(self):
+    """ Test mutating a returned user does not change the cached one """
+    token = self.tokens[0]
+    self.cache.set(token.key, token)
+    
+    self.cache.get(token.key).user.name = 'changed'
+    
+    self.assertNotEqual(self.cache.get(token.key).user.name, 'changed')
@@ -6,5 +6,6 @@ app_name = 'user'
 urlpatterns = [
   path('create/', views.UserCreateView.as_view(), name='create'),
   path('token/', views.AuthTokenView.as_view(), name='token'),
+  path('token/cache/', views.TokenCacheStatsView.as_view(), name='token-cache'),
   path('me/', views.ManageUserView.as_view(), name='me')
 ]
\ No newline at end of file
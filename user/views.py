@@ -1,6 +1,9 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from user.authentication import CachedTokenAuthentication, token_cache
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -15,15 +18,27 @@ class UserCreateView(generics.CreateAPIView):
 class AuthTokenView(ObtainAuthToken):
   """ Create a new auth token for user """
   serializer_class = AuthTokenSerializer
+  # ObtainAuthToken pins its own parsers and renderers, take the project's
+  parser_classes = api_settings.DEFAULT_PARSER_CLASSES
   renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
   """ Manage user in the system """
   serializer_class = UserSerializer
-  authentication_classes = (authentication.TokenAuthentication,)
+  authentication_classes = (CachedTokenAuthentication,)
   permission_classes = (permissions.IsAuthenticated,)
   
   
   def get_object(self):
     """ retrive and return authenticated user """
-    return self.request.user
\ No newline at end of file
+    return self.request.user
+
+
+class TokenCacheStatsView(APIView):
+  """ Expose the token cache counters of this worker for monitoring """
+  authentication_classes = (CachedTokenAuthentication,)
+  permission_classes = (permissions.IsAdminUser,)
+  
+  def get(self, request):
+    """ return the hit, miss and size counters """
+    return Response(token_cache.stats())